@@ -0,0 +1,34 @@
+"""
+Benchmarks of mmsplice hot paths with pytest-benchmark.
+
+Inputs are generated with `mmsplice.bench` at several sizes so
+benchmarks run offline. Run and store results to compare commits with:
+
+    make benchmark
+    make benchmark-compare
+"""
+import pytest
+from mmsplice.bench import generate
+
+SIZES = {
+    # number of genes, number of variants
+    'small': (20, 200),
+    'medium': (200, 2000),
+    'large': (2000, 20000)
+}
+
+
+@pytest.fixture(scope='session', params=list(SIZES))
+def synthetic(request, tmp_path_factory):
+    '''
+    Paths of synthetic `fasta`, `gtf`, `vcf` and `junction` (csv of introns)
+      files of a size in `SIZES`.
+    '''
+    num_genes, num_variants = SIZES[request.param]
+    path = tmp_path_factory.mktemp('synthetic_%s' % request.param)
+    try:
+        files = generate(path, num_genes, num_variants)
+    except ImportError:
+        files = generate(path, num_genes, num_variants, index=False)
+    files['size'] = request.param
+    return files
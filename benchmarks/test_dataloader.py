@@ -0,0 +1,38 @@
+from itertools import islice
+from mmsplice.vcf_dataloader import SplicingVCFDataloader
+from mmsplice.junction_dataloader import JunctionPSI5VCFDataloader
+
+
+def test_SplicingVCFDataloader_init(benchmark, synthetic):
+    benchmark(SplicingVCFDataloader, synthetic['gtf'], synthetic['fasta'],
+              synthetic['vcf'], annotation_cache=False)
+
+
+def test_SplicingVCFDataloader_iter(benchmark, synthetic):
+    benchmark(lambda: list(SplicingVCFDataloader(
+        synthetic['gtf'], synthetic['fasta'], synthetic['vcf'])))
+
+
+def test_SplicingVCFDataloader_batch_iter(benchmark, synthetic):
+    benchmark(lambda: list(SplicingVCFDataloader(
+        synthetic['gtf'], synthetic['fasta'], synthetic['vcf'])
+        .batch_iter(batch_size=512, reuse_buffers=True)))
+
+
+def test_ExonSplicingMixin__next(benchmark, synthetic):
+    dl = SplicingVCFDataloader(
+        synthetic['gtf'], synthetic['fasta'], synthetic['vcf'])
+    pairs = list(islice(dl.matcher, 512))
+    overhangs = [(e.attrs['left_overhang'], e.attrs['right_overhang'])
+                 for e, _ in pairs]
+    for (exon, _), overhang in zip(pairs, overhangs):
+        exon._start += overhang[0]
+        exon._end -= overhang[1]
+
+    benchmark(lambda: [dl._next(exon, variant, overhang)
+                       for (exon, variant), overhang in zip(pairs, overhangs)])
+
+
+def test_JunctionPSI5VCFDataloader_iter(benchmark, synthetic):
+    benchmark(lambda: list(JunctionPSI5VCFDataloader(
+        synthetic['junction'], synthetic['fasta'], synthetic['vcf'])))
@@ -0,0 +1,35 @@
+import random
+import numpy as np
+import pytest
+from mmsplice.utils import encodeDNA, encode_index_batch
+from mmsplice.exon_dataloader import SeqSpliter
+
+overhang = (100, 100)
+
+
+@pytest.fixture(scope='module')
+def seqs():
+    rng = random.Random(0)
+    return [''.join(rng.choice('ACGT') for _ in range(
+        overhang[0] + rng.randint(50, 300) + overhang[1]))
+        for _ in range(512)]
+
+
+def test_encodeDNA(benchmark, seqs):
+    benchmark(encodeDNA, seqs)
+
+
+def test_encode_index_batch(benchmark, seqs):
+    benchmark(encode_index_batch, seqs)
+
+
+def test_SeqSpliter_split(benchmark, seqs):
+    spliter = SeqSpliter()
+    benchmark(lambda: [spliter.split(seq, overhang) for seq in seqs])
+
+
+def test_SeqSpliter_split_batch(benchmark, seqs):
+    spliter = SeqSpliter()
+    index, lengths = encode_index_batch(seqs)
+    overhangs = np.tile(overhang, (len(seqs), 1))
+    benchmark(spliter.split_batch, index, lengths, overhangs)
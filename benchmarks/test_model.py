@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+from mmsplice import MMSplice, MTSplice
+from mmsplice.utils import predict_deltaLogitPsi, LINEAR_HEADS
+from mmsplice.vcf_dataloader import SplicingVCFDataloader
+
+batch_size = 512
+
+
+@pytest.fixture(scope='module')
+def batch(synthetic):
+    dl = SplicingVCFDataloader(synthetic['gtf'], synthetic['fasta'],
+                               synthetic['vcf'], tissue_specific=True)
+    return next(dl.batch_iter(batch_size=batch_size))
+
+
+@pytest.fixture(scope='module')
+def model():
+    return MMSplice()
+
+
+def test_predict_modular_scores_on_batch(benchmark, model, batch):
+    benchmark(model.predict_modular_scores_on_batch, batch['inputs']['seq'])
+
+
+def test_MTSplice_predict_on_batch(benchmark, batch):
+    mtsplice = MTSplice()
+    benchmark(mtsplice.predict_on_batch, batch['inputs']['tissue_seq'])
+
+
+def test_predict_modular_scores_on_batch_quantized(benchmark, batch):
+    model = MMSplice(quantized=True)
+    benchmark(model.predict_modular_scores_on_batch, batch['inputs']['seq'],
+              batch_size=batch_size)
+
+
+def test_MTSplice_predict_on_batch_quantized(benchmark, batch):
+    mtsplice = MTSplice(quantized=True)
+    benchmark(mtsplice.predict_on_batch, batch['inputs']['tissue_seq'],
+              batch_size=batch_size)
+
+
+def test_predict_modular_scores_on_batch_compiled(benchmark, batch):
+    model = MMSplice(compiled=True)
+    benchmark(model.predict_modular_scores_on_batch, batch['inputs']['seq'])
+
+
+def test_MTSplice_predict_on_batch_compiled(benchmark, batch):
+    mtsplice = MTSplice(compiled=True)
+    benchmark(mtsplice.predict_on_batch, batch['inputs']['tissue_seq'])
+
+
+def test_MTSplice_predict_on_batch_optimized(benchmark, batch):
+    mtsplice = MTSplice(optimize=True)
+    benchmark(mtsplice.predict_on_batch, batch['inputs']['tissue_seq'])
+
+
+@pytest.fixture(scope='module')
+def artifacts(tmp_path_factory):
+    from mmsplice.export import export_artifacts
+    output = tmp_path_factory.mktemp('artifacts')
+    export_artifacts(output)
+    return output
+
+
+def test_predict_on_seq(benchmark, model):
+    benchmark(model.predict_on_seq, 'A' * 300, (100, 100))
+
+
+def test_predict_on_seq_artifacts(benchmark, artifacts):
+    model = MMSplice(artifacts=artifacts)
+    benchmark(model.predict_on_seq, 'A' * 300, (100, 100))
+
+
+def test_saturation_mutagenesis(benchmark, model):
+    rng = np.random.RandomState(0)
+    seq = ''.join(rng.choice(list('ACGT'), size=400))
+    benchmark(model.saturation_mutagenesis, seq, (100, 100))
+
+
+def test_saturation_mutagenesis_predict_on_seq(benchmark, model):
+    rng = np.random.RandomState(0)
+    seq = ''.join(rng.choice(list('ACGT'), size=400))
+
+    def predict():
+        for i in range(len(seq)):
+            for base in 'ACGT':
+                if base != seq[i]:
+                    model.predict_on_seq(seq[:i] + base + seq[i + 1:],
+                                         (100, 100))
+
+    benchmark.pedantic(predict, rounds=1)
+
+
+def test_predict_deltaLogitPsi(benchmark):
+    rng = np.random.RandomState(0)
+    X_ref = rng.normal(size=(batch_size, 5))
+    X_alt = X_ref + rng.normal(scale=0.1, size=(batch_size, 5))
+    benchmark(predict_deltaLogitPsi, X_ref, X_alt)
+
+
+@pytest.fixture(scope='module')
+def modular_scores_1m():
+    rng = np.random.RandomState(0)
+    X_ref = rng.normal(size=(1000000, 5)).astype('float32')
+    X_alt = X_ref + rng.normal(scale=0.1, size=X_ref.shape).astype('float32')
+    return X_ref, X_alt
+
+
+def test_LinearHeads_predict_1m(benchmark, modular_scores_1m):
+    benchmark(LINEAR_HEADS.predict, *modular_scores_1m)
+
+
+def test_sklearn_heads_1m(benchmark, modular_scores_1m):
+    pytest.importorskip('sklearn')
+    from mmsplice.utils import LINEAR_MODEL, LOGISTIC_MODEL, \
+        EFFICIENCY_MODEL, transform
+    X_ref, X_alt = modular_scores_1m
+
+    def predict():
+        X = transform(X_alt - X_ref)
+        LINEAR_MODEL.predict(X)
+        EFFICIENCY_MODEL.predict(X[:, [1, 2, 3, 5]])
+        X = np.concatenate([X_ref, X_alt, transform(
+            X_alt - X_ref, region_only=True)[:, -3:]], axis=-1)
+        LOGISTIC_MODEL.predict_proba(X)
+
+    benchmark(predict)
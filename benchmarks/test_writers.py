@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+from mmsplice.utils import df_batch_writer, df_batch_writer_parquet, \
+    writeVCF, mmsplice_ref_modules, mmsplice_alt_modules
+
+batch_size = 512
+
+
+@pytest.fixture(scope='module')
+def predictions(synthetic):
+    '''
+    Random predictions for each variant of synthetic vcf.
+    '''
+    ids = pd.read_csv(synthetic['vcf'], sep='\t', comment='#',
+                      header=None, usecols=[2])[2]
+    rng = np.random.RandomState(0)
+    columns = [*mmsplice_ref_modules, *mmsplice_alt_modules,
+               'delta_logit_psi', 'pathogenicity']
+    df = pd.DataFrame(rng.normal(size=(len(ids), len(columns))),
+                      columns=columns)
+    df.insert(0, 'ID', ids.values)
+    df.insert(1, 'exons', '1:1000-1100:+')
+    return df
+
+
+def _batches(df):
+    return (df.iloc[i: i + batch_size] for i in range(0, len(df), batch_size))
+
+
+def test_df_batch_writer(benchmark, predictions, tmp_path):
+    benchmark(lambda: df_batch_writer(_batches(predictions),
+                                      tmp_path / 'pred.csv'))
+
+
+def test_df_batch_writer_parquet(benchmark, predictions, tmp_path):
+    benchmark(lambda: df_batch_writer_parquet(
+        _batches(predictions), tmp_path / 'pred.parquet', batch_size * 4))
+
+
+def test_writeVCF(benchmark, synthetic, predictions, tmp_path):
+    benchmark(writeVCF, synthetic['vcf'], str(tmp_path / 'pred.vcf'),
+              predictions)
@@ -8,6 +8,7 @@ from tensorflow.keras.models import load_model
 from mmsplice.mmsplice import MMSplice, \
     writeVCF, \
     predict_save, \
+    predict_vcf, \
     predict_all_table, \
     ACCEPTOR_INTRON, \
     ACCEPTOR, \
@@ -26,6 +27,7 @@ __all__ = [
     'MMSplice',
     'writeVCF',
     'predict_save',
+    'predict_vcf',
     'predict_all_table',
     'ACCEPTOR_INTRON',
     'ACCEPTOR',
@@ -0,0 +1,83 @@
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger('mmsplice')
+
+
+def tf_threads():
+    '''
+    Intra and inter op thread pool sizes of tensorflow (0 means default).
+    '''
+    import tensorflow as tf
+    return (tf.config.threading.get_intra_op_parallelism_threads(),
+            tf.config.threading.get_inter_op_parallelism_threads())
+
+
+class BatchSizeTuner:
+    """
+    Tune inference batch size of mmsplice modules on batches of dataloader.
+
+    Throughput of candidate batch sizes is measured with a short
+    calibration pass for each bucket (power of two) of the padded exon
+    length of batches, which bounds the cost of inference. A bucket is
+    calibrated again when a batch with more samples than its calibration
+    batch arrives, until batches fit the largest candidate, so small
+    first batches (e.g. tail batches) do not fix its batch size.
+
+    Args:
+      candidates: inference batch sizes to try. Candidates larger than
+        the batch of dataloader are capped to the batch.
+      repeats: number of timed passes of each candidate, the fastest
+        pass is used.
+    """
+
+    def __init__(self, candidates=(32, 64, 128, 256, 512), repeats=3):
+        self.candidates = candidates
+        self.repeats = repeats
+        self.batch_sizes = dict()
+        self.throughput = dict()
+        self.calibration_samples = dict()
+
+    @staticmethod
+    def length_bucket(inputs):
+        return int(2 ** np.ceil(np.log2(max(inputs['exon'].shape[1], 1))))
+
+    def batch_size(self, model, inputs):
+        '''
+        Inference batch size of `inputs` of `model`, calibrated at
+          the largest batch of its length bucket so far.
+        '''
+        bucket = self.length_bucket(inputs)
+        num_samples = min(len(inputs['exon']), max(self.candidates))
+        if self.calibration_samples.get(bucket, 0) < num_samples:
+            self.batch_sizes[bucket] = self._calibrate(model, inputs, bucket)
+            self.calibration_samples[bucket] = num_samples
+        return self.batch_sizes[bucket]
+
+    def _calibrate(self, model, inputs, bucket):
+        num_samples = len(inputs['exon'])
+        candidates = sorted({min(c, num_samples) for c in self.candidates})
+
+        # first call traces predict functions of models
+        model.predict_modular_scores_on_batch(
+            inputs, batch_size=candidates[-1])
+
+        throughput = dict()
+        for batch_size in candidates:
+            elapsed = list()
+            for _ in range(self.repeats):
+                start = time.perf_counter()
+                model.predict_modular_scores_on_batch(
+                    inputs, batch_size=batch_size)
+                elapsed.append(time.perf_counter() - start)
+            throughput[batch_size] = num_samples / max(min(elapsed), 1e-9)
+
+        best = max(throughput, key=throughput.get)
+        self.throughput[bucket] = throughput
+        logger.info('Autotune: batch size %d for exon length <= %d'
+                    ' (%.0f samples/s on %d samples, tensorflow threads'
+                    ' intra=%d inter=%d)'
+                    % (best, bucket, throughput[best], num_samples,
+                       *tf_threads()))
+        return best
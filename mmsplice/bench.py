@@ -0,0 +1,410 @@
+"""
+Synthetic workloads for benchmarks and scale testing.
+
+Generates a random genome (fasta), a gene annotation (gtf) with
+realistic exon and intron length distributions and exons shared between
+transcripts, junctions (csv) and bgzipped, tabix indexed vcf files of
+SNVs and indels around exons which can directly be used with
+`SplicingVCFDataloader` and junction dataloaders:
+
+    python -m mmsplice.bench output_dir --genes 1000 --variants 100000
+"""
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('mmsplice')
+
+_bases = np.frombuffer(b'ACGT', dtype='uint8')
+_complement = bytes.maketrans(b'ACGT', b'TGCA')
+
+
+def _reverse_complement(seq):
+    return seq.translate(_complement)[::-1]
+
+
+def synthetic_genes(num_genes, rng, chrom='1', start=10000):
+    '''
+    Random genes with alternative transcripts as exon table.
+
+    Exon lengths are log-normal with longer first and last exons,
+    introns are log-normal with a heavy tail. Transcripts of a gene skip
+    internal exons or use alternative 5'/3' splice sites, so exons
+    are shared between transcripts and some of them overlap.
+
+    Args:
+      num_genes: number of genes.
+      rng: np.random.RandomState.
+      chrom: chromosome name.
+      start: position of first gene.
+
+    Returns:
+      (pd.DataFrame, int) of exons (0-based) with
+        `Chromosome, Start, End, Strand, gene_id, transcript_id, exon_id`
+        and the end of last gene.
+    '''
+    rows = list()
+    pos = start
+
+    for g in range(num_genes):
+        gene_id = 'G%s_%d' % (chrom, g)
+        strand = '+' if rng.rand() < 0.5 else '-'
+        num_exons = max(int(rng.lognormal(1.9, 0.6)), 2)
+
+        exons = list()
+        exon_start = pos
+        for e in range(num_exons):
+            terminal = e == 0 or e == num_exons - 1
+            length = int(rng.lognormal(5.5 if terminal else 4.9, 0.6))
+            length = min(max(length, 30), 5000)
+            exons.append((exon_start, exon_start + length))
+            intron = min(max(int(rng.lognormal(7.3, 1.0)), 80), 50000)
+            exon_start += length + intron
+        gene_end = exons[-1][1]
+
+        num_transcripts = 1 + rng.poisson(1)
+        for t in range(num_transcripts):
+            t_exons = list(exons)
+            internal = list(range(1, num_exons - 1))
+            if t > 0 and internal:
+                # exon skipping
+                skipped = set(rng.choice(internal, size=rng.randint(
+                    1, len(internal) + 1), replace=False))
+                t_exons = [e for i, e in enumerate(t_exons)
+                           if i not in skipped]
+            if t > 0 and len(t_exons) > 2 and rng.rand() < 0.3:
+                # alternative splice site of an internal exon
+                i = rng.randint(1, len(t_exons) - 1)
+                shift = rng.randint(3, 30)
+                s, e = t_exons[i]
+                t_exons[i] = (s - shift, e) if rng.rand() < 0.5 \
+                    else (s, e + shift)
+
+            for s, e in t_exons:
+                rows.append((chrom, s, e, strand, gene_id,
+                             '%s_T%d' % (gene_id, t)))
+
+        pos = gene_end + min(int(rng.lognormal(9, 1)), 200000)
+
+    df = pd.DataFrame(rows, columns=['Chromosome', 'Start', 'End', 'Strand',
+                                     'gene_id', 'transcript_id'])
+    exon_ids = df.groupby(['Start', 'End', 'gene_id']).ngroup()
+    df['exon_id'] = 'E%s_' % chrom + exon_ids.astype(str)
+    return df, pos
+
+
+def synthetic_genome(length, df_exons, rng):
+    '''
+    Random sequence with canonical splice site dinucleotides
+      (AG acceptor, GT donor) at the boundaries of exons.
+    '''
+    seq = _bases[rng.randint(0, 4, size=length)]
+
+    start, end = df_exons['Start'].values, df_exons['End'].values
+    plus = (df_exons['Strand'] == '+').values
+    left = start != df_exons.groupby('transcript_id')['Start'] \
+        .transform('min').values
+    right = end != df_exons.groupby('transcript_id')['End'] \
+        .transform('max').values
+
+    motifs = [
+        (start[left & plus] - 2, b'AG'),
+        (start[left & ~plus] - 2, _reverse_complement(b'GT')),
+        (end[right & plus], b'GT'),
+        (end[right & ~plus], _reverse_complement(b'AG'))
+    ]
+    for positions, motif in motifs:
+        for i, base in enumerate(motif):
+            seq[positions + i] = base
+    return seq.tobytes()
+
+
+def synthetic_exon_windows(num_genes, overhang=(300, 300), seed=0):
+    '''
+    Sequences of internal exons of synthetic genes with intronic overhang
+      on the strand of the exon, e.g. to calibrate quantized models.
+
+    Returns:
+      pd.DataFrame of `seq`, `left_overhang` and `right_overhang`
+        (acceptor and donor side).
+    '''
+    rng = np.random.RandomState(seed)
+    df, length = synthetic_genes(num_genes, rng)
+    seq = synthetic_genome(length + overhang[1], df, rng)
+
+    start, end = df['Start'].values, df['End'].values
+    internal = (start != df.groupby('transcript_id')['Start']
+                .transform('min').values) \
+        & (end != df.groupby('transcript_id')['End'].transform('max').values)
+    df = df[internal].drop_duplicates(['Start', 'End', 'Strand'])
+
+    rows = list()
+    for s, e, strand in zip(df['Start'], df['End'], df['Strand']):
+        if strand == '-':
+            window = _reverse_complement(seq[s - overhang[1]:e + overhang[0]])
+        else:
+            window = seq[s - overhang[0]:e + overhang[1]]
+        rows.append((window.decode(), *overhang))
+    return pd.DataFrame(rows, columns=['seq', 'left_overhang',
+                                       'right_overhang'])
+
+
+def write_fasta(path, seqs, line_width=60):
+    with open(str(path), 'wb') as f:
+        for chrom, seq in seqs.items():
+            f.write(b'>%s\n' % chrom.encode())
+            for i in range(0, len(seq), line_width):
+                f.write(seq[i:i + line_width] + b'\n')
+
+
+def write_gtf(path, df_exons):
+    '''
+    Write gene, transcript and exon records of exon table as gtf (1-based).
+    '''
+    records = list()
+
+    def _record(row, feature, start, end, attrs):
+        records.append((row['Chromosome'], start, feature,
+                        '%s\tmmsplice\t%s\t%d\t%d\t.\t%s\t.\t%s\n'
+                        % (row['Chromosome'], feature, start + 1, end,
+                           row['Strand'], attrs)))
+
+    for gene_id, df_gene in df_exons.groupby('gene_id', sort=False):
+        row = df_gene.iloc[0]
+        gene_attrs = 'gene_id "%s"; gene_name "%s"; ' \
+            'gene_biotype "protein_coding";' % (gene_id, gene_id)
+        _record(row, 'gene', df_gene['Start'].min(), df_gene['End'].max(),
+                gene_attrs)
+
+        for transcript_id, df_t in df_gene.groupby('transcript_id',
+                                                   sort=False):
+            t_attrs = '%s transcript_id "%s";' % (gene_attrs, transcript_id)
+            _record(row, 'transcript', df_t['Start'].min(),
+                    df_t['End'].max(), t_attrs)
+
+            exons = df_t.sort_values('Start', ascending=row['Strand'] == '+')
+            for i, exon in enumerate(exons.itertuples(), start=1):
+                _record(row, 'exon', exon.Start, exon.End,
+                        '%s exon_number "%d"; exon_id "%s";'
+                        % (t_attrs, i, exon.exon_id))
+
+    records.sort(key=lambda x: (x[0], x[1]))
+    with open(str(path), 'w') as f:
+        f.writelines(r[3] for r in records)
+
+
+def write_junctions(path, df_exons):
+    '''
+    Write introns of transcripts as junction csv (0-based) of
+      junction dataloaders.
+    '''
+    df = df_exons.sort_values(['transcript_id', 'Start'])
+    same = df['transcript_id'].values[1:] == df['transcript_id'].values[:-1]
+    df_introns = pd.DataFrame({
+        'Chromosome': df['Chromosome'].values[1:][same],
+        'Start': df['End'].values[:-1][same],
+        'End': df['Start'].values[1:][same],
+        'Strand': df['Strand'].values[1:][same]
+    }).drop_duplicates()
+    df_introns.to_csv(str(path), index=False)
+
+
+def _overlapping_windows(starts, ends):
+    '''
+    Regions covered by windows of at least two distinct exons.
+    '''
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    prev_end = np.maximum.accumulate(ends)[:-1]
+    overlap_start = starts[1:]
+    overlap_end = np.minimum(prev_end, ends[1:])
+    keep = overlap_end > overlap_start
+    return overlap_start[keep], overlap_end[keep]
+
+
+def synthetic_variants(seqs, df_exons, num_variants, rng, intronic=0.3,
+                       indel=0.1, multi_exon=0.05, overhang=100):
+    '''
+    Random SNVs and indels in windows of exons.
+
+    Args:
+      seqs: dict of chromosome sequences.
+      df_exons: exon table of `synthetic_genes`.
+      num_variants: number of variants.
+      rng: np.random.RandomState.
+      intronic: fraction of variants in the introns within `overhang`.
+      indel: fraction of insertions and deletions (1-10bp).
+      multi_exon: fraction of variants overlapping windows of
+        more than one exon.
+      overhang: intronic window of exons.
+
+    Returns:
+      pd.DataFrame of sorted vcf records `CHROM, POS, REF, ALT` (1-based).
+    '''
+    df = df_exons.drop_duplicates(['Chromosome', 'Start', 'End'])
+    chroms = df['Chromosome'].values
+    starts, ends = df['Start'].values, df['End'].values
+
+    multi = [_overlapping_windows(starts[chroms == c] - overhang,
+                                  ends[chroms == c] + overhang)
+             for c in seqs]
+    multi_chroms = np.concatenate([[c] * len(m[0])
+                                   for c, m in zip(seqs, multi)])
+    multi_starts = np.concatenate([m[0] for m in multi])
+    multi_ends = np.concatenate([m[1] for m in multi])
+    if len(multi_starts) == 0 and multi_exon > 0:
+        logger.warning('No overlapping exons to place multi exon variants')
+        multi_exon = 0
+
+    variants = set()
+    while len(variants) < num_variants:
+        kind = rng.rand()
+        if kind < multi_exon:
+            i = rng.randint(len(multi_starts))
+            chrom = multi_chroms[i]
+            pos = rng.randint(multi_starts[i], multi_ends[i])
+        else:
+            i = rng.randint(len(df))
+            chrom = chroms[i]
+            if kind < multi_exon + intronic:
+                offset = rng.randint(1, overhang + 1)
+                pos = starts[i] - offset if rng.rand() < 0.5 \
+                    else ends[i] + offset - 1
+            else:
+                pos = rng.randint(starts[i], ends[i])
+
+        seq = seqs[chrom]
+        if not 0 < pos < len(seq) - 11:
+            continue
+
+        ref = seq[pos:pos + 1].decode()
+        if rng.rand() < indel:
+            size = rng.randint(1, 11)
+            if rng.rand() < 0.5:
+                alt = ref + _bases[rng.randint(0, 4, size)].tobytes().decode()
+            else:
+                ref = seq[pos:pos + size + 1].decode()
+                alt = ref[0]
+        else:
+            alt = 'ACGT'.replace(ref, '')[rng.randint(3)]
+        variants.add((chrom, pos + 1, ref, alt))
+
+    df_variants = pd.DataFrame(sorted(variants),
+                               columns=['CHROM', 'POS', 'REF', 'ALT'])
+    return df_variants
+
+
+def write_vcf(path, df_variants, seqs):
+    with open(str(path), 'w') as f:
+        f.write('##fileformat=VCFv4.2\n')
+        for chrom, seq in seqs.items():
+            f.write('##contig=<ID=%s,length=%d>\n' % (chrom, len(seq)))
+        f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        for chrom, pos, ref, alt in df_variants.itertuples(index=False):
+            f.write('%s\t%d\t%s:%d:%s:%s\t%s\t%s\t.\t.\t.\n'
+                    % (chrom, pos, chrom, pos, ref, alt, ref, alt))
+
+
+def bgzip_index(path, preset='vcf'):
+    '''
+    Compress file with bgzip and index it with tabix, using pysam if
+      installed otherwise `bgzip` and `tabix` of htslib.
+
+    Returns:
+      path of compressed file.
+    '''
+    path = str(path)
+    try:
+        import pysam
+    except ImportError:
+        bgzip, tabix = shutil.which('bgzip'), shutil.which('tabix')
+        if not (bgzip and tabix):
+            raise ImportError('pysam or bgzip and tabix of htslib'
+                              ' are required to index vcf files')
+        subprocess.run([bgzip, '-f', path], check=True)
+        subprocess.run([tabix, '-f', '-p', preset, path + '.gz'], check=True)
+        return path + '.gz'
+    return pysam.tabix_index(path, preset=preset, force=True)
+
+
+def generate(output_dir, num_genes=100, num_variants=1000, num_chroms=1,
+             intronic=0.3, indel=0.1, multi_exon=0.05, overhang=100,
+             index=True, seed=0):
+    '''
+    Generate synthetic fasta, gtf, junction and vcf files.
+
+    Args:
+      output_dir: directory of generated files.
+      num_genes: number of genes per chromosome.
+      num_variants: number of variants.
+      num_chroms: number of chromosomes named 1, 2, ...
+      intronic: fraction of variants in the introns within `overhang`.
+      indel: fraction of insertions and deletions.
+      multi_exon: fraction of variants overlapping windows of
+        more than one exon.
+      overhang: intronic window of exons.
+      index: bgzip and tabix index vcf file.
+      seed: random seed.
+
+    Returns:
+      dict of paths of `fasta`, `gtf`, `junction` and `vcf`.
+    '''
+    rng = np.random.RandomState(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    seqs, dfs = dict(), list()
+    for c in range(1, num_chroms + 1):
+        chrom = str(c)
+        df, length = synthetic_genes(num_genes, rng, chrom)
+        seqs[chrom] = synthetic_genome(length, df, rng)
+        dfs.append(df)
+    df_exons = pd.concat(dfs, ignore_index=True)
+
+    paths = {
+        'fasta': output_dir / 'genome.fa',
+        'gtf': output_dir / 'genes.gtf',
+        'junction': output_dir / 'junctions.csv',
+        'vcf': output_dir / 'variants.vcf'
+    }
+    write_fasta(paths['fasta'], seqs)
+    write_gtf(paths['gtf'], df_exons)
+    write_junctions(paths['junction'], df_exons)
+
+    df_variants = synthetic_variants(
+        seqs, df_exons, num_variants, rng, intronic=intronic, indel=indel,
+        multi_exon=multi_exon, overhang=overhang)
+    write_vcf(paths['vcf'], df_variants, seqs)
+    if index:
+        paths['vcf'] = Path(bgzip_index(paths['vcf']))
+
+    return {k: str(v) for k, v in paths.items()}
+
+
+if __name__ == '__main__':
+    import click
+
+    @click.command()
+    @click.argument('output_dir')
+    @click.option('--genes', default=100, help='Number of genes per chrom.')
+    @click.option('--variants', default=1000, help='Number of variants.')
+    @click.option('--chroms', default=1, help='Number of chromosomes.')
+    @click.option('--intronic', default=0.3,
+                  help='Fraction of intronic variants.')
+    @click.option('--indel', default=0.1, help='Fraction of indels.')
+    @click.option('--multi-exon', default=0.05,
+                  help='Fraction of variants overlapping multiple exons.')
+    @click.option('--no-index', is_flag=True,
+                  help='Do not bgzip and tabix index vcf.')
+    @click.option('--seed', default=0, help='Random seed.')
+    def bench(output_dir, genes, variants, chroms, intronic, indel,
+              multi_exon, no_index, seed):
+        paths = generate(output_dir, genes, variants, chroms, intronic,
+                         indel, multi_exon, index=not no_index, seed=seed)
+        for k, v in paths.items():
+            click.echo('%s\t%s' % (k, v))
+
+    bench()
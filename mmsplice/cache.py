@@ -0,0 +1,56 @@
+import os
+import hashlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger('mmsplice')
+
+CACHE_VERSION = 1
+
+
+def get_cache_dir(cache_dir=None):
+    '''
+    Directory to store cached annotations.
+
+    Args:
+      cache_dir: explicit cache directory. If None, `MMSPLICE_CACHE_DIR`
+        environment variable or `~/.cache/mmsplice` is used.
+    '''
+    cache_dir = cache_dir or os.environ.get('MMSPLICE_CACHE_DIR') \
+        or os.path.join(os.path.expanduser('~'), '.cache', 'mmsplice')
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def file_cache_key(path, *args):
+    '''
+    Hash key of a file identified by its absolute path and mtime
+      together with the arguments used to parse it.
+    '''
+    path = os.path.abspath(str(path))
+    mtime = os.stat(path).st_mtime_ns
+    key = '|'.join(map(str, (CACHE_VERSION, path, mtime, *args)))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def atomic_path(path):
+    '''
+    Temporary path next to `path`, moved into place with `os.replace`
+      so concurrent processes never read half written cache files.
+    '''
+    path = Path(path)
+    return path.with_name('.%s.%d.tmp' % (path.name, os.getpid()))
+
+
+def read_feather(path):
+    from pyarrow import feather
+    return feather.read_feather(str(path), memory_map=True)
+
+
+def write_feather(df, path):
+    from pyarrow import feather
+    tmp = atomic_path(path)
+    feather.write_feather(df.reset_index(drop=True), str(tmp),
+                          compression='uncompressed')
+    os.replace(str(tmp), str(path))
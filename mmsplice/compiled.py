@@ -0,0 +1,147 @@
+"""
+XLA compiled inference of the module models of MMSplice and MTSplice.
+
+Batches of dataloaders are padded to the longest sequence of the batch,
+so keras sees a new input shape almost every batch and retraces its
+predict function. Compiled models pad the batch dimension to a fixed
+batch size and variable length inputs to a small set of length buckets
+(`LENGTH_BUCKETS`), so each model is traced and compiled with
+`jit_compile=True` once per bucket. Only inputs of models whose output
+is invariant to trailing zero padding (the exon model with
+`GlobalAveragePooling1D_Mask0`) are padded to buckets; other variable
+length models are compiled per distinct length, which is fixed by the
+overhang in practice.
+
+Compiled XLA programs are persisted in `<cache_dir>/xla` with the
+persistent compilation cache of tensorflow (from version 2.11), so later
+processes start warm.
+"""
+import os
+import logging
+import numpy as np
+from mmsplice.cache import get_cache_dir
+
+logger = logging.getLogger('mmsplice')
+
+LENGTH_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+COMPILED_BATCH_SIZE = 256
+
+_XLA_CACHE_FLAG = '--tf_xla_persistent_cache_directory'
+
+# unknown entries of `TF_XLA_FLAGS` abort older versions of tensorflow
+_XLA_CACHE_MIN_VERSION = (2, 11)
+
+
+def bucket_length(length, buckets=LENGTH_BUCKETS):
+    '''
+    Smallest bucket not shorter than `length`. Lengths longer than the
+      largest bucket are rounded up to multiples of the largest bucket.
+    '''
+    for bucket in buckets:
+        if length <= bucket:
+            return bucket
+    return int(np.ceil(length / buckets[-1])) * buckets[-1]
+
+
+def _tf_version():
+    import tensorflow as tf
+    return tf.__version__
+
+
+def persistent_cache_supported(version=None):
+    '''
+    Whether tensorflow of `version` (installed version if None) has
+      the persistent compilation cache of XLA.
+    '''
+    version = version or _tf_version()
+    try:
+        major, minor = (int(i) for i in version.split('.')[:2])
+    except ValueError:
+        return False
+    return (major, minor) >= _XLA_CACHE_MIN_VERSION
+
+
+def enable_persistent_cache(cache_dir=None):
+    '''
+    Persist compiled XLA programs in `<cache_dir>/xla`. Tensorflow reads
+      `TF_XLA_FLAGS` once, so this has effect only before the first
+      compilation of the process and is ignored if the cache directory
+      is already set. Versions of tensorflow without the persistent
+      cache are left unchanged.
+
+    Args:
+      cache_dir: cache directory, see `mmsplice.cache.get_cache_dir`.
+
+    Returns:
+      path of XLA cache directory in use or None if not supported.
+    '''
+    flags = os.environ.get('TF_XLA_FLAGS', '')
+    for flag in flags.split():
+        if flag.startswith(_XLA_CACHE_FLAG + '='):
+            return flag.split('=', 1)[1]
+
+    if not persistent_cache_supported():
+        logger.info('Persistent XLA cache requires tensorflow>=%d.%d'
+                    % _XLA_CACHE_MIN_VERSION)
+        return None
+
+    xla_dir = get_cache_dir(cache_dir) / 'xla'
+    xla_dir.mkdir(exist_ok=True)
+    os.environ['TF_XLA_FLAGS'] = ' '.join(
+        f for f in (flags, '%s=%s' % (_XLA_CACHE_FLAG, xla_dir)) if f)
+    return str(xla_dir)
+
+
+def _pad(x, batch_size, length=None):
+    shape = (batch_size, length or x.shape[1]) + x.shape[2:]
+    if x.shape == shape and x.dtype == np.float32:
+        return x
+    out = np.zeros(shape, dtype='float32')
+    out[:len(x), :x.shape[1]] = x
+    return out
+
+
+class CompiledModel:
+    """
+    Keras model (or callable over a list of input tensors) compiled
+    with XLA for fixed batch size and length buckets, with keras-like
+    `predict`.
+
+    Args:
+      model: keras model or callable of list of tensors.
+      batch_size: batch size of compiled functions. Batches are split
+        into chunks of `batch_size` and the last chunk is zero padded.
+      buckets: length buckets to zero pad the length dimension of
+        inputs to, or None to compile each distinct length.
+    """
+
+    def __init__(self, model, batch_size=COMPILED_BATCH_SIZE, buckets=None):
+        import tensorflow as tf
+        self.model = model
+        self.batch_size = batch_size
+        self.buckets = buckets
+        self._function = tf.function(self._call, jit_compile=True)
+
+    def _call(self, *inputs):
+        return self.model(inputs[0] if len(inputs) == 1 else list(inputs),
+                          training=False)
+
+    def predict(self, x, batch_size=None):
+        '''
+        Predict batch of inputs in chunks of compiled batch size.
+          `batch_size` is accepted for compatibility with keras models
+          and ignored.
+        '''
+        xs = x if isinstance(x, (list, tuple)) else [x]
+        length = None
+        if self.buckets:
+            length = bucket_length(xs[0].shape[1], self.buckets)
+
+        pred = list()
+        for i in range(0, len(xs[0]), self.batch_size):
+            chunk = [_pad(v[i:i + self.batch_size], self.batch_size, length)
+                     for v in xs]
+            n = min(self.batch_size, len(xs[0]) - i)
+            pred.append(self._function(*chunk).numpy()[:n])
+        return np.concatenate(pred)
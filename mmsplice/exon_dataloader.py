@@ -1,12 +1,19 @@
 import logging
+import bisect
+from itertools import islice
+import numpy as np
 import pandas as pd
 from kipoiseq.dataclasses import Interval, Variant
-from kipoi.data import Dataset
+from kipoi.data import Dataset, SampleIterator, numpy_collate
 from kipoiseq.extractors import VariantSeqExtractor
-from mmsplice.utils import encodeDNA, region_annotate
+from mmsplice.utils import encodeDNA, region_annotate, onehot_index, \
+    encode_index_batch, N_INDEX
+from mmsplice.profiler import NULL_PROFILER
 
 logger = logging.getLogger('mmsplice')
 
+modules = ['acceptor_intron', 'acceptor', 'exon', 'donor', 'donor_intron']
+
 
 class ExonVariantSeqExtrator:
     """
@@ -194,6 +201,256 @@ class SeqSpliter:
                          - self.tissue_donor_intron:]
         }
 
+    @staticmethod
+    def _slice(start, stop, length):
+        """
+        Python slice semantics of `seq[start:stop]` vectorized over
+          sequences of `length`. Returns (start, length) of slices.
+        """
+        start = np.where(start < 0, start + length, start)
+        start = np.clip(start, 0, length)
+        stop = np.where(stop < 0, stop + length, stop)
+        stop = np.clip(stop, 0, length)
+        return start, np.maximum(stop - start, 0)
+
+    @staticmethod
+    def _gather(index, lengths, start, length):
+        """
+        Gather slices from `N_INDEX` padded index matrix. `start` is
+          position in the unpadded sequences, positions out of the sequence
+          or beyond `length` are filled with `N_INDEX`.
+        """
+        width = int(length.max()) if len(length) else 0
+        pos = start[:, None] + np.arange(width)
+        valid = (np.arange(width) < length[:, None]) \
+            & (pos >= 0) & (pos < lengths[:, None])
+        pos = np.clip(pos, 0, max(index.shape[1] - 1, 0))
+        rows = np.arange(len(index))[:, None]
+        if index.shape[1] == 0:
+            return np.full(pos.shape, N_INDEX, dtype='uint8')
+        return np.where(valid, index[rows, pos], N_INDEX).astype('uint8')
+
+    def _module_slices(self, lengths, overhangs):
+        """
+        Slices of each module in N padded sequences as in `split`.
+
+        Returns:
+          (padl, padded_len, slices) where `padl` is number of N padded
+            to the left of each sequence and `slices` is dict of
+            (start, length) of each module in padded sequences.
+        """
+        intronl_len, intronr_len = overhangs[:, 0], overhangs[:, 1]
+
+        assert np.all(intronl_len <= lengths), "Input sequence acceptor" \
+            " intron length cannot be longer than the input sequence"
+        assert np.all(intronr_len <= lengths), "Input sequence donor intron" \
+            " length cannot be longer than the input sequence"
+
+        # need to pad N if left seq not enough long
+        lackl = self.acceptor_intron_len - intronl_len
+        padl = np.where(lackl >= 0, lackl + 1, 0)
+        intronl_len = intronl_len + padl
+        lackr = self.donor_intron_len - intronr_len
+        padr = np.where(lackr >= 0, lackr + 1, 0)
+        intronr_len = intronr_len + padr
+        padded_len = lengths + padl + padr
+
+        slices = {
+            'acceptor_intron': (
+                0, intronl_len - self.acceptor_intron_cut),
+            'acceptor': (
+                intronl_len - self.acceptor_intron_len,
+                intronl_len + self.acceptor_exon_len),
+            'exon': (
+                intronl_len + self.exon_cut_l,
+                -intronr_len - self.exon_cut_r),
+            'donor': (
+                -intronr_len - self.donor_exon_len,
+                -intronr_len + self.donor_intron_len),
+            'donor_intron': (
+                -intronr_len + self.donor_intron_cut, padded_len)
+        }
+        slices = {
+            module: self._slice(np.broadcast_to(start, lengths.shape),
+                                np.broadcast_to(stop, lengths.shape),
+                                padded_len)
+            for module, (start, stop) in slices.items()
+        }
+        return padl, padded_len, slices
+
+    def module_windows(self, lengths, overhangs, mask_module=None):
+        """
+        Windows of sequences seen by each module, vectorized over
+          sequences. Masked modules and padded N are not part of windows.
+
+        Args:
+          lengths: length of each sequence.
+          overhangs: (batch, 2) array of (intron_length acceptor side,
+            intron_length donor side) of each sequence.
+          mask_module: modules masked with N.
+
+        Returns:
+          dict of (start, end) arrays of each module in sequence coordinates.
+        """
+        lengths = np.asarray(lengths, dtype='int64')
+        overhangs = np.asarray(overhangs, dtype='int64').reshape(-1, 2)
+        padl, _, slices = self._module_slices(lengths, overhangs)
+        mask_module = mask_module or []
+
+        windows = dict()
+        for module, (start, length) in slices.items():
+            if module in mask_module:
+                continue
+            start = start - padl
+            windows[module] = (np.clip(start, 0, lengths),
+                               np.clip(start + length, 0, lengths))
+        return windows
+
+    def split_batch(self, index, lengths, overhangs, mask_module=None,
+                    exon_rows=None, pattern_warning=True, out=None):
+        """
+        Split batch of index encoded sequences for each module,
+          vectorized equivalent of `split` followed by `encodeDNA`.
+
+        Args:
+          index: (batch, max_len) uint8 sequences
+            of `mmsplice.utils.encode_index_batch`.
+          lengths: length of each sequence.
+          overhangs: (batch, 2) array of (intron_length acceptor side,
+            intron_length donor side) of each sequence.
+          mask_module: modules to mask with N.
+          exon_rows: exons used in pattern warnings.
+          out: optional dict of flat float32 buffers per module
+            to write one-hot arrays into, see `onehot_index`.
+
+        Returns:
+          dict of one-hot encoded (batch, len, 4) arrays per module.
+        """
+        pattern_warning = self.pattern_warning and pattern_warning
+        lengths = np.asarray(lengths, dtype='int64')
+        overhangs = np.asarray(overhangs, dtype='int64').reshape(-1, 2)
+        padl, padded_len, slices = self._module_slices(lengths, overhangs)
+
+        mask_module = mask_module or []
+        for i in mask_module:
+            if i not in slices:
+                raise ValueError('%s is not in mmsplice modules' % i)
+
+        splits = dict()
+        for module, (start, length) in slices.items():
+            if module == 'exon':
+                # empty exon is represented as 'N'
+                empty = length == 0
+                start = np.where(empty, padded_len, start)
+                length = np.where(empty, 1, length)
+
+            module_index = self._gather(index, lengths, start - padl, length)
+            if module in mask_module:
+                module_index.fill(N_INDEX)
+            splits[module] = module_index
+
+        if pattern_warning:
+            self._batch_pattern_warning(splits, overhangs, exon_rows)
+
+        return {k: onehot_index(v, out=out[k] if out else None)
+                for k, v in splits.items()}
+
+    def _batch_pattern_warning(self, splits, overhangs, exon_rows=None):
+        exon_rows = exon_rows if exon_rows is not None \
+            else [''] * len(overhangs)
+
+        donor = splits['donor'][:, self.donor_exon_len:
+                                self.donor_exon_len + 2]
+        none_gt = ~np.all(donor == [2, 3], axis=1) & (overhangs[:, 1] != 0)
+        for i in np.where(none_gt)[0]:
+            logger.warning('None GT donor: %s' % str(exon_rows[i]))
+
+        acceptor = splits['acceptor'][:, self.acceptor_intron_len - 2:
+                                      self.acceptor_intron_len]
+        none_ag = ~np.all(acceptor == [0, 2], axis=1) & (overhangs[:, 0] != 0)
+        for i in np.where(none_ag)[0]:
+            logger.warning('None AG acceptor: %s' % str(exon_rows[i]))
+
+    def split_tissue_batch(self, index, lengths, overhangs, out=None):
+        """
+        Split batch of index encoded sequences for tissue specific
+          predictions, vectorized equivalent of `split_tissue_seq`
+          followed by `encodeDNA`.
+
+        Args:
+          index: (batch, max_len) uint8 sequences
+            of `mmsplice.utils.encode_index_batch`.
+          lengths: length of each sequence.
+          overhangs: (batch, 2) array of (intron_length acceptor side,
+            intron_length donor side) of each sequence.
+          out: optional dict of flat float32 buffers of
+            'acceptor' and 'donor' to write one-hot arrays into,
+            see `onehot_index`.
+        """
+        lengths = np.asarray(lengths, dtype='int64')
+        overhangs = np.asarray(overhangs, dtype='int64').reshape(-1, 2)
+
+        assert np.all(overhangs[:, 0] <= lengths), "Input sequence" \
+            " acceptor intron length cannot be longer than the input sequence"
+        assert np.all(overhangs[:, 1] <= lengths), "Input sequence donor" \
+            " intron length cannot be longer than the input sequence"
+
+        # N padded or trimmed so introns have exactly the tissue lengths
+        diff_acceptor = overhangs[:, 0] - self.tissue_acceptor_intron
+        trimmed_len = np.where(diff_acceptor < 0, lengths - diff_acceptor,
+                               np.maximum(lengths - diff_acceptor, 0))
+        diff_donor = overhangs[:, 1] - self.tissue_donor_intron
+        trimmed_len = np.where(diff_donor < 0, trimmed_len - diff_donor,
+                               np.maximum(trimmed_len - diff_donor, 0))
+
+        acceptor_len = self.tissue_acceptor_intron + self.tissue_acceptor_exon
+        donor_len = self.tissue_donor_exon + self.tissue_donor_intron
+        slices = {
+            'acceptor': (0, acceptor_len),
+            'donor': (-donor_len, trimmed_len)
+        }
+
+        splits = dict()
+        for module, (start, stop) in slices.items():
+            start, length = self._slice(
+                np.broadcast_to(start, lengths.shape),
+                np.broadcast_to(stop, lengths.shape), trimmed_len)
+            module_index = self._gather(
+                index, lengths, start + diff_acceptor, length)
+            splits[module] = onehot_index(
+                module_index, out=out[module] if out else None)
+        return splits
+
+
+class BatchBuffers:
+    """
+    Reusable buffers of encoded batches. Buffers grow to the largest batch
+    seen, so arrays of a batch are views into them and only valid until
+    the next batch is requested.
+    """
+
+    def __init__(self):
+        self.buffers = dict()
+
+    def get(self, key):
+        return self.buffers.get(key)
+
+    def group(self, key, modules):
+        return {m: self.get((key, m)) for m in modules}
+
+    def keep(self, key, arr):
+        """
+        Keep `arr` as buffer of `key` if it was newly allocated
+          because the buffer was too small.
+        """
+        buffer = self.buffers.get(key)
+        if buffer is None or not np.shares_memory(arr, buffer):
+            self.buffers[key] = arr.reshape(-1) if arr.ndim == 3 else arr
+
+    def keep_group(self, key, arrs):
+        for module, arr in arrs.items():
+            self.keep((key, module), arr)
+
 
 class ExonSplicingMixin:
     """
@@ -215,6 +472,12 @@ class ExonSplicingMixin:
     """
     optional_metadata = ('exon_id', 'gene_id', 'gene_name',
                          'transcript_id', 'junction', 'side', 'region')
+    # `_next` returns unsplit sequences with their overhangs
+    # while batches are encoded natively by `_batch_iter_encoded`.
+    _native_batch = False
+    # number of samples skipped at the begining, see `skip`
+    _skip_samples = 0
+    profiler = NULL_PROFILER
 
     def __init__(self, fasta_file, split_seq=True, encode=True,
                  overhang=(100, 100), seq_spliter=None,
@@ -229,30 +492,52 @@ class ExonSplicingMixin:
         self.tissue_specific = tissue_specific
         self.tissue_overhang = tissue_overhang
 
-    def _next(self, exon, variant, overhang=None, mask_module=None):
-        overhang = overhang or self.overhang
+    def _extract(self, exon, variant, overhang):
+        tissue_overhang = None
 
-        inputs = {
-            'seq': self.fasta.extract(Interval(
-                exon.chrom, exon.start - overhang[0],
-                exon.end + overhang[1], strand=exon.strand)).upper(),
-            'mut_seq': self.vseq_extractor.extract(
-                exon, [variant], overhang=overhang).upper()
-        }
+        with self.profiler.stage('fasta'):
+            inputs = {
+                'seq': self.fasta.extract(Interval(
+                    exon.chrom, exon.start - overhang[0],
+                    exon.end + overhang[1], strand=exon.strand)).upper(),
+                'mut_seq': self.vseq_extractor.extract(
+                    exon, [variant], overhang=overhang).upper()
+            }
 
-        if self.tissue_specific:
-            tissue_overhang = (
-                0 if overhang[0] == 0 else self.tissue_overhang[0],
-                0 if overhang[1] == 0 else self.tissue_overhang[1]
-            )
-            inputs['tissue_seq'] = self.vseq_extractor.extract(
-                exon, [variant], overhang=tissue_overhang).upper()
+            if self.tissue_specific:
+                tissue_overhang = (
+                    0 if overhang[0] == 0 else self.tissue_overhang[0],
+                    0 if overhang[1] == 0 else self.tissue_overhang[1]
+                )
+                inputs['tissue_seq'] = self.vseq_extractor.extract(
+                    exon, [variant], overhang=tissue_overhang).upper()
+
+        return inputs, tissue_overhang
+
+    def _next(self, exon, variant, overhang=None, mask_module=None,
+              scores=None):
+        overhang = overhang or self.overhang
+
+        if scores is not None:
+            # precomputed (ref, alt) modular scores replace sequences
+            # in native batches, see `mmsplice.snv_table.SNVScoreTable`
+            inputs, tissue_overhang = {'scores': scores}, None
+        else:
+            inputs, tissue_overhang = self._extract(exon, variant, overhang)
 
         if exon.strand == '-':
             overhang = (overhang[1], overhang[0])
             if self.tissue_specific:
                 tissue_overhang = (tissue_overhang[1], tissue_overhang[0])
 
+        metadata = {
+            'variant': self._variant_to_dict(variant, exon),
+            'exon': self._exon_to_dict(exon, overhang)
+        }
+
+        if self._native_batch:
+            return inputs, overhang, tissue_overhang, mask_module, metadata
+
         if self.split_seq:
             inputs['seq'] = self.spliter.split(inputs['seq'], overhang, exon)
             inputs['mut_seq'] = self.spliter.split(inputs['mut_seq'], overhang,
@@ -273,17 +558,37 @@ class ExonSplicingMixin:
 
         return {
             'inputs': inputs,
-            'metadata': {
-                'variant': self._variant_to_dict(variant, exon),
-                'exon': self._exon_to_dict(exon, overhang)
-            }
+            'metadata': metadata
         }
 
-    def batch_iter(self, batch_size=32, **kwargs):
+    def batch_iter(self, batch_size=32, reuse_buffers=False, **kwargs):
+        """
+        Iterate batches of the dataloader.
+
+        Args:
+          batch_size: size of batches.
+          reuse_buffers: if split and encoded, arrays of each batch are
+            written into buffers reused across batches, so they are only
+            valid until the next batch.
+          kwargs: arguments of kipoi `batch_iter`. `shuffle` and
+            `drop_last` are supported without kipoi workers, other
+            arguments fall back to kipoi batches.
+        """
+        if self.split_seq and self.encode and self._native_kwargs(kwargs):
+            yield from self._batch_iter_encoded(
+                batch_size, reuse_buffers, shuffle=kwargs.get('shuffle'),
+                drop_last=kwargs.get('drop_last', False))
+            return
+
         encode = self.encode
         self.encode = False
 
-        for batch in super().batch_iter(batch_size, **kwargs):
+        if isinstance(self, Dataset) and self._skip_samples:
+            batches = self._batch_iter_skipped(batch_size, **kwargs)
+        else:
+            batches = super().batch_iter(batch_size, **kwargs)
+
+        for batch in batches:
             if encode:
                 batch['inputs']['seq'] = self._encode_batch_seq(
                     batch['inputs']['seq'])
@@ -297,6 +602,147 @@ class ExonSplicingMixin:
 
         self.encode = encode
 
+    def set_profiler(self, profiler):
+        """
+        Record time of stages of the dataloader with `profiler`,
+          see `mmsplice.profiler.StageProfiler`.
+        """
+        self.profiler = profiler or NULL_PROFILER
+
+    def skip(self, n):
+        """
+        Skip the first `n` samples of the dataloader, e.g. to resume
+          an interrupted prediction. Sequences of skipped samples
+          are not extracted if the dataloader supports it.
+        """
+        self._skip_samples = n
+
+    def _batch_iter_skipped(self, batch_size=32, drop_last=False,
+                            **kwargs):
+        """
+        Collate batches of samples after skipped samples, which
+          kipoi dataloaders of `Dataset` do not support.
+        """
+        if kwargs.get('num_workers') or kwargs.get('shuffle'):
+            raise ValueError('Skipped samples are not supported with'
+                             ' `num_workers` or `shuffle`')
+        samples = self._iter_samples()
+        while True:
+            rows = list(islice(samples, batch_size))
+            if not rows or (drop_last and len(rows) < batch_size):
+                break
+            yield numpy_collate(rows)
+
+    def _native_kwargs(self, kwargs):
+        """
+        Whether kipoi `batch_iter` arguments are supported by
+          `_batch_iter_encoded`.
+        """
+        if kwargs.get('num_workers'):
+            return False
+        if set(kwargs) - {'num_workers', 'shuffle', 'drop_last'}:
+            return False
+        # only samples of `Dataset` can be shuffled
+        return isinstance(self, Dataset) or not kwargs.get('shuffle')
+
+    def _iter_samples(self, shuffle=False):
+        if isinstance(self, Dataset):
+            index = range(self._skip_samples, len(self))
+            if shuffle:
+                index = np.random.permutation(index)
+            return (self[i] for i in index)
+        return islice(iter(self), self._skip_samples, None)
+
+    def _batch_iter_encoded(self, batch_size=32, reuse_buffers=False,
+                            shuffle=False, drop_last=False):
+        """
+        Encode batches natively: each sequence is index encoded into a
+        batch matrix and split for all modules with `SeqSpliter.split_batch`
+        without intermediate strings per module or object arrays.
+        """
+        if shuffle and self._skip_samples:
+            raise ValueError('Skipped samples are not supported with'
+                             ' `shuffle`')
+        buffers = BatchBuffers() if reuse_buffers else None
+        samples = self._iter_samples(shuffle)
+
+        self._native_batch = True
+        try:
+            while True:
+                rows = list(islice(samples, batch_size))
+                if not rows or (drop_last and len(rows) < batch_size):
+                    break
+                yield self._collate_encoded(rows, buffers)
+        finally:
+            self._native_batch = False
+
+    def _collate_encoded(self, rows, buffers=None):
+        profiler = self.profiler
+        seqs, overhangs, tissue_overhangs, masks, metadata = zip(*rows)
+        with profiler.stage('collate', len(rows)):
+            metadata = numpy_collate(list(metadata))
+        exon_rows = metadata['exon']['annotation']
+        # mask is fixed for all samples of a dataloader
+        mask_module = masks[0]
+
+        lookup = None
+        looked_up = np.fromiter(('scores' in i for i in seqs), dtype=bool,
+                                count=len(seqs))
+        if looked_up.any():
+            # only sequences of samples without precomputed
+            # scores are encoded for the models
+            index, model_index = np.where(looked_up)[0], \
+                np.where(~looked_up)[0]
+            lookup = {
+                'index': index,
+                'model_index': model_index,
+                'scores': np.stack([seqs[i]['scores'] for i in index])
+            }
+            seqs = [seqs[i] for i in model_index]
+            overhangs = [overhangs[i] for i in model_index]
+            exon_rows = exon_rows[model_index]
+
+        inputs = dict()
+        for key in ['seq', 'mut_seq'] if seqs else []:
+            with profiler.stage('encoding', len(seqs)):
+                index, lengths = self._encode_index(
+                    [i[key] for i in seqs], key, buffers)
+            out = buffers.group(key, modules) if buffers else None
+            with profiler.stage('splitting', len(seqs)):
+                inputs[key] = self.spliter.split_batch(
+                    index, lengths, overhangs, mask_module, exon_rows,
+                    pattern_warning=key == 'seq', out=out)
+
+        if self.tissue_specific:
+            with profiler.stage('encoding', len(rows)):
+                index, lengths = self._encode_index(
+                    [i['tissue_seq'] for i in seqs], 'tissue_seq', buffers)
+            out = buffers.group('tissue_seq', ['acceptor', 'donor']) \
+                if buffers else None
+            with profiler.stage('splitting', len(rows)):
+                inputs['tissue_seq'] = self.spliter.split_tissue_batch(
+                    index, lengths, tissue_overhangs, out=out)
+
+        if buffers:
+            for key, arrs in inputs.items():
+                buffers.keep_group(key, arrs)
+
+        batch = {
+            'inputs': inputs,
+            'metadata': metadata
+        }
+        if lookup is not None:
+            batch['lookup'] = lookup
+        return batch
+
+    @staticmethod
+    def _encode_index(seqs, key, buffers=None):
+        out = buffers.get(('index', key)) if buffers else None
+        index, lengths = encode_index_batch(seqs, out=out)
+        if buffers:
+            buffers.keep(('index', key), index)
+        return index, lengths
+
     def _encode_batch_seq(self, batch):
         return {k: encodeDNA(v.tolist()) for k, v in batch.items()}
 
@@ -408,3 +854,194 @@ class ExonDataset(ExonSplicingMixin, Dataset):
 
     def __len__(self):
         return len(self.exons)
+
+
+class StreamingExonDataset(ExonSplicingMixin, SampleIterator):
+    """
+    Dataloader to run mmsplice on large csv or parquet files of exon-variant
+    pairs. Rows are read in chunks of `chunksize` and columns are converted
+    to arrays once per chunk so memory is bounded by chunk size
+    rather than file size.
+
+    Random access with `dl[idx]` and `len(dl)` are supported by a row-offset
+    index build on first use: byte offset of every `index_step` rows for
+    uncompressed csv (one record per line) and row groups for parquet.
+
+    Args:
+        exon_file: csv or parquet file of exon-variant pairs with the same
+        columns as `ExonDataset`.
+        fasta_file: fasta file to fetch exon sequences.
+        split_seq: whether or not already split the sequence
+        when loading the data. Otherwise it can be done in the model class.
+        endcode: if split sequence, should it be one-hot-encoded.
+        overhang: overhang of exon to fetch flanking sequence of exon.
+        seq_spliter: SeqSpliter class instance specific how to split seqs.
+        chunksize: number of rows read at once.
+        index_step: row interval of the offset index of csv files.
+        **kwargs: passed to `pd.read_csv`.
+    """
+
+    def __init__(self, exon_file, fasta_file, split_seq=True, encode=True,
+                 overhang=(100, 100), seq_spliter=None,
+                 tissue_specific=False, tissue_overhang=(300, 300),
+                 chunksize=100000, index_step=1000, **kwargs):
+        super().__init__(fasta_file, split_seq, encode, overhang, seq_spliter,
+                         tissue_specific, tissue_overhang)
+        self.exon_file = str(exon_file)
+        self.chunksize = chunksize
+        self.index_step = index_step
+        self.read_kwargs = kwargs
+        self.is_parquet = self.exon_file.endswith('.parquet')
+        self.columns = self._read_columns()
+        self._offsets = None
+        self._file_columns = None
+        self._check_columns()
+        self._generator = self._iter_samples()
+
+    def _read_columns(self):
+        if self.is_parquet:
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(self.exon_file).schema.names
+        return pd.read_csv(self.exon_file, nrows=0,
+                           **self.read_kwargs).columns.tolist()
+
+    def _check_columns(self):
+        columns = {ExonDataset.exon_cols_mapping.get(c, c)
+                   for c in self.columns}
+        for c in ExonDataset.required_cols:
+            if c not in columns:
+                raise ValueError('Required column "%s" are missings' % c)
+
+    def _iter_chunks(self):
+        if self.is_parquet:
+            import pyarrow.parquet as pq
+            batches = pq.ParquetFile(self.exon_file).iter_batches(
+                batch_size=self.chunksize)
+            chunks = (batch.to_pandas() for batch in batches)
+        else:
+            chunks = pd.read_csv(self.exon_file, chunksize=self.chunksize,
+                                 **self.read_kwargs)
+        for df in chunks:
+            yield self._chunk_to_arrays(df)
+
+    @staticmethod
+    def _chunk_to_arrays(df):
+        df = df.rename(columns=ExonDataset.exon_cols_mapping)
+        df['Chromosome'] = df['Chromosome'].astype('str')
+        return {k: df[k].values for k in df.columns}
+
+    def skip(self, n):
+        self._skip_samples = n
+        self._generator = self._iter_samples()
+
+    def _iter_samples(self):
+        skip = self._skip_samples
+        for chunk in self._iter_chunks():
+            num_rows = len(chunk['Chromosome'])
+            for i in range(min(skip, num_rows), num_rows):
+                yield self._getitem_chunk(chunk, i)
+            skip = max(skip - num_rows, 0)
+
+    def _getitem_chunk(self, chunk, i):
+        exon_attrs = {k: chunk[k][i]
+                      for k in self.optional_metadata if k in chunk}
+        exon = Interval(chunk['Chromosome'][i],
+                        int(chunk['Exon_Start'][i]) - 1,
+                        int(chunk['Exon_End'][i]), strand=chunk['Strand'][i],
+                        attrs=exon_attrs)
+        variant = Variant(chunk['Chromosome'][i], int(chunk['pos'][i]),
+                          chunk['ref'][i], chunk['alt'][i])
+        return self._next(exon, variant)
+
+    def _build_offsets(self):
+        if self.is_parquet:
+            import pyarrow.parquet as pq
+            metadata = pq.ParquetFile(self.exon_file).metadata
+            num_rows = [metadata.row_group(i).num_rows
+                        for i in range(metadata.num_row_groups)]
+            self._num_rows = metadata.num_rows
+            return np.concatenate([[0], np.cumsum(num_rows)]).tolist()
+
+        if self.exon_file.endswith(('.gz', '.bz2', '.xz', '.zip')):
+            raise ValueError('Random access is not supported'
+                             ' for compressed csv files.')
+        header = self._csv_header()
+        if 'skiprows' in self.read_kwargs or not (
+                header is None or isinstance(header, int)):
+            raise ValueError('Random access is not supported with'
+                             ' `skiprows` or multiple header rows.')
+
+        offsets = list()
+        num_rows = 0
+        with open(self.exon_file, 'rb') as f:
+            pos = 0
+            for _ in range(0 if header is None else header + 1):
+                pos += len(f.readline())
+            for line in f:
+                if line.strip():
+                    if num_rows % self.index_step == 0:
+                        offsets.append(pos)
+                    num_rows += 1
+                pos += len(line)
+        self._num_rows = num_rows
+        return offsets
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            self._offsets = self._build_offsets()
+        return self._offsets
+
+    def _csv_header(self):
+        '''
+        Header row of csv file as inferred by `pd.read_csv`.
+        '''
+        return self.read_kwargs.get(
+            'header', None if 'names' in self.read_kwargs else 0)
+
+    def _csv_columns(self):
+        '''
+        All columns of csv file, which `usecols` selects from.
+        '''
+        kwargs = {k: v for k, v in self.read_kwargs.items()
+                  if k != 'usecols'}
+        return pd.read_csv(self.exon_file, nrows=0, **kwargs) \
+            .columns.tolist()
+
+    def _read_rows(self, idx):
+        if self.is_parquet:
+            import pyarrow.parquet as pq
+            group = bisect.bisect_right(self.offsets, idx) - 1
+            df = pq.ParquetFile(self.exon_file).read_row_group(group) \
+                .to_pandas()
+            return df.iloc[[idx - self.offsets[group]]]
+
+        if self._file_columns is None:
+            self._file_columns = self._csv_columns()
+
+        with open(self.exon_file, 'rb') as f:
+            f.seek(self.offsets[idx // self.index_step])
+            # rows after the offset have no header, so names are of all
+            # columns of the file and `usecols` selects from them
+            kwargs = {k: v for k, v in self.read_kwargs.items()
+                      if k not in {'header', 'names', 'nrows'}}
+            return pd.read_csv(f, header=None, names=self._file_columns,
+                               skiprows=idx % self.index_step, nrows=1,
+                               **kwargs)
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < len(self):
+            raise IndexError('index %d is out of range' % idx)
+        return self._getitem_chunk(
+            self._chunk_to_arrays(self._read_rows(idx)), 0)
+
+    def __len__(self):
+        if self._offsets is None:
+            self._offsets = self._build_offsets()
+        return self._num_rows
+
+    def __next__(self):
+        return next(self._generator)
+
+    def __iter__(self):
+        return self
@@ -0,0 +1,231 @@
+"""
+Export of MMSplice and MTSplice as SavedModel and TFLite serving
+artifacts, which are loaded without keras h5 files and custom layers
+with `MMSplice(artifacts=path)` and `MTSplice(artifacts=path)`.
+
+Layout of the artifact directory:
+
+  mmsplice/        SavedModel of the fused modules of MMSplice with
+                   signatures `modular_scores` (one-hot inputs of each
+                   module to modular scores) and `ref_alt`
+                   (`ref_<module>` and `alt_<module>` inputs to
+                   `ref_scores` and `alt_scores`).
+  mmsplice.tflite  TFLite model of `modular_scores`.
+  mtsplice/        SavedModel of the mean of the MTSplice ensemble with
+                   signature `tissues` (`acceptor` and `donor` inputs).
+  mtsplice.tflite  TFLite model of `tissues`.
+  artifacts.json   metadata of the export.
+"""
+import json
+import shutil
+import logging
+from pathlib import Path
+import numpy as np
+from mmsplice.exon_dataloader import modules
+
+logger = logging.getLogger('mmsplice')
+
+EXPORT_VERSION = 1
+
+MMSPLICE_SIGNATURE = 'modular_scores'
+MTSPLICE_SIGNATURE = 'tissues'
+TISSUE_INPUTS = ['acceptor', 'donor']
+
+
+def _logit(x, clip_threshold=0.00001):
+    import tensorflow as tf
+    x = tf.clip_by_value(x, clip_threshold, 1 - clip_threshold)
+    return tf.math.log(x) - tf.math.log(1 - x)
+
+
+def _spec(model, name):
+    import tensorflow as tf
+    return tf.TensorSpec([None, *model.input_shape[1:]], tf.float32,
+                         name=name)
+
+
+def fused_mmsplice(model):
+    '''
+    tf.Module of modules of keras `MMSplice` fused into a single graph
+      with signatures `modular_scores` and `ref_alt`.
+    '''
+    import tensorflow as tf
+    module = tf.Module()
+    module.models = [model.acceptor_intronM, model.acceptorM, model.exonM,
+                     model.donorM, model.donor_intronM]
+
+    def scores(inputs):
+        s = [m(x, training=False) for m, x in zip(module.models, inputs)]
+        return tf.concat([s[0], _logit(s[1]), s[2], _logit(s[3]), s[4]],
+                         axis=1)
+
+    specs = [_spec(m, name) for m, name in zip(module.models, modules)]
+
+    @tf.function(input_signature=specs)
+    def modular_scores(acceptor_intron, acceptor, exon, donor,
+                       donor_intron):
+        return {'scores': scores([acceptor_intron, acceptor, exon, donor,
+                                  donor_intron])}
+
+    ref_alt_specs = [_spec(m, '%s_%s' % (allele, name))
+                     for allele in ['ref', 'alt']
+                     for m, name in zip(module.models, modules)]
+
+    @tf.function(input_signature=ref_alt_specs)
+    def ref_alt(ref_acceptor_intron, ref_acceptor, ref_exon, ref_donor,
+                ref_donor_intron, alt_acceptor_intron, alt_acceptor,
+                alt_exon, alt_donor, alt_donor_intron):
+        return {
+            'ref_scores': scores([ref_acceptor_intron, ref_acceptor,
+                                  ref_exon, ref_donor, ref_donor_intron]),
+            'alt_scores': scores([alt_acceptor_intron, alt_acceptor,
+                                  alt_exon, alt_donor, alt_donor_intron])
+        }
+
+    module.modular_scores = modular_scores
+    module.ref_alt = ref_alt
+    return module, {MMSPLICE_SIGNATURE: modular_scores, 'ref_alt': ref_alt}
+
+
+def fused_mtsplice(model):
+    '''
+    tf.Module of mean of keras models of `MTSplice` ensemble
+      with signature `tissues`.
+    '''
+    import tensorflow as tf
+    module = tf.Module()
+    module.models = list(model.mtsplice_models)
+    first = module.models[0]
+    specs = [tf.TensorSpec([None, *shape[1:]], tf.float32, name=name)
+             for shape, name in zip(first.input_shape, TISSUE_INPUTS)]
+
+    @tf.function(input_signature=specs)
+    def tissues(acceptor, donor):
+        return {'tissues': tf.reduce_mean(tf.stack([
+            m([acceptor, donor], training=False) for m in module.models]),
+            axis=0)}
+
+    module.tissues = tissues
+    return module, {MTSPLICE_SIGNATURE: tissues}
+
+
+def _save(module, signatures, path, signature_key, input_names, tflite):
+    import tensorflow as tf
+    path = Path(path)
+    if path.exists():
+        shutil.rmtree(str(path))
+    tf.saved_model.save(module, str(path), signatures=signatures)
+
+    if tflite:
+        converter = tf.lite.TFLiteConverter.from_saved_model(
+            str(path), signature_keys=[signature_key])
+        tflite_path = str(path) + '.tflite'
+        with open(tflite_path, 'wb') as f:
+            f.write(converter.convert())
+        with open(tflite_path + '.json', 'w') as f:
+            json.dump({'input_names': input_names}, f)
+
+
+def export_artifacts(output, deep=True, tflite=True):
+    '''
+    Export MMSplice and MTSplice as SavedModel and TFLite artifacts.
+
+    Args:
+      output: directory of artifacts.
+      deep: export deep or shallow MTSplice ensemble.
+      tflite: also convert SavedModels to TFLite.
+    '''
+    from mmsplice.mmsplice import MMSplice
+    from mmsplice.mtsplice import MTSplice
+
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    logger.info('Exporting MMSplice to %s' % output)
+    module, signatures = fused_mmsplice(MMSplice(optimize=True))
+    _save(module, signatures, output / 'mmsplice', MMSPLICE_SIGNATURE,
+          modules, tflite)
+
+    logger.info('Exporting MTSplice to %s' % output)
+    module, signatures = fused_mtsplice(MTSplice(deep=deep, optimize=True))
+    _save(module, signatures, output / 'mtsplice', MTSPLICE_SIGNATURE,
+          TISSUE_INPUTS, tflite)
+
+    with open(str(output / 'artifacts.json'), 'w') as f:
+        json.dump({
+            'version': EXPORT_VERSION,
+            'deep': deep,
+            'tflite': tflite,
+            'signatures': {'mmsplice': MMSPLICE_SIGNATURE,
+                           'mtsplice': MTSPLICE_SIGNATURE}
+        }, f, indent=2)
+
+
+class SavedModelArtifact:
+    """
+    Signature of SavedModel with keras-like `predict`.
+
+    Args:
+      path: path of SavedModel.
+      signature: signature key.
+      input_names: names of inputs of the signature in order.
+    """
+
+    def __init__(self, path, signature, input_names):
+        import tensorflow as tf
+        self.path = str(path)
+        self.signature = signature
+        self.input_names = input_names
+        self.saved_model = tf.saved_model.load(self.path)
+        self.function = self.saved_model.signatures[signature]
+
+    def predict(self, x, batch_size=None):
+        '''
+        Predict batch of inputs in chunks of `batch_size`
+          (32 as keras if None).
+        '''
+        import tensorflow as tf
+        xs = x if isinstance(x, (list, tuple)) else [x]
+        batch_size = batch_size or 32
+
+        pred = list()
+        for i in range(0, len(xs[0]), batch_size):
+            outputs = self.function(**{
+                name: tf.constant(v[i:i + batch_size], dtype=tf.float32)
+                for name, v in zip(self.input_names, xs)
+            })
+            pred.append(next(iter(outputs.values())).numpy())
+        return np.concatenate(pred)
+
+
+def load_artifact(path, name, tflite=None, num_threads=None):
+    '''
+    Load exported model of artifact directory.
+
+    Args:
+      path: directory of artifacts of `export_artifacts`.
+      name: 'mmsplice' or 'mtsplice'.
+      tflite: load TFLite model if True, SavedModel if False,
+        TFLite model if exported if None.
+      num_threads: number of threads of TFLite interpreter.
+
+    Returns:
+      `TFLiteModel` or `SavedModelArtifact` with keras-like `predict`.
+    '''
+    path = Path(path)
+    if not (path / 'artifacts.json').exists():
+        raise FileNotFoundError('%s is not a directory of exported'
+                                ' artifacts' % path)
+    tflite_path = path / ('%s.tflite' % name)
+    if tflite is None:
+        tflite = tflite_path.exists()
+
+    if tflite:
+        from mmsplice.quantization import TFLiteModel
+        return TFLiteModel(tflite_path, num_threads=num_threads)
+
+    signature, input_names = {
+        'mmsplice': (MMSPLICE_SIGNATURE, modules),
+        'mtsplice': (MTSPLICE_SIGNATURE, TISSUE_INPUTS)
+    }[name]
+    return SavedModelArtifact(path / name, signature, input_names)
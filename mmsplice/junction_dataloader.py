@@ -117,17 +117,43 @@ class _JunctionVCFDataloader(SplicingVCFMixin, SampleIterator):
       overhang: overhang of exon to fetch flanking sequence of exon.
       seq_spliter: SeqSpliter class instance specific how to split seqs.
          if None, use the default arguments of SeqSpliter
+      regions: target regions as bed file, pyranges, pd.DataFrame or
+        list of Interval. Only junctions overlapping with regions are scored
+        and variants are fetched with the tabix index of the vcf file.
+      prefilter: skip variant-junction pairs of which the alternative
+        sequence is identical to the reference in all modules not masked.
+      genotypes: add (batch, samples) int8 matrix of alt allele counts
+        of samples to metadata of variants as `genotype`.
+      samples: subset of samples of vcf file for genotypes.
     """
 
     def __init__(self, intron_annotation, fasta_file, vcf_file,
                  event_type, split_seq=True, encode=True,
-                 overhang=(100, 100), seq_spliter=None, exon_len=100):
+                 overhang=(100, 100), seq_spliter=None, exon_len=100,
+                 regions=None, prefilter=False, genotypes=False,
+                 samples=None):
         self.event_type = event_type
         pr_exons = self._read_junction(intron_annotation, event_type,
                                        overhang, exon_len)
         super().__init__(pr_exons, intron_annotation, fasta_file, vcf_file,
                          split_seq, encode, overhang, seq_spliter,
-                         interval_attrs=('junction',))
+                         interval_attrs=('junction',), regions=regions,
+                         prefilter=prefilter, genotypes=genotypes,
+                         samples=samples)
+
+    @property
+    def _mask_module(self):
+        if self.event_type == 'psi5':
+            return ['donor', 'donor_intron']
+        else:
+            return ['acceptor', 'acceptor_intron']
+
+    def _exon_overhangs(self, exon_index):
+        # ---...*--- overhang on the left side of exon
+        left = (self.matcher.exons['Strand'][exon_index] == '+') \
+            == (self.event_type == 'psi5')
+        return np.stack([np.where(left, self.overhang[0], 0),
+                         np.where(left, 0, self.overhang[1])], axis=1)
 
     @staticmethod
     def _read_junction(intron_annotation, event_type, overhang=(100, 100), exon_len=100):
@@ -203,12 +229,7 @@ class _JunctionVCFDataloader(SplicingVCFMixin, SampleIterator):
         exon._start += overhang[0]
         exon._end -= overhang[1]
 
-        if self.event_type == 'psi5':
-            mask = ['donor', 'donor_intron']
-        else:
-            mask = ['acceptor', 'acceptor_intron']
-
-        row = self._next(exon, variant, overhang, mask)
+        row = self._next(exon, variant, overhang, self._mask_module)
 
         return row
 
@@ -445,3 +445,36 @@ class SplineWeight1D(Layer):
         w = self.get_weights()[0]
         pos_effect = np.dot(self.X_spline, w)
         return {"positional_effect": pos_effect, "positions": self.positions}
+
+
+class PositionalWeight1D(Layer):
+    """Constant positional weight of activations of 1D convolutions,
+    inference equivalent of `SplineWeight1D` with precomputed spline track:
+    `x^{out}_{ijk} = x^{in}_{ijk} * w_{jk}`
+    # Arguments
+        n_tracks: int; Number of weight tracks, 1 if splines are shared
+    across filters otherwise number of filters.
+    """
+
+    def __init__(self, n_tracks=1, **kwargs):
+        self.n_tracks = n_tracks
+        super(PositionalWeight1D, self).__init__(**kwargs)
+
+    def build(self, input_shape):
+        self.track = self.add_weight(shape=(int(input_shape[1]),
+                                            self.n_tracks),
+                                     initializer='ones',
+                                     name='track',
+                                     trainable=False)
+        super(PositionalWeight1D, self).build(input_shape)
+
+    def call(self, x):
+        return self.track * x
+
+    def compute_output_shape(self, input_shape):
+        return input_shape
+
+    def get_config(self):
+        config = {'n_tracks': self.n_tracks}
+        base_config = super(PositionalWeight1D, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
@@ -0,0 +1,144 @@
+import numpy as np
+from pkg_resources import resource_filename
+
+LINEAR_HEADS_FILE = resource_filename('mmsplice', 'models/linear_heads.npz')
+
+HEADS = ('delta_logit_psi', 'pathogenicity', 'efficiency')
+
+
+class LinearHeads:
+    """
+    Linear heads of mmsplice on modular predictions as plain NumPy arrays.
+
+    All heads are computed in one pass over ref and alt modular
+    predictions: the difference `X_alt - X_ref` and overlap indicators
+    (see `mmsplice.utils.transform`) are computed once and heads are
+    three matrix products with stacked coefficients of the heads.
+
+    Args:
+      delta_logit_psi_coef: (8,) coefficients of
+        `transform(X_alt - X_ref, region_only=False)`.
+      delta_logit_psi_intercept: intercept of delta_logit_psi.
+      pathogenicity_coef: (13,) coefficients of logit of pathogenicity
+        for `[X_ref, X_alt,
+        transform(X_alt - X_ref, region_only=True)[:, -3:]]`.
+      pathogenicity_intercept: intercept of logit of pathogenicity.
+      efficiency_coef: (4,) coefficients of
+        `transform(X_alt - X_ref, region_only=False)[:, [1, 2, 3, 5]]`.
+      efficiency_intercept: intercept of efficiency.
+    """
+
+    def __init__(self, delta_logit_psi_coef, delta_logit_psi_intercept,
+                 pathogenicity_coef, pathogenicity_intercept,
+                 efficiency_coef, efficiency_intercept):
+        self.delta_logit_psi_coef = np.asarray(
+            delta_logit_psi_coef, dtype='float64')
+        self.delta_logit_psi_intercept = float(delta_logit_psi_intercept)
+        self.pathogenicity_coef = np.asarray(
+            pathogenicity_coef, dtype='float64')
+        self.pathogenicity_intercept = float(pathogenicity_intercept)
+        self.efficiency_coef = np.asarray(efficiency_coef, dtype='float64')
+        self.efficiency_intercept = float(efficiency_intercept)
+
+        delta, patho, eff = (self.delta_logit_psi_coef,
+                             self.pathogenicity_coef, self.efficiency_coef)
+
+        # coefficients of X_ref (5, heads)
+        self._W_ref = np.zeros((5, 3))
+        self._W_ref[:, 1] = patho[:5] + patho[5:10]
+
+        # coefficients of X_alt - X_ref (5, heads)
+        self._W_diff = np.zeros((5, 3))
+        self._W_diff[:, 0] = delta[:5]
+        self._W_diff[:, 1] = patho[5:10]
+        self._W_diff[[1, 2, 3], 2] = eff[:3]
+
+        # coefficients of overlap terms (6, heads) as
+        # [exon, donor_intron, acceptor_intron] weighted by
+        # difference of module followed by their indicators.
+        self._W_overlap = np.zeros((6, 3))
+        self._W_overlap[:3, 0] = delta[5:]
+        self._W_overlap[0, 2] = eff[3]
+        self._W_overlap[3:, 1] = patho[10:]
+
+        self._intercept = np.array([self.delta_logit_psi_intercept,
+                                    self.pathogenicity_intercept,
+                                    self.efficiency_intercept])
+
+    @classmethod
+    def load(cls, path=LINEAR_HEADS_FILE):
+        """
+        Load coefficients of heads from npz file.
+        """
+        with np.load(str(path)) as arrays:
+            return cls(**arrays)
+
+    def save(self, path):
+        """
+        Save coefficients of heads to npz file.
+        """
+        with open(str(path), 'wb') as f:
+            np.savez(
+                f,
+                delta_logit_psi_coef=self.delta_logit_psi_coef,
+                delta_logit_psi_intercept=self.delta_logit_psi_intercept,
+                pathogenicity_coef=self.pathogenicity_coef,
+                pathogenicity_intercept=self.pathogenicity_intercept,
+                efficiency_coef=self.efficiency_coef,
+                efficiency_intercept=self.efficiency_intercept)
+
+    @classmethod
+    def from_sklearn(cls, linear_model, logistic_model, efficiency_model):
+        """
+        Export heads from sklearn models of mmsplice such as
+          `mmsplice.utils.LINEAR_MODEL`, `LOGISTIC_MODEL` and
+          `EFFICIENCY_MODEL`. Standard scaler of pathogenicity pipeline
+          is folded into its coefficients.
+        """
+        steps = dict(logistic_model.steps)
+        scaler, logistic = steps['preproc'], steps['model']
+        coef = logistic.coef_[0] / scaler.scale_
+        intercept = logistic.intercept_[0] - np.dot(coef, scaler.mean_)
+
+        return cls(linear_model.coef_, linear_model.intercept_,
+                   coef, intercept,
+                   efficiency_model.coef_, efficiency_model.intercept_)
+
+    def predict(self, X_ref, X_alt, heads=HEADS):
+        """
+        Predict heads from modular predictions.
+
+        Args:
+          X_ref: (n, 5) modular predictions of reference sequences.
+          X_alt: (n, 5) modular predictions of alternative sequences.
+          heads: heads to predict, subset of `HEADS`.
+
+        Returns:
+          dict of head name to (n,) predictions.
+        """
+        unknown = set(heads).difference(HEADS)
+        if unknown:
+            raise ValueError('Unknown heads: %s' % ', '.join(sorted(unknown)))
+        cols = [HEADS.index(h) for h in heads]
+
+        X_ref = np.asarray(X_ref)
+        X_diff = np.asarray(X_alt) - X_ref
+
+        # same as `~np.isclose(X_diff, 0)` of `transform`
+        changed = ~(np.abs(X_diff) <= 1e-8)
+        overlap = np.empty((len(X_diff), 6), dtype=X_diff.dtype)
+        overlap[:, 3] = (changed[:, 1] & changed[:, 2]) \
+            | (changed[:, 2] & changed[:, 3])
+        overlap[:, 4] = changed[:, 3] & changed[:, 4]
+        overlap[:, 5] = changed[:, 0] & changed[:, 1]
+        np.multiply(X_diff[:, [2, 4, 0]], overlap[:, 3:], out=overlap[:, :3])
+
+        pred = X_diff @ self._W_diff[:, cols] \
+            + overlap @ self._W_overlap[:, cols] \
+            + self._intercept[cols]
+        if 'pathogenicity' in heads:
+            pred += X_ref @ self._W_ref[:, cols]
+            i = heads.index('pathogenicity')
+            pred[:, i] = 1 / (1 + np.exp(-pred[:, i]))
+
+        return {h: pred[:, i] for i, h in enumerate(heads)}
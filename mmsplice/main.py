@@ -1,5 +1,6 @@
 import sys
 import json
+from pathlib import Path
 
 import click
 import numpy as np
@@ -46,5 +47,253 @@ def run():
         sys.stdout.flush()
 
 
+@cli.command(name='precompute-snv')
+@click.option('--annotation', required=True,
+              help="'grch37', 'grch38' or path of gtf file.")
+@click.option('--fasta', required=True, help='Fasta file of the genome.')
+@click.option('--output', required=True, help='Directory of SNV table.')
+@click.option('--regions', default=None,
+              help='Bed file of target regions to restrict exons.')
+@click.option('--batch-size', default=512, type=int,
+              help='Number of sequences in a batch.')
+@click.option('--n-jobs', default=1, type=int,
+              help='Number of processes scoring chromosomes.')
+def precompute_snv(annotation, fasta, output, regions, batch_size, n_jobs):
+    '''
+    Precompute scores of all SNVs in exon windows of annotation
+    for `SplicingVCFDataloader(..., lookup=output)`.
+    '''
+    from mmsplice.snv_table import build_snv_table
+    build_snv_table(annotation, fasta, output, regions=regions,
+                    batch_size=batch_size, n_jobs=n_jobs)
+
+
+@cli.command(name='quantize')
+@click.option('--deep/--no-deep', default=True,
+              help='Quantize deep or shallow MTSplice ensemble.')
+@click.option('--report', default=None,
+              help='Write accuracy and throughput report as csv.')
+@click.option('--num-variants', default=2000, type=int,
+              help='Number of random SNVs of the report.')
+@click.option('--annotation', default=None,
+              help="'grch37', 'grch38' or path of gtf file of exons of"
+              " the report, bundled calibration exons if not given.")
+@click.option('--fasta', default=None,
+              help='Fasta file of the genome of --annotation.')
+def quantize(deep, report, num_variants, annotation, fasta):
+    '''
+    Quantize MMSplice and MTSplice models to int8 into the cache and
+    compare them to float32 models.
+    '''
+    from mmsplice.mtsplice import MTSplice
+    from mmsplice.quantization import quantization_report, \
+        calibration_exon_windows
+
+    if (annotation is None) != (fasta is None):
+        raise click.UsageError('--annotation and --fasta should be'
+                               ' given together')
+    exons = None
+    if annotation is not None:
+        exons = calibration_exon_windows(annotation, fasta)
+
+    df = quantization_report(
+        MMSplice(deep=deep), MMSplice(deep=deep, quantized=True),
+        MTSplice(deep=deep), MTSplice(deep=deep, quantized=True),
+        num_variants=num_variants, exons=exons)
+    click.echo(df.to_string())
+    if report:
+        df.to_csv(report)
+
+
+@cli.command(name='export')
+@click.option('--output', required=True, help='Directory of artifacts.')
+@click.option('--deep/--no-deep', default=True,
+              help='Export deep or shallow MTSplice ensemble.')
+@click.option('--tflite/--no-tflite', default=True,
+              help='Convert SavedModels to TFLite.')
+def export(output, deep, tflite):
+    '''
+    Export MMSplice and MTSplice as SavedModel and TFLite artifacts
+    to load with `MMSplice(artifacts=output)`.
+    '''
+    from mmsplice.export import export_artifacts
+    export_artifacts(output, deep=deep, tflite=tflite)
+
+
+_FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.vcf': 'vcf'}
+
+
+def _output_format(output, output_format):
+    suffixes = [i.lower() for i in Path(output).suffixes]
+    if suffixes[-2:] == ['.vcf', '.gz']:
+        suffixes.pop()
+    suffix = suffixes[-1] if suffixes else ''
+
+    if output_format is None:
+        if suffix not in _FORMATS:
+            raise click.BadParameter(
+                'format cannot be inferred from output, use --format',
+                param_hint='--output')
+        return _FORMATS[suffix]
+    if suffix != '.' + output_format:
+        raise click.BadParameter(
+            'output of %s format should end with .%s'
+            % (output_format, output_format), param_hint='--output')
+    return output_format
+
+
+def _dataloader(dataloader, annotation, fasta, vcf, exons, regions,
+                tissue_specific):
+    from mmsplice.vcf_dataloader import SplicingVCFDataloader
+    from mmsplice.exon_dataloader import ExonDataset
+    from mmsplice.junction_dataloader import JunctionPSI5Dataset, \
+        JunctionPSI3Dataset, JunctionPSI5VCFDataloader, \
+        JunctionPSI3VCFDataloader
+
+    junction = dataloader in {'psi5', 'psi3'}
+    if junction and tissue_specific:
+        raise click.UsageError('Junction dataloaders do not support'
+                               ' tissue specific predictions')
+
+    if vcf is not None:
+        if annotation is None:
+            raise click.UsageError('--annotation is required with --vcf')
+        if dataloader == 'exon':
+            raise click.UsageError('--vcf cannot be used with'
+                                   ' `exon` dataloader, use --exons')
+        if dataloader == 'vcf':
+            return SplicingVCFDataloader(annotation, fasta, vcf,
+                                         tissue_specific=tissue_specific,
+                                         regions=regions)
+        cls = {'psi5': JunctionPSI5VCFDataloader,
+               'psi3': JunctionPSI3VCFDataloader}[dataloader]
+        return cls(annotation, fasta, vcf, regions=regions)
+
+    if exons is None or dataloader == 'vcf':
+        raise click.UsageError('--vcf is required with `vcf` dataloader and'
+                               ' --exons with other dataloaders')
+    if regions is not None:
+        raise click.UsageError('--regions requires --vcf')
+    if dataloader == 'exon':
+        return ExonDataset(exons, fasta, tissue_specific=tissue_specific)
+    cls = {'psi5': JunctionPSI5Dataset,
+           'psi3': JunctionPSI3Dataset}[dataloader]
+    return cls(exons, fasta)
+
+
+@cli.command(name='predict')
+@click.option('--dataloader', type=click.Choice(['vcf', 'exon', 'psi5',
+                                                 'psi3']),
+              default='vcf', show_default=True,
+              help='Variant-exon pairs of vcf and gtf (`vcf`), exon file'
+              ' (`exon`) or junctions of 5\' or 3\' splice sites'
+              ' (`psi5`, `psi3`) of intron annotation with --vcf'
+              ' or of junction file with --exons.')
+@click.option('--fasta', required=True, help='Fasta file of the genome.')
+@click.option('--vcf', default=None, help='Vcf file of variants.')
+@click.option('--annotation', default=None,
+              help="'grch37', 'grch38' or path of gtf file (`vcf`) or"
+              " intron annotation (`psi5`, `psi3`).")
+@click.option('--exons', default=None,
+              help='Csv file of variant-exon or variant-junction pairs.')
+@click.option('--output', required=True,
+              help='Csv file, directory of parquet files or vcf file.')
+@click.option('--format', 'output_format', default=None,
+              type=click.Choice(['csv', 'parquet', 'vcf']),
+              help='Output format, inferred from suffix of output if not'
+              ' given. Vcf output annotates --vcf with `mmsplice` INFO.')
+@click.option('--regions', default=None,
+              help='Bed file of target regions to restrict exons.')
+@click.option('--batch-size', default=512, type=int, show_default=True,
+              help='Number of sequences in a batch.')
+@click.option('--workers', default=None, type=int,
+              help='Number of worker processes running inference.')
+@click.option('--tissue-specific/--no-tissue-specific', default=False,
+              help='Predict tissue specific effects with MTSplice.')
+@click.option('--tissue', 'tissues', multiple=True,
+              help='Tissue of MTSplice to output, all tissues if not'
+              ' given. Implies --tissue-specific. Can be repeated.')
+@click.option('--natural-scale', is_flag=True,
+              help='Add delta PSI of tissues on natural scale.'
+              ' Implies --tissue-specific.')
+@click.option('--ref-psi-version', default=None,
+              type=click.Choice(['grch37', 'grch38']),
+              help='Reference PSI of --natural-scale,'
+              ' --annotation if not given.')
+@click.option('--column', 'columns', multiple=True,
+              help='Output column, all columns if not given.'
+              ' Can be repeated.')
+@click.option('--pathogenicity', is_flag=True,
+              help='Add pathogenicity column.')
+@click.option('--splicing-efficiency', is_flag=True,
+              help='Add splicing efficiency column.')
+@click.option('--deep/--no-deep', default=True,
+              help='Deep or shallow MTSplice ensemble.')
+@click.option('--quantized', is_flag=True,
+              help='Use int8 quantized models.')
+@click.option('--optimize', is_flag=True,
+              help='Fold constant subgraphs of models.')
+@click.option('--artifacts', default=None,
+              help='Directory of exported models of `mmsplice export`.')
+@click.option('--resume', is_flag=True,
+              help='Continue interrupted csv or parquet output.')
+@click.option('--profile', default=None,
+              help='Write time of each stage as json summary.')
+@click.option('--progress/--no-progress', default=True,
+              help='Show progress bar.')
+def predict(dataloader, fasta, vcf, annotation, exons, output,
+            output_format, regions, batch_size, workers, tissue_specific,
+            tissues, natural_scale, ref_psi_version, columns, pathogenicity,
+            splicing_efficiency, deep, quantized, optimize, artifacts,
+            resume, profile, progress):
+    '''
+    Predict variant effects of a dataloader and stream predictions
+    to csv, parquet or vcf output batch by batch.
+    '''
+    from mmsplice import predict_save, predict_vcf
+    from mmsplice.profiler import StageProfiler
+
+    output_format = _output_format(output, output_format)
+    if output_format == 'vcf':
+        if vcf is None:
+            raise click.UsageError('vcf output requires --vcf')
+        if resume:
+            raise click.UsageError('--resume is only supported with csv'
+                                   ' and parquet output')
+
+    tissue_specific = tissue_specific or bool(tissues) or natural_scale
+    if natural_scale and ref_psi_version is None:
+        if annotation not in {'grch37', 'grch38'}:
+            raise click.UsageError('--ref-psi-version is required with'
+                                   ' --natural-scale')
+        ref_psi_version = annotation
+
+    try:
+        model = MMSplice(deep=deep, quantized=quantized,
+                         artifacts=artifacts, optimize=optimize)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    dl = _dataloader(dataloader, annotation, fasta, vcf, exons, regions,
+                     tissue_specific)
+    profiler = StageProfiler() if profile else None
+
+    kwargs = dict(
+        batch_size=batch_size, progress=progress, profiler=profiler,
+        pathogenicity=pathogenicity,
+        splicing_efficiency=splicing_efficiency,
+        natural_scale=natural_scale, ref_psi_version=ref_psi_version,
+        columns=list(columns) or None, tissues=list(tissues) or None,
+        workers=workers)
+    if output_format == 'vcf':
+        predict_vcf(model, dl, output, **kwargs)
+    else:
+        predict_save(model, dl, output, resume=resume, **kwargs)
+
+    if profiler:
+        with open(profile, 'w') as f:
+            json.dump(profiler.summary(), f, indent=2)
+        profiler.close()
+
+
 if __name__ == '__main__':
     cli()
@@ -1,21 +1,29 @@
+import time
+import logging
+import itertools
 import warnings
+from contextlib import ExitStack
 from pkg_resources import resource_filename
 from tqdm import tqdm
 import numpy as np
 import pandas as pd
 from tensorflow.keras.models import load_model
-from sklearn.externals import joblib
 from pathlib import Path
 import pathlib
 # import concise
-from mmsplice.utils import logit, predict_deltaLogitPsi, \
-    predict_pathogenicity, predict_splicing_efficiency, encodeDNA, \
-    read_ref_psi_annotation, delta_logit_PSI_to_delta_PSI, \
+from mmsplice.utils import logit, encodeDNA, LINEAR_HEADS, \
+    encode_index, mutagenesis_batches, N_INDEX, \
+    RefPSIStore, delta_logit_PSI_to_delta_PSI, genotype_delta_psi, \
     mmsplice_ref_modules, mmsplice_alt_modules, \
-    df_batch_writer, df_batch_writer_parquet
-from mmsplice.exon_dataloader import SeqSpliter
+    df_batch_writer, df_batch_writer_parquet, read_progress, write_progress
+from mmsplice.exon_dataloader import SeqSpliter, modules
+# re-exported by `mmsplice`
+from mmsplice.utils import LINEAR_MODEL, LOGISTIC_MODEL, \
+    EFFICIENCY_MODEL  # noqa: F401
 from mmsplice.mtsplice import MTSplice, tissue_names
 from mmsplice.layers import GlobalAveragePooling1D_Mask0, ConvDNA
+from mmsplice.autotune import BatchSizeTuner
+from mmsplice.profiler import NULL_PROFILER
 
 
 ACCEPTOR_INTRON = resource_filename('mmsplice', 'models/Intron3.h5')
@@ -24,14 +32,10 @@ EXON = resource_filename('mmsplice', 'models/Exon.h5')
 EXON3 = resource_filename('mmsplice', 'models/Exon_prime3.h5')
 ACCEPTOR = resource_filename('mmsplice', 'models/Acceptor.h5')
 DONOR_INTRON = resource_filename('mmsplice', 'models/Intron5.h5')
-LINEAR_MODEL = joblib.load(resource_filename(
-    'mmsplice', 'models/linear_model.pkl'))
-LOGISTIC_MODEL = joblib.load(resource_filename(
-    'mmsplice', 'models/Pathogenicity.pkl'))
-EFFICIENCY_MODEL = joblib.load(resource_filename(
-    'mmsplice', 'models/splicing_efficiency.pkl'))
 
 
+logger = logging.getLogger('mmsplice')
+
 custom_objects = {
     'ConvDNA': ConvDNA
 }
@@ -50,7 +54,15 @@ class MMSplice(object):
       donorM: donor splice site model, score donor sequence
         with 13bp in the intron, 5bp in the exon.
       donor_intronM: donor intron model, score donor intron sequence.
+      quantized: load int8 quantized modules, see `mmsplice.quantization`.
+      compiled: compile modules with XLA for length buckets at startup,
+        see `mmsplice.compiled`.
+      artifacts: directory of exported artifacts to load the fused
+        modules from instead of keras models, see `mmsplice.export`.
+      optimize: fold constant subgraphs of keras modules at load,
+        see `mmsplice.optimize`.
     """
+    profiler = NULL_PROFILER
 
     def __init__(self,
                  acceptor_intronM=ACCEPTOR_INTRON,
@@ -59,22 +71,79 @@ class MMSplice(object):
                  donorM=DONOR,
                  donor_intronM=DONOR_INTRON,
                  seq_spliter=None,
-                 deep=True):
+                 deep=True,
+                 quantized=False,
+                 compiled=False,
+                 artifacts=None,
+                 optimize=False):
+        if sum(map(bool, [quantized, compiled, artifacts])) > 1:
+            raise ValueError('Only one of `quantized`, `compiled` and'
+                             ' `artifacts` can be used')
         self.spliter = seq_spliter or SeqSpliter()
-        self.acceptor_intronM = load_model(
-            acceptor_intronM, compile=False,
-            custom_objects=custom_objects)
-        self.acceptorM = load_model(acceptorM, compile=False,
-                                    custom_objects=custom_objects)
-        self.exonM = load_model(exonM, compile=False, custom_objects={
+        self.quantized = quantized
+        self.compiled = compiled
+        self.artifacts = artifacts
+        self.optimize = optimize
+        self.deep = deep
+
+        self.fused = None
+        if artifacts:
+            from mmsplice.export import load_artifact
+            self.fused = load_artifact(artifacts, 'mmsplice')
+            return
+
+        if compiled:
+            from mmsplice.compiled import enable_persistent_cache
+            enable_persistent_cache()
+        self.acceptor_intronM = self._load_module(
+            acceptor_intronM, 'acceptor_intron')
+        self.acceptorM = self._load_module(acceptorM, 'acceptor')
+        self.exonM = self._load_module(exonM, 'exon', {
             "GlobalAveragePooling1D_Mask0": GlobalAveragePooling1D_Mask0,
             'ConvDNA': ConvDNA
         })
-        self.donorM = load_model(donorM, compile=False,
-                                 custom_objects=custom_objects)
-        self.donor_intronM = load_model(donor_intronM, compile=False,
-                                        custom_objects=custom_objects)
-        self.deep = deep
+        self.donorM = self._load_module(donorM, 'donor')
+        self.donor_intronM = self._load_module(donor_intronM, 'donor_intron')
+        if compiled:
+            self.warmup()
+
+    def _load_module(self, model_file, module, custom_objects=custom_objects):
+        if self.quantized:
+            from mmsplice.quantization import load_quantized, \
+                calibration_inputs
+            return load_quantized(
+                model_file,
+                lambda: [calibration_inputs(self.spliter)[module]],
+                custom_objects=custom_objects)
+
+        model = load_model(model_file, compile=False,
+                           custom_objects=custom_objects)
+        if self.optimize:
+            from mmsplice.optimize import optimize_model
+            model = optimize_model(model, custom_objects)
+
+        if self.compiled:
+            from mmsplice.compiled import CompiledModel, LENGTH_BUCKETS
+            # exon model masks zero padded positions so its inputs
+            # can be padded to buckets without changing predictions.
+            return CompiledModel(
+                model, buckets=LENGTH_BUCKETS if module == 'exon' else None)
+        return model
+
+    def warmup(self, overhang=(100, 100)):
+        '''
+        Trace and compile models of compiled modules for each length
+          bucket of exons with `overhang`.
+        '''
+        from mmsplice.compiled import LENGTH_BUCKETS
+        start = time.perf_counter()
+        for bucket in LENGTH_BUCKETS:
+            length = sum(overhang) + bucket
+            self.predict_modular_scores_on_batch(self.spliter.split_batch(
+                np.zeros((1, length), dtype='uint8'), [length], [overhang],
+                pattern_warning=False))
+        logger.info('Compiled modules for %d exon length buckets in %.1fs'
+                    % (len(LENGTH_BUCKETS), time.perf_counter() - start))
 
     def predict_on_batch(self, batch):
         warnings.warn(
@@ -84,24 +153,45 @@ class MMSplice(object):
         )
         return self.predict_modular_scores_on_batch(batch)
 
-    def predict_modular_scores_on_batch(self, batch):
+    def predict_modular_scores_on_batch(self, batch, batch_size=None):
         '''
         Perform prediction on batch of dataloader.
 
         Args:
           batch: batch of dataloader.
+          batch_size: inference batch size of modules,
+            default of keras if None.
 
         Returns:
           np.matrix of modular predictions
           as [[acceptor_intronM, acceptor, exon, donor, donor_intron]]
 
         '''
+        if self.fused is not None:
+            with self.profiler.stage('inference/fused', len(batch['exon'])):
+                return self.fused.predict([batch[m] for m in modules],
+                                          batch_size=batch_size)
+
+        models = [
+            ('acceptor_intron', self.acceptor_intronM),
+            ('acceptor', self.acceptorM),
+            ('exon', self.exonM),
+            ('donor', self.donorM),
+            ('donor_intron', self.donor_intronM)
+        ]
+        scores = list()
+        for module, model in models:
+            with self.profiler.stage('inference/%s' % module,
+                                     len(batch[module])):
+                scores.append(model.predict(batch[module],
+                                            batch_size=batch_size))
+
         score = np.concatenate([
-            self.acceptor_intronM.predict(batch['acceptor_intron']),
-            logit(self.acceptorM.predict(batch['acceptor'])),
-            self.exonM.predict(batch['exon']),
-            logit(self.donorM.predict(batch['donor'])),
-            self.donor_intronM.predict(batch['donor_intron'])
+            scores[0],
+            logit(scores[1]),
+            scores[2],
+            logit(scores[3]),
+            scores[4]
         ], axis=1)
         return score
 
@@ -128,59 +218,139 @@ class MMSplice(object):
         batch = {k: encodeDNA([v]) for k, v in batch.items()}
         return self.predict_modular_scores_on_batch(batch)[0]
 
-    def _predict_batch(self, batch, optional_metadata=None):
+    def saturation_mutagenesis(self, seq, overhang=(100, 100),
+                               deletions=False, batch_size=512):
+        """
+        delta_logit_psi of all single base substitutions of overhanged
+          exon sequence. Mutated sequences are generated as index encoded
+          batches and scored against the reference scores computed once.
+
+        Args:
+          seq (str): sequence of overhanged exon.
+          overhang (Tuple[int, int]): overhang of seqeunce.
+          deletions: add 1 bp deletion of each position as 5th column.
+          batch_size: number of mutated sequences scored at once.
+
+        Returns:
+          (len(seq), 4) array of delta_logit_psi of substitutions to
+            A, C, G, T at each position, or (len(seq), 5) with deletions.
+            Reference bases are 0 and positions with `N` are NaN.
+        """
+        index = encode_index(seq.upper())
+        X_ref = self.predict_modular_scores_on_batch(self.spliter.split_batch(
+            index[None], [len(index)], [overhang], pattern_warning=False))
+
+        delta = np.zeros((len(index), 5 if deletions else 4))
+        delta[index == N_INDEX, :4] = np.nan
+
+        for rows, lengths, overhangs, pos, alt in mutagenesis_batches(
+                index, overhang, batch_size, deletions):
+            X_alt = self.predict_modular_scores_on_batch(
+                self.spliter.split_batch(rows, lengths, overhangs,
+                                         pattern_warning=False),
+                batch_size=batch_size)
+            delta[pos, alt] = LINEAR_HEADS.predict(
+                np.broadcast_to(X_ref, X_alt.shape), X_alt,
+                ['delta_logit_psi'])['delta_logit_psi']
+        return delta
+
+    def _predict_scores(self, inputs, batch_size=None, mtsplice=None):
+        '''
+        Model predictions of encoded inputs of batch: modular scores of
+          reference and alternative sequences as `X_ref` and `X_alt`,
+          and tissue predictions of MTSplice as `X_tissue`.
+        '''
+        scores = dict()
+        if 'seq' in inputs:
+            scores['X_ref'] = self.predict_modular_scores_on_batch(
+                inputs['seq'], batch_size=batch_size)
+            scores['X_alt'] = self.predict_modular_scores_on_batch(
+                inputs['mut_seq'], batch_size=batch_size)
+        if mtsplice is not None:
+            with self.profiler.stage('mtsplice',
+                                     len(inputs['tissue_seq']['acceptor'])):
+                scores['X_tissue'] = mtsplice.predict_on_batch(
+                    inputs['tissue_seq'], batch_size=batch_size)
+        return scores
+
+    def _predict_batch(self, batch, scores, optional_metadata=None,
+                       heads=('delta_logit_psi',)):
         optional_metadata = optional_metadata or []
 
-        X_ref = self.predict_modular_scores_on_batch(
-            batch['inputs']['seq'])
-        X_alt = self.predict_modular_scores_on_batch(
-            batch['inputs']['mut_seq'])
-        ref_pred = pd.DataFrame(X_ref, columns=mmsplice_ref_modules)
-        alt_pred = pd.DataFrame(X_alt, columns=mmsplice_alt_modules)
+        if 'lookup' in batch:
+            X_ref, X_alt = self._merge_lookup_scores(batch['lookup'], scores)
+        else:
+            X_ref, X_alt = scores['X_ref'], scores['X_alt']
+
+        with self.profiler.stage('linear_heads', len(X_ref)):
+            heads = LINEAR_HEADS.predict(X_ref, X_alt, heads)
 
-        df = pd.DataFrame({
+        # columns are collected and the dataframe of the batch is
+        # created once to avoid copies of intermediate dataframes.
+        columns = {
             'ID': batch['metadata']['variant']['annotation'],
             'exons': batch['metadata']['exon']['annotation'],
-        })
-
+        }
         for key in optional_metadata:
             for k, v in batch['metadata'].items():
                 if key in v:
-                    df[key] = v[key]
-
-        df['delta_logit_psi'] = predict_deltaLogitPsi(X_ref, X_alt)
-        df = pd.concat([df, ref_pred, alt_pred], axis=1)
-        return df
-
-    def _predict_batch_mtsplice(self, batch, df, mtsplice,
-                                natural_scale, df_ref):
-        X_tissue = mtsplice.predict_on_batch(
-            batch['inputs']['tissue_seq'])
-        X_tissue += np.expand_dims(
-            df['delta_logit_psi'].values, axis=1)
-        tissue_pred = pd.DataFrame(X_tissue, columns=tissue_names)
-        df = pd.concat([df, tissue_pred], axis=1)
-
-        if natural_scale:
-            df_ref = df_ref[df_ref.columns[6:]]
-            df = df.join(df_ref, on='exons', rsuffix='_ref')
-
-            ref_tissue_names = ['%s_ref' % i for i in df_ref.columns]
-
-            delta_psi_pred = pd.DataFrame(
-                delta_logit_PSI_to_delta_PSI(
-                    df[df_ref.columns].values,
-                    df[ref_tissue_names].values
-                ), columns=['%s_delta_psi' % i
-                            for i in df_ref.columns])
-            df.reset_index(drop=True, inplace=True)
-            delta_psi_pred.reset_index(drop=True, inplace=True)
-            df = pd.concat([df, delta_psi_pred], axis=1)
-        return df
+                    columns[key] = v[key]
+
+        columns['delta_logit_psi'] = heads['delta_logit_psi']
+        columns.update(zip(mmsplice_ref_modules, X_ref.T))
+        columns.update(zip(mmsplice_alt_modules, X_alt.T))
+        return columns, heads
+
+    @staticmethod
+    def _merge_lookup_scores(lookup, scores):
+        '''
+        Modular scores of batch with precomputed scores of some samples,
+          only the remaining samples are predicted by the models.
+        '''
+        n = len(lookup['index']) + len(lookup['model_index'])
+        X_ref = np.empty((n, 5), dtype=lookup['scores'].dtype)
+        X_alt = np.empty((n, 5), dtype=lookup['scores'].dtype)
+        X_ref[lookup['index']] = lookup['scores'][:, 0]
+        X_alt[lookup['index']] = lookup['scores'][:, 1]
+
+        if len(lookup['model_index']):
+            X_ref[lookup['model_index']] = scores['X_ref']
+            X_alt[lookup['model_index']] = scores['X_alt']
+        return X_ref, X_alt
+
+    def _predict_batch_mtsplice(self, batch, columns, X_tissue,
+                                natural_scale, ref_psi,
+                                tissues=tissue_names):
+        delta_logit_psi = columns['delta_logit_psi']
+        if tissues != tissue_names:
+            X_tissue = X_tissue[:, [tissue_names.index(i) for i in tissues]]
+        X_tissue += np.expand_dims(delta_logit_psi, axis=1)
+        columns.update(zip(tissues, X_tissue.T))
+
+        ref_tissues = [i for i in ref_psi.tissues if i in columns] \
+            if natural_scale else []
+        if ref_tissues:
+            with self.profiler.stage('ref_psi', len(delta_logit_psi)):
+                exon = batch['metadata']['exon']
+                X_ref = ref_psi.gather(exon['chrom'], exon['start'],
+                                       exon['end'], exon['strand'],
+                                       tissues=ref_tissues)
+                delta_psi = delta_logit_PSI_to_delta_PSI(
+                    np.stack([columns[i] for i in ref_tissues], axis=1),
+                    X_ref)
+            columns.update(zip(['%s_ref' % i for i in ref_tissues],
+                               X_ref.T))
+            columns.update(zip(['%s_delta_psi' % i for i in ref_tissues],
+                               delta_psi.T))
+        return columns
 
     def _predict_on_dataloader(self, dataloader, batch_size=512, progress=True,
                                pathogenicity=False, splicing_efficiency=False,
-                               natural_scale=False, ref_psi_version=None):
+                               natural_scale=False, ref_psi_version=None,
+                               autotune=False, profiler=None,
+                               bounded_memory=False, dtype=None,
+                               columns=None, tissues=None, per_sample=False,
+                               workers=None):
         """
         Make prediction from a dataloader, return results as a table
 
@@ -190,6 +360,24 @@ class MMSplice(object):
            progress: show progress bar.
            pathogenicity: adds pathogenicity prediction as column
            splicing_efficiency: adds splicing_efficiency prediction as column
+           autotune: tune inference batch size of models (up to
+             `batch_size`) for each exon length, see `BatchSizeTuner`.
+           profiler: `mmsplice.profiler.StageProfiler` to record time
+             of each stage per batch.
+           bounded_memory: store predictions as float32.
+           dtype: float dtype of predictions (e.g. 'float32' or 'float16'),
+             float64 if None.
+           columns: output columns in order, all columns if None.
+           tissues: tissues of MTSplice to output, all tissues if None.
+             Only tissues in `tissues` and referenced by `columns`
+             (as `<tissue>`, `<tissue>_ref` or `<tissue>_delta_psi`)
+             are materialized.
+           per_sample: return long-form table of non-reference carriers
+             of variants with `sample` and `genotype` columns, see
+             `carriers_table`. Dataloader should be created with
+             `genotypes=True`.
+           workers: number of worker processes running inference,
+             inference runs in this process if None, see `WorkerPool`.
 
         Returns:
            iterator of pd.DataFrame includes modular prediction,
@@ -199,44 +387,152 @@ class MMSplice(object):
         assert isinstance(dataloader, ExonSplicingMixin), \
             "Unknown dataloader type"
 
+        mtsplice = None
+        ref_psi = None
         if dataloader.tissue_specific:
-            mtsplice = MTSplice(deep=self.deep)
+            mtsplice = MTSplice(deep=self.deep, quantized=self.quantized,
+                                compiled=self.compiled,
+                                artifacts=self.artifacts,
+                                optimize=self.optimize)
             if natural_scale:
-                df_ref = read_ref_psi_annotation(
-                    ref_psi_version, set(dataloader.vcf.seqnames))
-            else:
-                df_ref = None
+                ref_psi = RefPSIStore.load(ref_psi_version)
         else:
             if natural_scale:
                 warnings.warn("`natural_scale=True` will be ignored"
                               " because `dataloader.tissue_specific=False`")
 
-        dt_iter = dataloader.batch_iter(batch_size=batch_size)
-        if progress:
-            dt_iter = tqdm(dt_iter)
-
-        for batch in dt_iter:
-            df = self._predict_batch(
-                batch, dataloader.optional_metadata)
-            X_ref = df[mmsplice_ref_modules].values
-            X_alt = df[mmsplice_alt_modules].values
+        if dtype is None and bounded_memory:
+            dtype = 'float32'
+        if dtype is not None and np.dtype(dtype).kind != 'f':
+            raise ValueError('dtype should be a float dtype')
+        tissues = output_tissues(tissues, columns)
+        if per_sample and not getattr(dataloader, 'genotypes', False):
+            raise ValueError('`per_sample=True` requires dataloader'
+                             ' with `genotypes=True`')
+
+        heads = ['delta_logit_psi']
+        if pathogenicity:
+            heads.append('pathogenicity')
+        if splicing_efficiency:
+            heads.append('efficiency')
+
+        if not tissues:
+            mtsplice = None
+        if autotune and workers:
+            warnings.warn('`autotune=True` is ignored with `workers`')
+            autotune = False
+
+        profiler = profiler or NULL_PROFILER
+        self.profiler = profiler
+        dataloader.set_profiler(profiler)
+
+        # workers are terminated when predictions are interrupted
+        # by an exception or the iterator is closed.
+        with ExitStack() as stack:
+            if workers:
+                from mmsplice.parallel import WorkerPool
+                pool = stack.enter_context(WorkerPool(self, mtsplice, workers))
+                # batches are sent to workers asynchronously,
+                # so buffers of encoded batches cannot be reused.
+                dt_iter = pool.scored_batches(
+                    dataloader.batch_iter(batch_size=batch_size),
+                    profiler=profiler)
+            else:
+                dt_iter = self._scored_batches(
+                    dataloader.batch_iter(batch_size=batch_size,
+                                          reuse_buffers=True),
+                    mtsplice, autotune)
+            if progress:
+                dt_iter = tqdm(dt_iter)
+
+            try:
+                for batch, scores in dt_iter:
+                    batch_columns, batch_heads = self._predict_batch(
+                        batch, scores, dataloader.optional_metadata, heads)
+
+                    if mtsplice is not None:
+                        batch_columns = self._predict_batch_mtsplice(
+                            batch, batch_columns, scores['X_tissue'],
+                            natural_scale, ref_psi, tissues)
+                    del scores
+
+                    for head in heads[1:]:
+                        batch_columns[head] = batch_heads[head]
+
+                    if columns is not None:
+                        batch_columns = _select_columns(batch_columns, columns)
+
+                    with profiler.stage('dataframe',
+                                        len(batch_heads['delta_logit_psi'])):
+                        df = _columns_to_frame(batch_columns, dtype)
+                    del batch_columns, batch_heads
+
+                    num_samples = len(df)
+                    if per_sample:
+                        with profiler.stage('genotypes', len(df)):
+                            df = carriers_table(
+                                df, batch['metadata']['variant']['genotype'],
+                                dataloader.samples)
+                    # number of dataloader samples of the batch to resume
+                    # after written rows, see `predict_save`.
+                    df.attrs['samples'] = num_samples
+
+                    profiler.count('samples', len(df))
+                    profiler.count('output_bytes',
+                                   int(df.memory_usage(index=False).sum()))
+                    yield df
+                    profiler.end_batch()
+            finally:
+                self.profiler = NULL_PROFILER
+                dataloader.set_profiler(None)
+
+    def _scored_batches(self, batches, mtsplice=None, autotune=False):
+        '''
+        Iterate (batch, scores) of batches predicted in this process,
+          see `_predict_scores`.
+        '''
+        tuner = BatchSizeTuner() if autotune else None
+        inference_batch_size = None
+        for batch in batches:
+            if tuner and 'seq' in batch['inputs']:
+                inference_batch_size = tuner.batch_size(
+                    self, batch['inputs']['seq'])
+            yield batch, self._predict_scores(
+                batch['inputs'], inference_batch_size, mtsplice)
+
+    def predict_parallel(self, dataloader, workers=2, batch_size=512,
+                         **kwargs):
+        """
+        Predict dataloader with inference in `workers` processes.
 
-            if dataloader.tissue_specific:
-                df = self._predict_batch_mtsplice(
-                    batch, df, mtsplice, natural_scale, df_ref)
+        The dataloader is iterated in this process, so annotations and
+        reference PSI tables are loaded once. Models of this instance
+        are sent to each worker once at startup and workers predict
+        disjoint batches, see `mmsplice.parallel`.
+        At most two batches per worker are in flight, so memory is
+        bounded by the batch size rather than the number of variants.
 
-            if pathogenicity:
-                df['pathogenicity'] = predict_pathogenicity(
-                    X_ref, X_alt)
-            if splicing_efficiency:
-                df['efficiency'] = predict_splicing_efficiency(
-                    X_ref, X_alt)
+        Args:
+          dataloader: dataloader object.
+          workers: number of worker processes.
+          batch_size: number of samples in a batch.
+          kwargs: arguments of `predict_on_dataloader` except `max_rows`
+            and `spill_path`.
 
-            yield df
+        Returns:
+          iterator of pd.DataFrame of predictions of batches in order
+            of the dataloader.
+        """
+        return self._predict_on_dataloader(
+            dataloader, batch_size=batch_size, workers=workers, **kwargs)
 
     def predict_on_dataloader(self, dataloader, batch_size=512, progress=True,
                               pathogenicity=False, splicing_efficiency=False,
-                              natural_scale=False, ref_psi_version=None):
+                              natural_scale=False, ref_psi_version=None,
+                              autotune=False, profiler=None,
+                              bounded_memory=False, max_rows=None,
+                              spill_path=None, dtype=None, columns=None,
+                              tissues=None, per_sample=False, workers=None):
         """Make prediction from a dataloader, return results as a table
         Args:
            model: mmsplice model object.
@@ -244,49 +540,405 @@ class MMSplice(object):
            progress: show progress bar.
            pathogenicity: adds pathogenicity prediction as column
            splicing_efficiency: adds splicing_efficiency prediction as column
+           autotune: tune inference batch size of models.
+           profiler: `mmsplice.profiler.StageProfiler` to record time
+             of each stage per batch.
+           bounded_memory: store predictions as float32.
+           max_rows: row budget of the table. If predictions exceed
+             `max_rows`, all predictions are written to `spill_path`
+             instead or ValueError is raised if `spill_path` is None.
+           spill_path: path of csv file or directory of parquet files
+             to write predictions exceeding `max_rows`.
+           dtype: float dtype of predictions, float64 if None.
+           columns: output columns in order, all columns if None.
+           tissues: tissues of MTSplice to output, all tissues if None.
+           per_sample: long-form table of non-reference carriers.
+           workers: number of worker processes running inference,
+             see `predict_parallel`.
 
         Returns:
            pd.DataFrame includes modular prediction, delta_logit_psi,
-           splicing_efficiency, pathogenicity.
+           splicing_efficiency, pathogenicity. Path of `spill_path`
+           if predictions are written to disk.
 
         """
-        return pd.concat(
-            self._predict_on_dataloader(
-                dataloader,
-                batch_size=batch_size,
-                progress=progress,
-                pathogenicity=pathogenicity,
-                splicing_efficiency=splicing_efficiency,
-                natural_scale=natural_scale, ref_psi_version=ref_psi_version)
-        )
+        df_iter = self._predict_on_dataloader(
+            dataloader,
+            batch_size=batch_size,
+            progress=progress,
+            pathogenicity=pathogenicity,
+            splicing_efficiency=splicing_efficiency,
+            natural_scale=natural_scale, ref_psi_version=ref_psi_version,
+            autotune=autotune, profiler=profiler,
+            bounded_memory=bounded_memory, dtype=dtype, columns=columns,
+            tissues=tissues, per_sample=per_sample, workers=workers)
+
+        if max_rows is None:
+            return pd.concat(df_iter)
+
+        dfs = list()
+        num_rows = 0
+        for df in df_iter:
+            dfs.append(df)
+            num_rows += df.shape[0]
+            if num_rows > max_rows:
+                break
+        else:
+            return pd.concat(dfs)
+
+        if spill_path is None:
+            df_iter.close()
+            raise ValueError(
+                'Predictions exceed `max_rows=%d`, use `predict_save`'
+                ' or `spill_path` to write predictions to disk' % max_rows)
+
+        spill_path = Path(spill_path)
+        logger.warning('Predictions exceed `max_rows=%d`, writing'
+                       ' predictions to %s' % (max_rows, spill_path))
+        write_table(itertools.chain(dfs, df_iter), spill_path)
+        return spill_path
+
+
+def output_tissues(tissues=None, columns=None):
+    """
+    Tissues of MTSplice to predict for requested `tissues`
+      and output `columns`.
+    """
+    tissues = tissue_names if tissues is None else list(tissues)
+    unknown = set(tissues).difference(tissue_names)
+    if unknown:
+        raise ValueError('Unknown tissues: %s' % ', '.join(sorted(unknown)))
+
+    if columns is not None:
+        columns = set(columns)
+        tissues = [
+            i for i in tissues
+            if {i, '%s_ref' % i, '%s_delta_psi' % i} & columns
+        ]
+    return tissues
+
+
+def carriers_table(df, genotype, samples):
+    """
+    Long-form table of non-reference carriers from predictions of variants.
+
+    Rows of `df` are repeated for each carrier with `sample` and
+    `genotype` (alt allele count) columns and `<tissue>_delta_psi`
+    columns are scaled to the genotype, see `genotype_delta_psi`.
+
+    Args:
+      df: predictions of variants.
+      genotype: (n_variants, n_samples) int8 matrix of alt allele counts.
+      samples: sample names of genotype columns.
+    """
+    genotype = np.asarray(genotype)
+    delta_psi_columns = [i for i in df.columns if i.endswith('_delta_psi')]
+    variant_index, sample_index, delta_psi = genotype_delta_psi(
+        df[delta_psi_columns].values, genotype)
+
+    df = df.iloc[variant_index].reset_index(drop=True)
+    loc = sum(i in df.columns for i in ['ID', 'exons'])
+    df.insert(loc, 'sample', np.asarray(samples, dtype=object)[sample_index])
+    df.insert(loc + 1, 'genotype', genotype[variant_index, sample_index])
+    if delta_psi_columns:
+        df[delta_psi_columns] = delta_psi
+    return df
+
+
+def _select_columns(batch_columns, columns):
+    missing = [i for i in columns if i not in batch_columns]
+    if missing:
+        raise ValueError('Columns are not predicted: %s' % ', '.join(missing))
+    return {i: batch_columns[i] for i in columns}
+
+
+def _columns_to_frame(columns, dtype=None):
+    if dtype is not None:
+        columns = {
+            k: v.astype(dtype, copy=False)
+            if np.issubdtype(getattr(v, 'dtype', object), np.floating)
+            else v
+            for k, v in columns.items()
+        }
+    return pd.DataFrame(columns)
+
+
+def write_table(df_iter, output_path, batch_size_parquet=1000000,
+                manifest=None, progress=None):
+    """
+    Write dataframes of iterator to csv file or directory of parquet
+      files based on suffix of `output_path`.
+    """
+    output_path = Path(output_path)
+    suffix = output_path.suffix.lower()
+    if suffix == '.csv':
+        df_batch_writer(df_iter, output_path, manifest, progress)
+    elif suffix == '.parquet':
+        df_batch_writer_parquet(df_iter, output_path, batch_size_parquet,
+                                manifest, progress)
+    else:
+        raise ValueError('output_path should be csv file or'
+                         ' parquet directory')
+
+
+def progress_manifest(output_path):
+    """
+    Path of progress manifest of `predict_save` output.
+    """
+    output_path = Path(output_path)
+    if output_path.suffix.lower() == '.parquet':
+        return output_path / '_progress.json'
+    return output_path.with_name(output_path.name + '.progress.json')
 
 
 # TODO: implement prediction methods within MMSplice class,
 #   should be more error prone
 def predict_save(model, dataloader, output_path, batch_size=512, batch_size_parquet=1000000, progress=True,
-                 pathogenicity=False, splicing_efficiency=False):
+                 pathogenicity=False, splicing_efficiency=False, resume=False,
+                 autotune=False, profiler=None, bounded_memory=False,
+                 dtype=None, columns=None, tissues=None, per_sample=False,
+                 workers=None, natural_scale=False, ref_psi_version=None):
+    """
+    Predict and save results to csv file or directory of parquet files.
+
+    Progress is recorded in a manifest next to the output after each
+    written batch (see `progress_manifest`), so an interrupted run can
+    be continued with `resume=True` using the same dataloader arguments
+    and `batch_size_parquet`.
+
+    Args:
+      model: mmsplice model object.
+      dataloader: dataloader object.
+      output_path: path of csv file or directory of parquet files.
+      batch_size: batch size of predictions.
+      batch_size_parquet: minimum number of rows in each parquet file.
+      progress: show progress bar.
+      pathogenicity: adds pathogenicity prediction as column
+      splicing_efficiency: adds splicing_efficiency prediction as column
+      resume: skip samples already written by an interrupted run
+        and append to its output.
+      autotune: tune inference batch size of models.
+      profiler: `mmsplice.profiler.StageProfiler` to record time
+        of each stage per batch including writing.
+      bounded_memory: store predictions as float32.
+      dtype: float dtype of predictions, float64 if None.
+      columns: output columns in order, all columns if None.
+      tissues: tissues of MTSplice to output, all tissues if None.
+      per_sample: long-form table of non-reference carriers.
+      workers: number of worker processes running inference,
+        see `MMSplice.predict_parallel`.
+      natural_scale: adds delta PSI of tissues on natural scale,
+        only with tissue specific dataloaders.
+      ref_psi_version: reference PSI of `natural_scale`,
+        'grch37' or 'grch38'.
+    """
     from mmsplice import MMSplice
     assert isinstance(model, MMSplice), \
         "model should be a mmsplice.MMSplice class instance"
 
+    if not isinstance(output_path, pathlib.PosixPath):
+        output_path = Path(output_path)
+    suffix = output_path.suffix.lower()
+    if suffix not in {'.csv', '.parquet'}:
+        raise ValueError('output_path should be csv file or'
+                         ' parquet directory')
+
+    manifest = progress_manifest(output_path)
+    state = read_progress(manifest) if resume else None
+
+    if state is not None:
+        # dataloader samples are skipped, so only the layout of
+        # parquet parts depends on the interrupted run
+        if state.get('batch_size_parquet') != batch_size_parquet:
+            raise ValueError('`batch_size_parquet` should be same as the'
+                             ' interrupted run to resume')
+        if state.get('complete'):
+            logger.info('%s is already complete' % output_path)
+            return
+        # rows of per sample output are carriers of dataloader samples
+        samples = state.get('samples', state['rows'])
+        logger.info('Resume after %d samples' % samples)
+        dataloader.skip(samples)
+    else:
+        state = {'rows': 0, 'samples': 0, 'batches': 0, 'bytes': 0,
+                 'batch_size': batch_size,
+                 'batch_size_parquet': batch_size_parquet}
+        if suffix == '.parquet':
+            output_path.mkdir(exist_ok=True)
+        write_progress(manifest, state)
+
     df_iter = model._predict_on_dataloader(
-        dataloader, 
-        progress=progress, 
+        dataloader,
+        progress=progress,
         batch_size=batch_size,
         pathogenicity=pathogenicity,
-        splicing_efficiency=splicing_efficiency)
+        splicing_efficiency=splicing_efficiency,
+        autotune=autotune,
+        profiler=profiler,
+        bounded_memory=bounded_memory,
+        dtype=dtype,
+        columns=columns,
+        tissues=tissues,
+        per_sample=per_sample,
+        workers=workers,
+        natural_scale=natural_scale,
+        ref_psi_version=ref_psi_version)
+    if profiler:
+        df_iter = _profile_writing(df_iter, profiler)
+
+    write_table(df_iter, output_path, batch_size_parquet, manifest, state)
+
+    state = read_progress(manifest)
+    state['complete'] = True
+    write_progress(manifest, state)
+
+
+def _info_values(df, fields):
+    '''
+    `|` separated values of fields of each row for vcf INFO field.
+    '''
+    values = None
+    for field in fields:
+        col = df[field]
+        if col.dtype.kind == 'f':
+            col = col.map('{:.3f}'.format)
+        else:
+            # separators of INFO field are not allowed in values
+            col = col.astype(str).str.replace(r'[,;=|\s]', '_', regex=True)
+        values = col if values is None else values + '|' + col
+    return values
+
+
+def _allele_keys(var):
+    '''
+    Variant ids of each alternative allele of cyvcf2 record
+      as in `ID` column of predictions.
+    '''
+    from kipoiseq.dataclasses import Variant
+    return [str(Variant.from_cyvcf_and_given_alt(var, alt))
+            for alt in var.ALT]
+
+
+def _vcf_writer(vcf, output_path, fields):
+    from cyvcf2 import Writer
+    vcf.add_info_to_header({
+        'ID': 'mmsplice',
+        'Description': 'mmsplice splice variant effect per allele and'
+        ' exon. Format: ALT|%s' % '|'.join(fields),
+        'Type': 'String',
+        'Number': '.'
+    })
+    return Writer(str(output_path), vcf,
+                  mode='wz' if str(output_path).endswith('.gz') else 'w')
+
+
+def predict_vcf(model, dataloader, output_path, batch_size=512,
+                progress=True, columns=None, profiler=None, **kwargs):
+    """
+    Predict and write the vcf file of dataloader with predictions of
+    each variant in `mmsplice` INFO field, one `|` separated entry of
+    the alternative allele and `columns` per allele and exon.
 
-    if not isinstance(output_path, pathlib.PosixPath):
-        output_path = Path(output_path)
-    if output_path.suffix.lower() == '.csv':
-        df_batch_writer(df_iter, output_path)
-    elif output_path.suffix.lower() == '.parquet':
-        df_batch_writer_parquet(df_iter, output_path, batch_size_parquet)
+    Predictions of the dataloader are in order of the vcf file, so
+    records are written as soon as predictions of a later record
+    arrive and only INFO values of the current record are kept.
+
+    Args:
+      model: mmsplice model object.
+      dataloader: dataloader of vcf file, e.g. `SplicingVCFDataloader`.
+      output_path: path of vcf file, bgzipped if ends with `.gz`.
+      batch_size: batch size of predictions.
+      progress: show progress bar.
+      columns: columns of INFO entries in order, all columns if None.
+      profiler: `mmsplice.profiler.StageProfiler` to record time
+        of each stage per batch.
+      kwargs: arguments of `predict_save`.
+    """
+    from cyvcf2 import VCF
+    from mmsplice import MMSplice
+    assert isinstance(model, MMSplice), \
+        "model should be a mmsplice.MMSplice class instance"
+
+    vcf_file = getattr(dataloader, 'vcf_file', None)
+    if vcf_file is None:
+        raise ValueError('dataloader should read variants from vcf file')
+    if columns is not None:
+        columns = ['ID', *[i for i in columns if i != 'ID']]
+
+    df_iter = model._predict_on_dataloader(
+        dataloader, batch_size=batch_size, progress=progress,
+        columns=columns, profiler=profiler, **kwargs)
+    if profiler:
+        df_iter = _profile_writing(df_iter, profiler)
+
+    fields = [i for i in columns if i != 'ID'] if columns else None
+    info = dict()
+    vcf = VCF(vcf_file)
+    records = iter(vcf)
+    writer = None
+    # record of the last predicted variant and ids of its alleles
+    current, keys = None, []
+
+    def _write(var, keys):
+        entries = ['%s|%s' % (alt, value)
+                   for alt, key in zip(var.ALT, keys)
+                   for value in info.pop(key, [])]
+        if entries:
+            var.INFO['mmsplice'] = ','.join(entries)
+        writer.write_record(var)
+
+    try:
+        for df in df_iter:
+            fields = fields or [i for i in df.columns if i != 'ID']
+            if writer is None:
+                writer = _vcf_writer(vcf, output_path, fields)
+            if len(df) == 0:
+                continue
+
+            for variant, value in zip(df['ID'], _info_values(df, fields)):
+                info.setdefault(variant, []).append(value)
+
+            last = df['ID'].iloc[-1]
+            while last not in keys:
+                if current is not None:
+                    _write(current, keys)
+                current = next(records, None)
+                if current is None:
+                    raise ValueError('Predictions are not in order of'
+                                     ' vcf file: %s' % last)
+                keys = _allele_keys(current)
+
+        if writer is None:
+            writer = _vcf_writer(vcf, output_path, fields or [])
+        if current is not None:
+            _write(current, keys)
+        for var in records:
+            _write(var, _allele_keys(var))
+        if info:
+            logger.warning('Predictions of %d variants are not written,'
+                           ' they are not in order of vcf file' % len(info))
+    finally:
+        if writer is not None:
+            writer.close()
+        vcf.close()
+
+
+def _profile_writing(df_iter, profiler):
+    # time between yields is spent by the writer
+    for df in df_iter:
+        start = time.perf_counter()
+        yield df
+        profiler.record('writing', start, time.perf_counter() - start,
+                        len(df))
 
 
 def predict_all_table(model, dataloader, batch_size=512, progress=True,
                       pathogenicity=False, splicing_efficiency=False,
-                      natural_scale=False, ref_psi_version=None):
+                      natural_scale=False, ref_psi_version=None,
+                      autotune=False, profiler=None, bounded_memory=False,
+                      max_rows=None, spill_path=None, dtype=None,
+                      columns=None, tissues=None, per_sample=False,
+                      workers=None):
     """
     Return the prediction as a table
 
@@ -296,10 +948,27 @@ def predict_all_table(model, dataloader, batch_size=512, progress=True,
       progress: show progress bar.
       pathogenicity: adds pathogenicity prediction as column
       splicing_efficiency: adds  splicing_efficiency prediction as column
+      autotune: tune inference batch size of models.
+      profiler: `mmsplice.profiler.StageProfiler` to record time
+        of each stage per batch.
+      bounded_memory: store predictions as float32.
+      max_rows: row budget of the table, see `MMSplice.predict_on_dataloader`.
+      spill_path: path of csv file or directory of parquet files to write
+        predictions exceeding `max_rows`.
+      dtype: float dtype of predictions (e.g. 'float32' or 'float16'),
+        float64 if None.
+      columns: output columns in order, all columns if None.
+      tissues: tissues of MTSplice to output, all tissues if None.
+      per_sample: long-form table of non-reference carriers with `sample`
+        and `genotype` columns and delta PSI of their genotypes.
+        Dataloader should be created with `genotypes=True`.
+      workers: number of worker processes running inference,
+        see `MMSplice.predict_parallel`.
 
     Returns:
       pd.DataFrame of modular prediction, delta_logit_psi, splicing_efficiency,
-        pathogenicity.
+        pathogenicity or path of `spill_path` if predictions are
+        written to disk.
     """
     from mmsplice import MMSplice
     assert isinstance(model, MMSplice), \
@@ -308,7 +977,11 @@ def predict_all_table(model, dataloader, batch_size=512, progress=True,
     return model.predict_on_dataloader(
         dataloader, progress=progress, batch_size=batch_size,
         pathogenicity=pathogenicity, splicing_efficiency=splicing_efficiency,
-        natural_scale=natural_scale, ref_psi_version=ref_psi_version)
+        natural_scale=natural_scale, ref_psi_version=ref_psi_version,
+        autotune=autotune, profiler=profiler, bounded_memory=bounded_memory,
+        max_rows=max_rows, spill_path=spill_path, dtype=dtype,
+        columns=columns, tissues=tissues, per_sample=per_sample,
+        workers=workers)
 
 
 def writeVCF(vcf_in, vcf_out, predictions):
@@ -1,7 +1,8 @@
 from pkg_resources import resource_filename
 from tensorflow.keras.models import load_model
 from mmsplice.layers import SplineWeight1D
-from mmsplice.utils import encodeDNA
+from mmsplice.utils import encodeDNA, encode_index, mutagenesis_batches, \
+    N_INDEX
 from mmsplice.exon_dataloader import SeqSpliter
 import numpy as np
 
@@ -39,6 +40,20 @@ custom_objects = {
 }
 
 
+class _Ensemble:
+    '''
+    Mean prediction of keras models as a single callable.
+    '''
+
+    def __init__(self, models):
+        self.models = models
+
+    def __call__(self, inputs, training=False):
+        import tensorflow as tf
+        return tf.reduce_mean(tf.stack([
+            m(inputs, training=training) for m in self.models]), axis=0)
+
+
 class MTSplice:
     """
     Load modules of mtsplice model, perform prediction on batch of dataloader.
@@ -52,28 +67,78 @@ class MTSplice:
       donorM: donor splice site model, score donor sequence
         with 13bp in the intron, 5bp in the exon.
       donor_intronM: donor intron model, score donor intron sequence.
+      quantized: load int8 quantized models, see `mmsplice.quantization`.
+      compiled: compile the ensemble with XLA as a single function at
+        startup, see `mmsplice.compiled`.
+      artifacts: directory of exported artifacts to load the ensemble
+        from, see `mmsplice.export`. `deep` of the export is used.
+      optimize: fold constant subgraphs of keras models at load,
+        see `mmsplice.optimize`.
     """
 
-    def __init__(self, seq_spliter=None, deep=True):
-        if deep:
-            self.mtsplice_models = [load_model(
-                m, custom_objects=custom_objects) for m in MTSPLICE_DEEP]
-        else:
-            self.mtsplice_models = [load_model(
-                m, custom_objects=custom_objects) for m in MTSPLICE]
+    def __init__(self, seq_spliter=None, deep=True, quantized=False,
+                 compiled=False, artifacts=None, optimize=False):
+        if sum(map(bool, [quantized, compiled, artifacts])) > 1:
+            raise ValueError('Only one of `quantized`, `compiled` and'
+                             ' `artifacts` can be used')
         self.spliter = seq_spliter or SeqSpliter()
+        model_files = MTSPLICE_DEEP if deep else MTSPLICE
+
+        if artifacts:
+            from mmsplice.export import load_artifact
+            self.mtsplice_models = [load_artifact(artifacts, 'mtsplice')]
+        elif compiled:
+            from mmsplice.compiled import CompiledModel, \
+                enable_persistent_cache
+            enable_persistent_cache()
+            models = [self._load_model(m, optimize) for m in model_files]
+            # mean of the ensemble is a single compiled function
+            self.mtsplice_models = [CompiledModel(_Ensemble(models))]
+            self.warmup()
+        elif quantized:
+            from mmsplice.quantization import load_quantized, \
+                calibration_tissue_inputs
 
-    def predict_on_batch(self, batch):
+            def calibration():
+                inputs = calibration_tissue_inputs(self.spliter)
+                return [inputs['acceptor'], inputs['donor']]
+
+            self.mtsplice_models = [
+                load_quantized(m, calibration, custom_objects=custom_objects)
+                for m in model_files]
+        else:
+            self.mtsplice_models = [self._load_model(m, optimize)
+                                    for m in model_files]
+
+    @staticmethod
+    def _load_model(model_file, optimize=False):
+        model = load_model(model_file, custom_objects=custom_objects)
+        if optimize:
+            from mmsplice.optimize import optimize_model
+            model = optimize_model(model, custom_objects)
+        return model
+
+    def warmup(self, overhang=(300, 300)):
+        '''
+        Trace and compile models of compiled ensemble.
+        '''
+        length = sum(overhang) + 1
+        self.predict_on_batch(self.spliter.split_tissue_batch(
+            np.zeros((1, length), dtype='uint8'), [length], [overhang]))
+
+    def predict_on_batch(self, batch, batch_size=None):
         '''
         Perform prediction on batch of dataloader.
 
         Args:
           batch: batch of dataloader.
+          batch_size: inference batch size, default of keras if None.
 
         Returns:
           np.matrix of tissue predictions as [[tissues]]
         '''
-        pred = [m.predict([batch['acceptor'], batch['donor']])
+        pred = [m.predict([batch['acceptor'], batch['donor']],
+                          batch_size=batch_size)
                 for m in self.mtsplice_models]
         return np.mean(pred, 0)
 
@@ -92,3 +157,40 @@ class MTSplice:
         batch = self.spliter.split_tissue_seq(seq, overhang)
         batch = {k: encodeDNA([v]) for k, v in batch.items()}
         return self.predict_on_batch(batch)
+
+    def saturation_mutagenesis(self, seq, overhang=(300, 300),
+                               deletions=False, batch_size=512):
+        """
+        Tissue predictions of all single base substitutions of
+          overhanged exon sequence, see `MMSplice.saturation_mutagenesis`.
+          As tissue columns of `predict_all_table`, tissue-level
+          delta_logit_psi of a variant is its prediction added to
+          delta_logit_psi of `MMSplice.saturation_mutagenesis`.
+
+        Args:
+          seq (str): sequence of overhanged exon.
+          overhang (Tuple[int, int]): overhang of seqeunce.
+          deletions: add 1 bp deletion of each position as 5th column.
+          batch_size: number of mutated sequences scored at once.
+
+        Returns:
+          (len(seq), 4, tissues) array of tissue predictions of alt
+            sequences for substitutions to A, C, G, T at each position,
+            or (len(seq), 5, tissues) with deletions. Reference bases
+            are predictions of the reference sequence and positions
+            with `N` are NaN.
+        """
+        index = encode_index(seq.upper())
+        ref = self.predict_on_batch(self.spliter.split_tissue_batch(
+            index[None], [len(index)], [overhang]))
+
+        pred = np.empty((len(index), 5 if deletions else 4, ref.shape[1]))
+        pred[:] = ref
+        pred[index == N_INDEX, :4] = np.nan
+
+        for rows, lengths, overhangs, pos, alt in mutagenesis_batches(
+                index, overhang, batch_size, deletions):
+            pred[pos, alt] = self.predict_on_batch(
+                self.spliter.split_tissue_batch(rows, lengths, overhangs),
+                batch_size=batch_size)
+        return pred
@@ -0,0 +1,241 @@
+"""
+Inference-mode optimization of keras module models by folding constant
+subgraphs into layer weights. The config of the functional model is
+rewritten and the model is rebuilt with folded weights:
+
+  - `Dropout` layers are removed.
+  - `SplineWeight1D` is replaced by `PositionalWeight1D` with the spline
+    track `X_spline . kernel + 1` precomputed once instead of per call.
+  - `BatchNormalization` directly after a linear `Conv1D` or `Dense`
+    is folded into its kernel and bias.
+  - `BatchNormalization` directly before a `Dense` (also through
+    `Flatten`) or before a `Conv1D` without zero padding
+    (`padding='valid'` or kernel size 1) is folded into its kernel and
+    bias.
+
+Batch normalization before convolutions with `padding='same'` is kept,
+because zero padding of normalized activations differs at sequence
+borders. The mask of `GlobalAveragePooling1D_Mask0` depends on inputs
+and is kept as well. Outputs of optimized models are identical up to
+float rounding.
+"""
+import copy
+import logging
+import numpy as np
+
+logger = logging.getLogger('mmsplice')
+
+_LINEAR = {'Conv1D', 'ConvDNA', 'Dense'}
+
+
+def _inputs(layer):
+    '''
+    Inbound entries of layer called once, None for shared layers.
+    '''
+    nodes = layer['inbound_nodes']
+    return nodes[0] if len(nodes) == 1 else None
+
+
+def _consumers(config, name):
+    consumers = [layer['name'] for layer in config['layers']
+                 for node in layer['inbound_nodes']
+                 for entry in node if entry[0] == name]
+    consumers += [entry[0] for entry in config['output_layers']
+                  if entry[0] == name]
+    return consumers
+
+
+def _single_consumer(config, name):
+    consumers = _consumers(config, name)
+    if len(consumers) == 1 and not any(
+            entry[0] == name for entry in config['output_layers']):
+        return _layer(config, consumers[0])
+
+
+def _layer(config, name):
+    return next(layer for layer in config['layers']
+                if layer['name'] == name)
+
+
+def _bypass(config, name):
+    '''
+    Remove single input layer from graph and connect its consumers
+      to its input.
+    '''
+    layer = _layer(config, name)
+    entry = _inputs(layer)[0]
+    for other in config['layers']:
+        other['inbound_nodes'] = [
+            [list(entry) if e[0] == name else e for e in node]
+            for node in other['inbound_nodes']]
+    config['output_layers'] = [
+        list(entry[:3]) if e[0] == name else e
+        for e in config['output_layers']]
+    config['layers'].remove(layer)
+
+
+def _batch_norm(layer, weights):
+    '''
+    Scale and shift of batch normalization at inference.
+    '''
+    cfg = layer['config']
+    weights = list(weights)
+    gamma = weights.pop(0) if cfg.get('scale', True) else 1.
+    beta = weights.pop(0) if cfg.get('center', True) else 0.
+    mean, var = weights
+    scale = gamma / np.sqrt(var + cfg['epsilon'])
+    return scale, beta - mean * scale
+
+
+def _is_last_axis(layer, shape):
+    axis = layer['config']['axis']
+    axis = axis[0] if isinstance(axis, (list, tuple)) and len(axis) == 1 \
+        else axis
+    return axis in (-1, len(shape) - 1)
+
+
+def _is_linear(layer):
+    return layer['class_name'] in _LINEAR \
+        and layer['config'].get('activation', 'linear') == 'linear'
+
+
+def _kernel_bias(layer, weights):
+    kernel = weights[0]
+    bias = weights[1] if layer['config'].get('use_bias', True) \
+        else np.zeros(kernel.shape[-1], dtype=kernel.dtype)
+    return kernel, bias
+
+
+def _fold_before(config, weights, shapes):
+    '''
+    Fold batch normalization into preceding linear layer.
+    '''
+    for bn in [layer for layer in config['layers']
+               if layer['class_name'] == 'BatchNormalization']:
+        inputs = _inputs(bn)
+        if not inputs or len(inputs) != 1 \
+                or not _is_last_axis(bn, shapes[bn['name']]):
+            continue
+        layer = _layer(config, inputs[0][0])
+        if not _is_linear(layer) or _inputs(layer) is None \
+                or _single_consumer(config, layer['name']) is not bn:
+            continue
+
+        scale, shift = _batch_norm(bn, weights[bn['name']])
+        kernel, bias = _kernel_bias(layer, weights[layer['name']])
+        weights[layer['name']] = [kernel * scale, bias * scale + shift]
+        layer['config']['use_bias'] = True
+        _bypass(config, bn['name'])
+        del weights[bn['name']]
+
+
+def _fold_after(config, weights, shapes):
+    '''
+    Fold batch normalization into following dense layer
+      or convolution without zero padding.
+    '''
+    for bn in [layer for layer in config['layers']
+               if layer['class_name'] == 'BatchNormalization']:
+        inputs = _inputs(bn)
+        shape = shapes[bn['name']]
+        if not inputs or len(inputs) != 1 or not _is_last_axis(bn, shape):
+            continue
+        scale, shift = _batch_norm(bn, weights[bn['name']])
+
+        layer = _single_consumer(config, bn['name'])
+        if layer is not None and layer['class_name'] == 'Flatten' \
+                and None not in shape[1:]:
+            # flatten of (steps, channels) repeats channels per step
+            repeat = int(np.prod(shape[1:-1]))
+            scale, shift = np.tile(scale, repeat), np.tile(shift, repeat)
+            layer = _single_consumer(config, layer['name'])
+        if layer is None or _inputs(layer) is None \
+                or len(_inputs(layer)) != 1:
+            continue
+
+        kernel, bias = _kernel_bias(layer, weights[layer['name']])
+        if layer['class_name'] == 'Dense' \
+                and kernel.shape[0] == len(scale):
+            kernel, bias = kernel * scale[:, None], bias + shift @ kernel
+        elif layer['class_name'] in {'Conv1D', 'ConvDNA'} \
+                and kernel.shape[1] == len(scale) \
+                and (layer['config']['padding'] == 'valid'
+                     or tuple(layer['config']['kernel_size']) == (1,)):
+            kernel, bias = kernel * scale[None, :, None], \
+                bias + np.einsum('i,kio->o', shift, kernel)
+        else:
+            continue
+
+        weights[layer['name']] = [kernel, bias]
+        layer['config']['use_bias'] = True
+        _bypass(config, bn['name'])
+        del weights[bn['name']]
+
+
+def _precompute_splines(config, weights, model):
+    '''
+    Replace spline weighting with precomputed positional weights.
+    '''
+    for layer in config['layers']:
+        if layer['class_name'] != 'SplineWeight1D':
+            continue
+        spline = model.get_layer(layer['name'])
+        track = np.dot(spline.X_spline, spline.get_weights()[0])
+        if spline.use_bias:
+            track = track + spline.get_weights()[1]
+        track = (track + 1).astype('float32')
+
+        layer['class_name'] = 'PositionalWeight1D'
+        layer['config'] = {
+            'name': layer['config']['name'],
+            'trainable': False,
+            'dtype': layer['config'].get('dtype', 'float32'),
+            'n_tracks': track.shape[1]
+        }
+        weights[layer['name']] = [track]
+
+
+def optimize_model(model, custom_objects=None):
+    '''
+    Inference model of keras functional model with constant
+      subgraphs folded, see module docstring.
+
+    Args:
+      model: keras functional model.
+      custom_objects: custom layers of the model.
+
+    Returns:
+      keras model with the same inputs and outputs.
+    '''
+    from tensorflow.keras.models import Model
+    from mmsplice.layers import PositionalWeight1D, SplineWeight1D, \
+        ConvDNA, GlobalAveragePooling1D_Mask0
+
+    config = copy.deepcopy(model.get_config())
+    weights = {layer.name: layer.get_weights() for layer in model.layers}
+    shapes = {layer.name: tuple(layer.output_shape)
+              for layer in model.layers
+              if layer.__class__.__name__ == 'BatchNormalization'}
+
+    for layer in list(config['layers']):
+        if layer['class_name'] == 'Dropout' and _inputs(layer) \
+                and len(_inputs(layer)) == 1:
+            _bypass(config, layer['name'])
+    _precompute_splines(config, weights, model)
+    _fold_before(config, weights, shapes)
+    _fold_after(config, weights, shapes)
+
+    custom_objects = {
+        'PositionalWeight1D': PositionalWeight1D,
+        'SplineWeight1D': SplineWeight1D,
+        'ConvDNA': ConvDNA,
+        'GlobalAveragePooling1D_Mask0': GlobalAveragePooling1D_Mask0,
+        **(custom_objects or {})
+    }
+    optimized = Model.from_config(config, custom_objects=custom_objects)
+    for layer in optimized.layers:
+        layer.set_weights(weights[layer.name])
+
+    logger.debug('Optimized %s: %d to %d layers' % (
+        model.name, len(model.layers), len(optimized.layers)))
+    return optimized
@@ -0,0 +1,197 @@
+"""
+Worker pool running inference of MMSplice and MTSplice on disjoint
+batches of a dataloader.
+
+The parent process iterates the dataloader once, so annotations, fasta
+and vcf readers and reference PSI tables are held only by the parent.
+Workers hold only the models: configs and weights of keras models are
+sent once to each worker at startup, and TFLite models of quantized
+models and exported artifacts are loaded from the same files by all
+workers. Workers are started with `spawn`, so no tensorflow runtime
+state of the parent is forked. Results are collected in the order of
+batches with a bounded number of batches in flight.
+"""
+import logging
+import multiprocessing
+from collections import deque
+
+logger = logging.getLogger('mmsplice')
+
+
+def _custom_objects():
+    from mmsplice.layers import ConvDNA, GlobalAveragePooling1D_Mask0, \
+        SplineWeight1D, PositionalWeight1D
+    return {
+        'ConvDNA': ConvDNA,
+        'GlobalAveragePooling1D_Mask0': GlobalAveragePooling1D_Mask0,
+        'SplineWeight1D': SplineWeight1D,
+        'PositionalWeight1D': PositionalWeight1D
+    }
+
+
+def model_spec(model):
+    '''
+    Picklable spec of model to build it in workers.
+
+    Args:
+      model: keras model, `CompiledModel`, `TFLiteModel` or
+        `SavedModelArtifact`.
+    '''
+    from mmsplice.compiled import CompiledModel
+    from mmsplice.quantization import TFLiteModel
+    from mmsplice.export import SavedModelArtifact
+    from mmsplice.mtsplice import _Ensemble
+
+    if isinstance(model, CompiledModel):
+        return {'kind': 'compiled', 'model': model_spec(model.model),
+                'batch_size': model.batch_size, 'buckets': model.buckets}
+    if isinstance(model, _Ensemble):
+        return {'kind': 'ensemble',
+                'models': [model_spec(m) for m in model.models]}
+    if isinstance(model, TFLiteModel):
+        return {'kind': 'tflite', 'path': model.path}
+    if isinstance(model, SavedModelArtifact):
+        return {'kind': 'savedmodel', 'path': model.path,
+                'signature': model.signature,
+                'input_names': model.input_names}
+    return {'kind': 'keras', 'config': model.to_json(),
+            'weights': model.get_weights()}
+
+
+def build_model(spec):
+    '''
+    Build model of `model_spec`.
+    '''
+    kind = spec['kind']
+    if kind == 'compiled':
+        from mmsplice.compiled import CompiledModel
+        return CompiledModel(build_model(spec['model']),
+                             batch_size=spec['batch_size'],
+                             buckets=spec['buckets'])
+    if kind == 'ensemble':
+        from mmsplice.mtsplice import _Ensemble
+        return _Ensemble([build_model(m) for m in spec['models']])
+    if kind == 'tflite':
+        from mmsplice.quantization import TFLiteModel
+        return TFLiteModel(spec['path'], num_threads=1)
+    if kind == 'savedmodel':
+        from mmsplice.export import SavedModelArtifact
+        return SavedModelArtifact(spec['path'], spec['signature'],
+                                  spec['input_names'])
+
+    from tensorflow.keras.models import model_from_json
+    model = model_from_json(spec['config'], custom_objects=_custom_objects())
+    model.set_weights(spec['weights'])
+    return model
+
+
+_MMSPLICE_MODULES = ['acceptor_intronM', 'acceptorM', 'exonM', 'donorM',
+                     'donor_intronM', 'fused']
+
+
+def _models_state(model, mtsplice):
+    state = {'spliter': model.spliter, 'mmsplice': dict(), 'mtsplice': None}
+    for name in _MMSPLICE_MODULES:
+        module = getattr(model, name, None)
+        if module is not None:
+            state['mmsplice'][name] = model_spec(module)
+    if mtsplice is not None:
+        state['mtsplice'] = [model_spec(m) for m in mtsplice.mtsplice_models]
+    return state
+
+
+_worker = dict()
+
+
+def _init_worker(state, threads):
+    from mmsplice.mmsplice import MMSplice
+    from mmsplice.mtsplice import MTSplice
+
+    if threads:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    # models are built from specs of the parent instead of model files
+    model = MMSplice.__new__(MMSplice)
+    model.spliter = state['spliter']
+    model.fused = None
+    for name, spec in state['mmsplice'].items():
+        setattr(model, name, build_model(spec))
+    _worker['mmsplice'] = model
+
+    if state['mtsplice'] is not None:
+        mtsplice = MTSplice.__new__(MTSplice)
+        mtsplice.spliter = state['spliter']
+        mtsplice.mtsplice_models = [build_model(spec)
+                                    for spec in state['mtsplice']]
+        _worker['mtsplice'] = mtsplice
+
+
+def _predict_worker(inputs, batch_size):
+    return _worker['mmsplice']._predict_scores(
+        inputs, batch_size, _worker.get('mtsplice'))
+
+
+class WorkerPool:
+    """
+    Pool of processes predicting scores of batches with models of
+    the parent, see `MMSplice._predict_scores`.
+
+    Args:
+      model: `MMSplice` of the parent.
+      mtsplice: `MTSplice` of the parent or None.
+      workers: number of processes.
+      max_pending: maximum number of batches in flight,
+        2 batches per worker if None.
+      threads: tensorflow intra op threads of each worker,
+        default of tensorflow if None.
+    """
+
+    def __init__(self, model, mtsplice=None, workers=2, max_pending=None,
+                 threads=None):
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        self.pool = multiprocessing.get_context('spawn').Pool(
+            workers, initializer=_init_worker,
+            initargs=(_models_state(model, mtsplice), threads))
+
+    def scored_batches(self, batches, batch_size=None, profiler=None):
+        '''
+        Iterate (batch, scores) of batches in order. Encoded inputs
+          of batches are sent to workers and metadata stays in
+          the parent.
+        '''
+        pending = deque()
+        batches = iter(batches)
+        exhausted = False
+
+        while True:
+            while not exhausted and len(pending) < self.max_pending:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                pending.append((batch, self.pool.apply_async(
+                    _predict_worker, (batch['inputs'], batch_size))))
+            if not pending:
+                break
+
+            batch, result = pending.popleft()
+            if profiler is None:
+                scores = result.get()
+            else:
+                with profiler.stage('workers', len(
+                        batch['metadata']['variant']['annotation'])):
+                    scores = result.get()
+            yield batch, scores
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
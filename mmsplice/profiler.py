@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+def peak_rss():
+    '''
+    Peak resident set size of the process in bytes.
+    '''
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def current_rss():
+    '''
+    Resident set size of the process in bytes,
+      peak resident set size if `/proc` is not available.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+class StageProfiler:
+    """
+    Record wall time and counts of stages of the prediction loop per batch.
+
+    Stages are timed with `stage` (or `record`) and aggregated in the
+    current batch until `end_batch` is called, so per-sample stages
+    such as fasta extraction add one event per batch rather than one per
+    sample. Results are available as `summary`, as JSON-lines trace
+    written at the end of each batch and as Chrome trace
+    (chrome://tracing or Perfetto) with `write_chrome_trace`.
+
+    With `memory=True`, growth of resident set size during each stage
+    is recorded as its `bytes` and resident set size at the end of each
+    batch as `rss`. Reading the resident set size costs a system call per
+    stage, so memory accounting is disabled by default. Peak resident set
+    size of the process is always reported in `summary`.
+
+    Args:
+      trace: optional path of JSON-lines trace with one line per
+        stage of each batch.
+      memory: record memory of stages and batches.
+    """
+
+    def __init__(self, trace=None, memory=False):
+        self.stages = dict()
+        self.counters = dict()
+        self.events = list()
+        self.batches = 0
+        self.rss = list()
+        self.memory = memory
+        self._batch = dict()
+        self._start = time.perf_counter()
+        self._trace = open(str(trace), 'w') if trace else None
+
+    @contextmanager
+    def stage(self, name, count=1):
+        '''
+        Time the enclosed block as stage `name` processing `count` items.
+        '''
+        rss = current_rss() if self.memory else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            nbytes = current_rss() - rss if self.memory else 0
+            self.record(name, start, duration, count, nbytes)
+
+    def record(self, name, start, duration, count=1, nbytes=0):
+        '''
+        Record `duration` seconds of stage `name` started at `start`
+          (`time.perf_counter`) in the current batch, allocating `nbytes`.
+        '''
+        if name in self._batch:
+            event = self._batch[name]
+            event['duration'] += duration
+            event['calls'] += 1
+            event['count'] += count
+            event['bytes'] += nbytes
+        else:
+            self._batch[name] = {'start': start, 'duration': duration,
+                                 'calls': 1, 'count': count,
+                                 'bytes': nbytes}
+
+    def count(self, name, n=1):
+        '''
+        Increase counter `name` by `n`.
+        '''
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def end_batch(self):
+        '''
+        Flush stages of the current batch to totals and traces.
+        '''
+        for name, event in self._batch.items():
+            total = self.stages.setdefault(
+                name, {'time': 0., 'calls': 0, 'count': 0, 'bytes': 0})
+            total['time'] += event['duration']
+            total['calls'] += event['calls']
+            total['count'] += event['count']
+            total['bytes'] += event['bytes']
+
+            event = {
+                'batch': self.batches,
+                'stage': name,
+                'start': event['start'] - self._start,
+                **event
+            }
+            self.events.append(event)
+            if self._trace:
+                self._trace.write(json.dumps(event) + '\n')
+
+        if self.memory:
+            self.rss.append(current_rss())
+        if self._trace:
+            self._trace.flush()
+        self._batch = dict()
+        self.batches += 1
+
+    def summary(self):
+        '''
+        Total time, calls, counts, bytes and time per batch of each stage
+          with counters and memory of the process.
+
+        Returns:
+          dict of `batches`, `wall_time`, `stages`, `counters`,
+            `peak_rss` and `rss` of each batch (bytes).
+        '''
+        stages = {
+            name: {**total,
+                   'time_per_batch': total['time'] / max(self.batches, 1)}
+            for name, total in sorted(self.stages.items(),
+                                      key=lambda x: -x[1]['time'])
+        }
+        return {
+            'batches': self.batches,
+            'wall_time': time.perf_counter() - self._start,
+            'stages': stages,
+            'counters': dict(self.counters),
+            'peak_rss': peak_rss(),
+            'rss': list(self.rss)
+        }
+
+    def write_chrome_trace(self, path):
+        '''
+        Write recorded events in Chrome trace event format.
+        '''
+        events = [{
+            'name': e['stage'],
+            'cat': 'mmsplice',
+            'ph': 'X',
+            'ts': e['start'] * 1e6,
+            'dur': e['duration'] * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {'batch': e['batch'], 'calls': e['calls'],
+                     'count': e['count'], 'bytes': e['bytes']}
+        } for e in self.events]
+        with open(str(path), 'w') as f:
+            json.dump({'traceEvents': events,
+                       'displayTimeUnit': 'ms'}, f)
+
+    def close(self):
+        if self._trace:
+            self._trace.close()
+            self._trace = None
+
+
+class _NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class NullProfiler:
+    """
+    Profiler doing nothing, used when profiling is disabled.
+    """
+    _stage = _NullStage()
+
+    def stage(self, name, count=1):
+        return self._stage
+
+    def record(self, name, start, duration, count=1, nbytes=0):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def end_batch(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,343 @@
+"""
+Int8 post-training quantization of the module models of MMSplice and
+MTSplice with TFLite.
+
+Weights of convolution and dense layers are quantized per output channel
+to int8 and activations are calibrated on a bundled sample of exon
+sequences (`CALIBRATION_EXONS`, internal exons of the grch37 annotation
+with 300bp intronic overhang written by `write_calibration_exons`).
+Inputs and outputs stay float32, so quantized models are drop-in
+replacements of keras models for `predict`.
+
+Quantized models are converted at their first use and cached in
+`<cache_dir>/quantized`, see `mmsplice.cache.get_cache_dir`.
+"""
+import os
+import json
+import time
+import logging
+from pkg_resources import resource_filename
+import numpy as np
+import pandas as pd
+from mmsplice.utils import encode_index_batch, mmsplice_module_names, \
+    predict_deltaLogitPsi
+from mmsplice.cache import get_cache_dir, file_cache_key, atomic_path
+
+logger = logging.getLogger('mmsplice')
+
+CALIBRATION_EXONS = resource_filename(
+    'mmsplice', 'models/calibration_exons.csv.gz')
+
+QUANTIZATION_VERSION = 2
+
+
+def read_calibration_exons(path=CALIBRATION_EXONS):
+    '''
+    Exon sequences with intronic overhang used to calibrate activations.
+    '''
+    return pd.read_csv(path)
+
+
+def calibration_exon_windows(gtf, fasta_file, num_exons=256,
+                             overhang=(300, 300), seed=0):
+    '''
+    Sequences of random internal exons of annotation with intronic
+      overhang on the strand of the exon.
+
+    Args:
+      gtf: 'grch37', 'grch38' or path of gtf file.
+      fasta_file: fasta file of the genome.
+      num_exons: number of exons to sample.
+      overhang: intronic overhang (acceptor side, donor side).
+      seed: random seed of sampled exons.
+
+    Returns:
+      pd.DataFrame of `seq`, `left_overhang` and `right_overhang`
+        (acceptor and donor side).
+    '''
+    from kipoiseq.dataclasses import Interval
+    from kipoiseq.extractors import FastaStringExtractor
+    from mmsplice.vcf_dataloader import read_exon_table
+
+    df = read_exon_table(gtf)
+    # first and last exons of transcripts are not padded
+    df = df[(df['left_overhang'] > 0) & (df['right_overhang'] > 0)]
+    df = df.assign(Start=df['Start'] + df['left_overhang'],
+                   End=df['End'] - df['right_overhang'])
+    df = df.drop_duplicates(['Chromosome', 'Start', 'End', 'Strand'])
+    df = df[df['Start'] >= max(overhang)]
+    df = df.sample(frac=1, random_state=seed)
+
+    fasta = FastaStringExtractor(fasta_file, use_strand=True)
+    rows = list()
+    for row in df.itertuples():
+        if row.Strand == '-':
+            interval = Interval(str(row.Chromosome), row.Start - overhang[1],
+                                row.End + overhang[0], strand='-')
+        else:
+            interval = Interval(str(row.Chromosome), row.Start - overhang[0],
+                                row.End + overhang[1], strand='+')
+        seq = fasta.extract(interval).upper()
+        if 'N' not in seq:
+            rows.append((seq, *overhang))
+        if len(rows) == num_exons:
+            break
+    return pd.DataFrame(rows, columns=['seq', 'left_overhang',
+                                       'right_overhang'])
+
+
+def write_calibration_exons(gtf, fasta_file, output=CALIBRATION_EXONS,
+                            **kwargs):
+    '''
+    Write calibration exons of `calibration_exon_windows`, e.g.
+      `write_calibration_exons('grch37', 'hg19.fa')` to regenerate the
+      bundled `CALIBRATION_EXONS`. Quantized models in the cache are
+      converted again when the file changes.
+    '''
+    calibration_exon_windows(gtf, fasta_file, **kwargs) \
+        .to_csv(output, index=False)
+
+
+def _trim_windows(df, overhang):
+    '''
+    Sequences of windows trimmed to `overhang` (acceptor side, donor side).
+    '''
+    seqs = list()
+    for seq, left, right in zip(df['seq'], df['left_overhang'],
+                                df['right_overhang']):
+        start = max(left - overhang[0], 0)
+        end = len(seq) - max(right - overhang[1], 0)
+        seqs.append(seq[start:end])
+    overhangs = np.stack([np.minimum(df['left_overhang'], overhang[0]),
+                          np.minimum(df['right_overhang'], overhang[1])],
+                         axis=1)
+    return seqs, overhangs
+
+
+def calibration_inputs(spliter, df=None, overhang=(100, 100)):
+    '''
+    One-hot encoded inputs of each mmsplice module of calibration exons.
+    '''
+    df = read_calibration_exons() if df is None else df
+    seqs, overhangs = _trim_windows(df, overhang)
+    index, lengths = encode_index_batch(seqs)
+    return spliter.split_batch(index, lengths, overhangs,
+                               pattern_warning=False)
+
+
+def calibration_tissue_inputs(spliter, df=None, overhang=(300, 300)):
+    '''
+    One-hot encoded acceptor and donor inputs of MTSplice
+      of calibration exons.
+    '''
+    df = read_calibration_exons() if df is None else df
+    seqs, overhangs = _trim_windows(df, overhang)
+    index, lengths = encode_index_batch(seqs)
+    return spliter.split_tissue_batch(index, lengths, overhangs)
+
+
+def quantize_keras_model(model, inputs):
+    '''
+    Convert keras model to int8 quantized TFLite model.
+
+    Args:
+      model: keras model.
+      inputs: list of arrays of each input of the model to
+        calibrate activations, one sample at a time.
+
+    Returns:
+      bytes of TFLite flatbuffer.
+    '''
+    import tensorflow as tf
+
+    def representative_dataset():
+        for i in range(len(inputs[0])):
+            yield [x[i:i + 1].astype('float32') for x in inputs]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    return converter.convert()
+
+
+class TFLiteModel:
+    """
+    TFLite model with keras-like `predict` over batches of
+    variable length inputs. Input tensors are resized when the shape
+    of a batch changes.
+
+    Args:
+      path: path of tflite file. Names of keras inputs in order are read
+        from the json file next to it.
+      num_threads: number of threads of the interpreter.
+    """
+
+    def __init__(self, path, num_threads=None):
+        import tensorflow as tf
+        self.path = str(path)
+        with open(self.path + '.json') as f:
+            self.input_names = json.load(f)['input_names']
+        self.interpreter = tf.lite.Interpreter(
+            model_path=self.path, num_threads=num_threads)
+        self.runner = self.interpreter.get_signature_runner()
+
+    def predict(self, x, batch_size=None):
+        '''
+        Predict batch of inputs in chunks of `batch_size`
+          (32 as keras if None).
+        '''
+        xs = x if isinstance(x, (list, tuple)) else [x]
+        batch_size = batch_size or 32
+
+        pred = list()
+        for i in range(0, len(xs[0]), batch_size):
+            outputs = self.runner(**{
+                name: np.ascontiguousarray(v[i:i + batch_size],
+                                           dtype='float32')
+                for name, v in zip(self.input_names, xs)
+            })
+            pred.append(next(iter(outputs.values())))
+        return np.concatenate(pred)
+
+
+def quantized_model_path(model_file, cache_dir=None):
+    '''
+    Path of quantized model of keras model file in the cache.
+    '''
+    key = file_cache_key(model_file, QUANTIZATION_VERSION,
+                         file_cache_key(CALIBRATION_EXONS))
+    quantized_dir = get_cache_dir(cache_dir) / 'quantized'
+    quantized_dir.mkdir(exist_ok=True)
+    name = os.path.splitext(os.path.basename(str(model_file)))[0]
+    return quantized_dir / ('%s-%s.int8.tflite' % (name, key))
+
+
+def load_quantized(model_file, calibration, custom_objects=None,
+                   cache_dir=None, num_threads=None):
+    '''
+    Load int8 quantized model of keras model file, converting and
+      caching it at first use.
+
+    Args:
+      model_file: path of keras h5 model.
+      calibration: callable returning list of arrays of each input
+        of the model to calibrate activations.
+      custom_objects: custom layers of the keras model.
+      cache_dir: cache directory, see `mmsplice.cache.get_cache_dir`.
+      num_threads: number of threads of the interpreter.
+
+    Returns:
+      `TFLiteModel`
+    '''
+    path = quantized_model_path(model_file, cache_dir)
+
+    if not path.exists():
+        from tensorflow.keras.models import load_model
+        logger.info('Quantizing %s' % model_file)
+        model = load_model(model_file, compile=False,
+                           custom_objects=custom_objects)
+        content = quantize_keras_model(model, calibration())
+
+        meta = atomic_path(str(path) + '.json')
+        with open(str(meta), 'w') as f:
+            json.dump({'input_names': list(model.input_names)}, f)
+        os.replace(str(meta), str(path) + '.json')
+
+        tmp = atomic_path(path)
+        with open(str(tmp), 'wb') as f:
+            f.write(content)
+        os.replace(str(tmp), str(path))
+
+    return TFLiteModel(path, num_threads=num_threads)
+
+
+def _throughput(predict, n):
+    start = time.perf_counter()
+    predict()
+    return n / (time.perf_counter() - start)
+
+
+def quantization_report(mmsplice=None, mmsplice_int8=None,
+                        mtsplice=None, mtsplice_int8=None,
+                        num_variants=2000, batch_size=512, seed=0,
+                        exons=None):
+    '''
+    Accuracy and throughput of quantized models against float32 models
+      on random SNVs in exons.
+
+    Args:
+      mmsplice: float32 `MMSplice`, loaded if None.
+      mmsplice_int8: `MMSplice(quantized=True)`, loaded if None.
+      mtsplice: float32 `MTSplice`, loaded if None.
+      mtsplice_int8: `MTSplice(quantized=True)`, loaded if None.
+      num_variants: number of random SNVs.
+      batch_size: inference batch size.
+      seed: random seed of SNVs.
+      exons: exon windows of `calibration_exon_windows`,
+        bundled calibration exons if None.
+
+    Returns:
+      pd.DataFrame of `max_abs_error`, `mean_abs_error` and `pearson_r`
+        of `delta_logit_psi`, modular scores and tissue predictions, and
+        sequences per second of float32 and int8 models.
+    '''
+    from mmsplice.mmsplice import MMSplice
+    from mmsplice.mtsplice import MTSplice
+
+    mmsplice = mmsplice or MMSplice()
+    mmsplice_int8 = mmsplice_int8 or MMSplice(quantized=True)
+    mtsplice = mtsplice or MTSplice()
+    mtsplice_int8 = mtsplice_int8 or MTSplice(quantized=True)
+
+    rng = np.random.RandomState(seed)
+    df = read_calibration_exons() if exons is None else exons
+    df = df.iloc[rng.randint(len(df), size=num_variants)] \
+        .reset_index(drop=True)
+
+    alt_seqs = list()
+    for seq in df['seq']:
+        i = rng.randint(len(seq))
+        base = 'ACGT'.replace(seq[i], '')[rng.randint(3)]
+        alt_seqs.append(seq[:i] + base + seq[i + 1:])
+    df_alt = df.assign(seq=alt_seqs)
+
+    ref = calibration_inputs(mmsplice.spliter, df)
+    alt = calibration_inputs(mmsplice.spliter, df_alt)
+    tissue = calibration_tissue_inputs(mtsplice.spliter, df_alt)
+
+    results = dict()
+    speed = dict()
+    for name, model in [('float32', mmsplice), ('int8', mmsplice_int8)]:
+        X_ref = model.predict_modular_scores_on_batch(ref, batch_size)
+        speed[('mmsplice', name)] = _throughput(
+            lambda: model.predict_modular_scores_on_batch(alt, batch_size),
+            num_variants)
+        X_alt = model.predict_modular_scores_on_batch(alt, batch_size)
+        results[('delta_logit_psi', name)] = predict_deltaLogitPsi(
+            X_ref, X_alt)
+        for i, module in enumerate(mmsplice_module_names):
+            results[(module, name)] = X_ref[:, i]
+
+    for name, model in [('float32', mtsplice), ('int8', mtsplice_int8)]:
+        speed[('mtsplice', name)] = _throughput(
+            lambda: model.predict_on_batch(tissue, batch_size), num_variants)
+        results[('tissues', name)] = model.predict_on_batch(
+            tissue, batch_size).ravel()
+
+    rows = list()
+    for output in dict.fromkeys(k for k, _ in results):
+        x, y = results[(output, 'float32')], results[(output, 'int8')]
+        error = np.abs(x - y)
+        model = 'mtsplice' if output == 'tissues' else 'mmsplice'
+        rows.append({
+            'output': output,
+            'max_abs_error': error.max(),
+            'mean_abs_error': error.mean(),
+            'pearson_r': np.corrcoef(x, y)[0, 1],
+            'float32_seqs_per_sec': speed[(model, 'float32')],
+            'int8_seqs_per_sec': speed[(model, 'int8')],
+        })
+    df_report = pd.DataFrame(rows).set_index('output')
+    df_report['speedup'] = df_report['int8_seqs_per_sec'] \
+        / df_report['float32_seqs_per_sec']
+    return df_report
@@ -0,0 +1,382 @@
+import os
+import json
+import logging
+import multiprocessing
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from mmsplice.utils import encode_index, mmsplice_ref_modules, N_INDEX, \
+    LINEAR_HEADS, _strip_chr
+from mmsplice.cache import atomic_path
+from mmsplice.exon_dataloader import SeqSpliter
+
+logger = logging.getLogger('mmsplice')
+
+BASES = 'ACGT'
+
+SNV_TABLE_VERSION = 1
+
+# columns of score arrays of each chromosome
+score_columns = ['mmsplice_alt_acceptorIntron', 'mmsplice_alt_acceptor',
+                 'mmsplice_alt_exon', 'mmsplice_alt_donor',
+                 'mmsplice_alt_donorIntron', 'mmsplice_delta_logit_psi']
+
+window_columns = ['Chromosome', 'Start', 'End', 'Strand',
+                  'left_overhang', 'right_overhang']
+
+
+def snv_keys(pos, alt, exon_row):
+    '''
+    Keys of SNVs in an exon window as uint64 `pos << 34 | alt << 32 | row`.
+
+    Args:
+      pos: 1-based position of SNVs.
+      alt: index of alternative base in `BASES` on the forward strand.
+      exon_row: row of the exon window in the table.
+    '''
+    return (np.asarray(pos).astype('uint64') << np.uint64(34)) \
+        | (np.asarray(alt).astype('uint64') << np.uint64(32)) \
+        | np.asarray(exon_row).astype('uint64')
+
+
+def _exon_snvs(index, start, end, strand):
+    '''
+    All SNVs of a window as (seq_pos, alt_index, pos, genomic_alt)
+      preceded by a reference entry with `alt_index=-1`. `index` is the
+      encoded sequence of the window on its strand.
+    '''
+    seq_pos = np.repeat(np.where(index < N_INDEX)[0], 3)
+    alt = (index[seq_pos] + np.tile(np.arange(1, 4), len(seq_pos) // 3)) % 4
+
+    if strand == '-':
+        pos, genomic_alt = end - seq_pos, 3 - alt
+    else:
+        pos, genomic_alt = start + seq_pos + 1, alt
+
+    return (np.concatenate([[-1], seq_pos]),
+            np.concatenate([[-1], alt]).astype('int64'),
+            np.concatenate([[0], pos]).astype('int64'),
+            np.concatenate([[-1], genomic_alt]).astype('int64'))
+
+
+def iter_snv_batches(exons, fasta_file, batch_size=512, spliter=None):
+    '''
+    Batches of all possible SNVs in exon windows split and encoded for
+      `MMSplice.predict_modular_scores_on_batch`. The window sequence is
+      fetched and encoded once per exon and alternative sequences are
+      copies of it with one base replaced, so no strings are built
+      per SNV. Each exon is preceded by a row of its reference sequence
+      with `alt=-1`.
+
+    Args:
+      exons: table of exon windows with columns of `window_columns`
+        and `row` as the row of the window in the table.
+      fasta_file: fasta file of the genome.
+      batch_size: number of sequences in a batch.
+      spliter: `SeqSpliter` to split sequences for modules.
+
+    Returns:
+      iterator of dict with `inputs` as one-hot encoded modules and
+        `metadata` with `row`, `pos` and `alt` arrays.
+    '''
+    from kipoiseq.dataclasses import Interval
+    from kipoiseq.extractors import FastaStringExtractor
+
+    fasta = FastaStringExtractor(fasta_file, use_strand=True)
+    fasta_chroms = set(fasta.fasta.keys())
+    spliter = spliter or SeqSpliter(pattern_warning=False)
+
+    pieces, filled = list(), 0
+
+    def _batch():
+        lengths = np.concatenate([[p[0].shape[1]] * len(p[0])
+                                  for p in pieces])
+        index = np.full((len(lengths), lengths.max()), N_INDEX,
+                        dtype='uint8')
+        offset = 0
+        for p in pieces:
+            index[offset:offset + len(p[0]), :p[0].shape[1]] = p[0]
+            offset += len(p[0])
+        overhangs, rows, pos, alt = (
+            np.concatenate([p[i] for p in pieces]) for i in range(1, 5))
+        return {
+            'inputs': spliter.split_batch(index, lengths, overhangs,
+                                          pattern_warning=False),
+            'metadata': {'row': rows, 'pos': pos, 'alt': alt}
+        }
+
+    for row, chrom, start, end, strand, left, right in zip(
+            exons['row'], exons['Chromosome'], exons['Start'],
+            exons['End'], exons['Strand'], exons['left_overhang'],
+            exons['right_overhang']):
+        if chrom not in fasta_chroms:
+            chrom = 'chr' + chrom
+        index = encode_index(fasta.extract(
+            Interval(chrom, int(start), int(end), strand=strand)))
+        overhang = (right, left) if strand == '-' else (left, right)
+        seq_pos, alt, pos, genomic_alt = _exon_snvs(index, start, end, strand)
+
+        i = 0
+        while i < len(seq_pos):
+            n = min(batch_size - filled, len(seq_pos) - i)
+            rows = np.repeat(index[None], n, axis=0)
+            snv = seq_pos[i:i + n] >= 0
+            rows[np.where(snv)[0], seq_pos[i:i + n][snv]] = alt[i:i + n][snv]
+            pieces.append((rows, np.tile(overhang, (n, 1)),
+                           np.full(n, row, dtype='int64'),
+                           pos[i:i + n], genomic_alt[i:i + n]))
+            filled += n
+            i += n
+            if filled == batch_size:
+                yield _batch()
+                pieces, filled = list(), 0
+
+    if pieces:
+        yield _batch()
+
+
+def _score_chromosome(chrom, exons, fasta_file, output_dir, batch_size=512):
+    '''
+    Score all SNVs of exon windows of a chromosome and write sorted
+      keys and scores to `<output_dir>/<chrom>.keys.npy` and
+      `<chrom>.scores.npy`.
+
+    Returns:
+      (chrom, reference modular scores of windows, number of SNVs)
+    '''
+    from mmsplice.mmsplice import MMSplice
+    model = MMSplice()
+    output_dir = Path(output_dir)
+
+    offset = int(exons['row'][0])
+    ref = np.full((len(exons['row']), 5), np.nan, dtype='float32')
+    keys, scores = list(), list()
+
+    for batch in iter_snv_batches(exons, fasta_file, batch_size):
+        X = model.predict_modular_scores_on_batch(
+            batch['inputs'], batch_size=batch_size)
+        rows, pos, alt = (batch['metadata'][k] for k in ['row', 'pos', 'alt'])
+
+        # reference of an exon precedes its SNVs in the same or earlier batch
+        is_ref = alt < 0
+        ref[rows[is_ref] - offset] = X[is_ref]
+        snv = ~is_ref
+        X_ref, X_alt = ref[rows[snv] - offset], X[snv]
+        delta = LINEAR_HEADS.predict(
+            X_ref, X_alt, ['delta_logit_psi'])['delta_logit_psi']
+
+        keys.append(snv_keys(pos[snv], alt[snv], rows[snv]))
+        scores.append(np.column_stack([X_alt, delta]).astype('float32'))
+
+    keys = np.concatenate(keys) if keys else np.array([], dtype='uint64')
+    scores = np.concatenate(scores) if scores \
+        else np.zeros((0, len(score_columns)), dtype='float32')
+    order = np.argsort(keys, kind='stable')
+
+    for name, arr in [('keys', keys[order]), ('scores', scores[order])]:
+        path = output_dir / ('%s.%s.npy' % (chrom, name))
+        tmp = atomic_path(path)
+        with open(str(tmp), 'wb') as f:
+            np.save(f, arr)
+        os.replace(str(tmp), str(path))
+
+    return chrom, ref, len(keys)
+
+
+def _score_chromosome_args(args):
+    return _score_chromosome(*args)
+
+
+def read_snv_windows(annotation, overhang=(100, 100), regions=None):
+    '''
+    Unique exon windows of annotation (exons with their overhang) scored
+      in SNV tables, sorted by chromosome and start. Chromosome names are
+      without `chr` prefix.
+
+    Args:
+      annotation: 'grch37', 'grch38' or path of gtf file.
+      overhang: overhang of exons for gtf files.
+      regions: only windows overlapping with target regions, see
+        `mmsplice.vcf_matcher.read_regions`.
+    '''
+    from mmsplice.vcf_dataloader import read_exon_table
+    from mmsplice.vcf_matcher import ExonIntervalIndex, read_regions
+
+    df = read_exon_table(annotation, overhang)[window_columns].copy()
+    df['Chromosome'] = _strip_chr(df['Chromosome'])
+    df = df.drop_duplicates() \
+        .sort_values(['Chromosome', 'Start', 'End', 'Strand']) \
+        .reset_index(drop=True)
+
+    if regions is not None:
+        df_regions = read_regions(regions)
+        index = ExonIntervalIndex(df['Chromosome'], df['Start'], df['End'])
+        _, exon_index = index.query(
+            _strip_chr(df_regions['Chromosome']),
+            df_regions['Start'], df_regions['End'])
+        if len(exon_index) == 0:
+            raise ValueError('None of the exons overlap with given regions')
+        df = df.iloc[np.unique(exon_index)].reset_index(drop=True)
+
+    return df
+
+
+def build_snv_table(annotation, fasta_file, output_dir, overhang=(100, 100),
+                    regions=None, batch_size=512, n_jobs=1, progress=True):
+    '''
+    Precompute modular scores and delta_logit_psi of all possible SNVs
+      in exon windows of annotation for `SNVScoreTable` lookups.
+
+    Chromosomes are scored in parallel by `n_jobs` processes, each
+    loading its own `MMSplice` model. The table is a directory of:
+
+      - `table.json`: annotation, overhang and number of SNVs
+        of each chromosome.
+      - `exons.csv.gz`: exon windows and their reference modular scores.
+      - `<chrom>.keys.npy`: sorted uint64 keys of SNVs, see `snv_keys`.
+      - `<chrom>.scores.npy`: (n, 6) float32 alternative modular scores
+        and delta_logit_psi of SNVs in order of keys (`score_columns`).
+
+    Args:
+      annotation: 'grch37', 'grch38' or path of gtf file.
+      fasta_file: fasta file of the genome.
+      output_dir: directory of the table.
+      overhang: overhang of exons for gtf files.
+      regions: only score windows overlapping with target regions.
+      batch_size: number of sequences in a batch.
+      n_jobs: number of processes.
+      progress: show progress bar over chromosomes.
+
+    Returns:
+      `SNVScoreTable` of the table.
+    '''
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    df = read_snv_windows(annotation, overhang, regions)
+    tasks, chrom_rows = list(), dict()
+    for chrom, rows in df.groupby('Chromosome', sort=True).indices.items():
+        exons = {k: df[k].values[rows] for k in window_columns}
+        exons['row'] = chrom_rows[chrom] = rows
+        tasks.append((chrom, exons, fasta_file, str(output_dir), batch_size))
+
+    ref = np.full((len(df), 5), np.nan, dtype='float32')
+    chroms = dict()
+
+    if n_jobs > 1:
+        # tensorflow is not fork-safe
+        pool = multiprocessing.get_context('spawn').Pool(n_jobs)
+        results = pool.imap_unordered(_score_chromosome_args, tasks)
+    else:
+        pool = None
+        results = map(_score_chromosome_args, tasks)
+
+    try:
+        if progress:
+            results = tqdm(results, total=len(tasks))
+        for chrom, chrom_ref, n in results:
+            ref[chrom_rows[chrom]] = chrom_ref
+            chroms[chrom] = n
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    df = pd.concat([df, pd.DataFrame(ref, columns=mmsplice_ref_modules)],
+                   axis=1)
+    df.to_csv(output_dir / 'exons.csv.gz', index=False)
+
+    metadata = {
+        'version': SNV_TABLE_VERSION,
+        'annotation': str(annotation),
+        'overhang': list(overhang),
+        'chroms': dict(sorted(chroms.items()))
+    }
+    with open(str(output_dir / 'table.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    logger.info('%d SNVs of %d exon windows are scored'
+                % (sum(chroms.values()), len(df)))
+    return SNVScoreTable(output_dir)
+
+
+class SNVScoreTable:
+    """
+    Lookup of precomputed scores of SNVs in exon windows,
+      see `build_snv_table`. Arrays of chromosomes are memory-mapped
+      at their first lookup, so a lookup is a binary search on keys.
+
+    Args:
+      path: directory of the table.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(str(self.path / 'table.json')) as f:
+            self.metadata = json.load(f)
+        if self.metadata.get('version') != SNV_TABLE_VERSION:
+            raise ValueError('Unsupported version of SNV table: %s'
+                             % self.metadata.get('version'))
+        self.overhang = tuple(self.metadata['overhang'])
+
+        df = pd.read_csv(self.path / 'exons.csv.gz',
+                         dtype={'Chromosome': str})
+        self.windows = {
+            k: i for i, k in enumerate(zip(
+                df['Chromosome'], df['Start'].tolist(), df['End'].tolist(),
+                df['Strand'], df['left_overhang'].tolist(),
+                df['right_overhang'].tolist()))
+        }
+        self.ref_scores = df[mmsplice_ref_modules].values.astype('float32')
+        self._arrays = dict()
+
+    def _chrom_arrays(self, chrom):
+        if chrom not in self._arrays:
+            if chrom in self.metadata['chroms']:
+                self._arrays[chrom] = tuple(
+                    np.load(str(self.path / ('%s.%s.npy' % (chrom, name))),
+                            mmap_mode='r')
+                    for name in ['keys', 'scores'])
+            else:
+                self._arrays[chrom] = None
+        return self._arrays[chrom]
+
+    def exon_row(self, chrom, start, end, strand, overhang):
+        '''
+        Row of exon window (0-based start and end including overhang)
+          in the table, None if the window is not in the table.
+        '''
+        return self.windows.get(
+            (_strip_chr([chrom])[0], start, end, strand, *overhang))
+
+    def scores(self, chrom, start, end, strand, overhang, pos, alt):
+        '''
+        Modular scores of an SNV in an exon window.
+
+        Args:
+          chrom: chromosome of the exon.
+          start: 0-based start of the exon window including overhang.
+          end: end of the exon window including overhang.
+          strand: strand of the exon.
+          overhang: (left, right) overhang of the window on forward strand.
+          pos: 1-based position of the SNV.
+          alt: alternative base on the forward strand.
+
+        Returns:
+          (2, 5) float32 array of reference and alternative modular scores,
+            None if the SNV is not in the table.
+        '''
+        row = self.exon_row(chrom, start, end, strand, overhang)
+        if row is None or alt not in BASES:
+            return None
+        arrays = self._chrom_arrays(_strip_chr([chrom])[0])
+        if arrays is None:
+            return None
+
+        keys, scores = arrays
+        key = snv_keys(pos, BASES.index(alt), row)
+        i = int(keys.searchsorted(key))
+        if i == len(keys) or keys[i] != key:
+            return None
+        return np.stack([self.ref_scores[row], scores[i, :5]])
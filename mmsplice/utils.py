@@ -5,9 +5,11 @@ import pyranges
 from kipoiseq.dataclasses import Variant
 import kipoiseq.transforms.functional as F
 from kipoiseq.extractors import MultiSampleVCF
-from sklearn.externals import joblib
 from pkg_resources import resource_filename
 import os
+import json
+from mmsplice.cache import get_cache_dir, file_cache_key, atomic_path
+from mmsplice.linear_heads import LinearHeads
 
 
 mmsplice_module_names = [
@@ -26,13 +28,35 @@ mmsplice_modules = [
 ]
 
 
-LINEAR_MODEL = joblib.load(resource_filename(
+class _SklearnModel:
+    """
+    sklearn model of a pickle loaded at first use, so sklearn is only
+    imported if the model is used directly. Predictions of mmsplice use
+    `LINEAR_HEADS` instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._model = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._model is None:
+            from sklearn.externals import joblib
+            self._model = joblib.load(self.path)
+        return getattr(self._model, name)
+
+
+LINEAR_MODEL = _SklearnModel(resource_filename(
     'mmsplice', 'models/linear_model.pkl'))
-LOGISTIC_MODEL = joblib.load(resource_filename(
+LOGISTIC_MODEL = _SklearnModel(resource_filename(
     'mmsplice', 'models/Pathogenicity.pkl'))
-EFFICIENCY_MODEL = joblib.load(resource_filename(
+EFFICIENCY_MODEL = _SklearnModel(resource_filename(
     'mmsplice', 'models/splicing_efficiency.pkl'))
 
+LINEAR_HEADS = LinearHeads.load()
+
 ref_psi_annotation = {
     'grch37': resource_filename(
         'mmsplice', 'models/gtex_psi_map37_ranges.csv.gz'),
@@ -41,37 +65,122 @@ ref_psi_annotation = {
 }
 
 
-def df_batch_writer(df_iter, output):
-    df = next(df_iter)
-    with open(output, 'w') as f:
-        df.to_csv(f, index=False)
+def read_progress(manifest):
+    '''
+    Read progress manifest of `predict_save`, None if it does not exist.
+    '''
+    if not os.path.exists(str(manifest)):
+        return None
+    with open(str(manifest)) as f:
+        return json.load(f)
+
+
+def write_progress(manifest, progress):
+    '''
+    Atomically write progress manifest of `predict_save`.
+    '''
+    tmp = atomic_path(manifest)
+    with open(str(tmp), 'w') as f:
+        json.dump(progress, f)
+    os.replace(str(tmp), str(manifest))
+
+
+def _num_samples(df):
+    '''
+    Number of dataloader samples of predictions,
+      see `MMSplice.predict_on_dataloader`.
+    '''
+    return df.attrs.get('samples', len(df))
+
+
+def df_batch_writer(df_iter, output, manifest=None, progress=None):
+    '''
+    Write dataframes of iterator into a csv file.
+
+    Args:
+      df_iter: iterator of pd.DataFrame.
+      output: path of csv file.
+      manifest: path of progress manifest updated after each dataframe
+        with number of rows, dataloader samples and bytes written.
+      progress: progress of an interrupted run. The csv file is truncated
+        to the last complete dataframe and appended.
+    '''
+    progress = dict(progress or {'rows': 0, 'batches': 0, 'bytes': 0})
+
+    if progress['bytes']:
+        with open(output, 'r+') as f:
+            f.truncate(progress['bytes'])
+        mode = 'a'
+    else:
+        mode = 'w'
 
-    with open(output, 'a') as f:
+    with open(output, mode) as f:
         for df in df_iter:
-            df.to_csv(f, index=False, header=False)
+            df.to_csv(f, index=False, header=mode == 'w')
+            mode = 'a'
+
+            if manifest:
+                f.flush()
+                progress['rows'] += len(df)
+                progress['samples'] = progress.get('samples', 0) \
+                    + _num_samples(df)
+                progress['batches'] += 1
+                progress['bytes'] = f.tell()
+                write_progress(manifest, progress)
+
 
+def df_batch_writer_parquet(df_iter, output_dir, batch_size_parquet=1000000,
+                            manifest=None, progress=None):
+    '''
+    Write dataframes of iterator into parts of parquet files in a directory.
 
-def df_batch_writer_parquet(df_iter, output_dir, batch_size_parquet=1000000):
+    Args:
+      df_iter: iterator of pd.DataFrame.
+      output_dir: directory of parquet files.
+      batch_size_parquet: minimum number of rows in each part.
+      manifest: path of progress manifest updated after each part
+        with number of rows, dataloader samples and dataframes written.
+      progress: progress of an interrupted run. Parts written after
+        the last update of the manifest are removed and rewritten.
+    '''
     if not os.path.isdir(output_dir):
         output_dir.mkdir(exist_ok=True)
 
+    progress = dict(progress or {'rows': 0, 'batches': 0})
+    start_batch = progress['batches']
+
+    for part_file in output_dir.glob('*.parquet'):
+        if part_file.stem.isdigit() and int(part_file.stem) >= start_batch:
+            part_file.unlink()
+
+    def _write_part(dfs, batch_num):
+        num_samples = sum(map(_num_samples, dfs))
+        df_all = pd.concat(dfs, axis=0)
+        part_file = output_dir / f"{batch_num}.parquet"
+        tmp = atomic_path(part_file)
+        df_all.to_parquet(tmp, index=False, engine='pyarrow')
+        os.replace(str(tmp), str(part_file))
+
+        if manifest:
+            progress['rows'] += len(df_all)
+            progress['samples'] = progress.get('samples', 0) + num_samples
+            progress['batches'] = batch_num + 1
+            write_progress(manifest, progress)
+
     dfs = list()
     num_rows = 0
-    
-    for batch_num, df in enumerate(df_iter):
+    batch_num = start_batch - 1
+
+    for batch_num, df in enumerate(df_iter, start_batch):
         dfs.append(df)
         num_rows += df.shape[0]
         if num_rows >= batch_size_parquet:
-            df_all = pd.concat(dfs, axis=0)
-            part_file = output_dir / f"{batch_num}.parquet"
-            df_all.to_parquet(part_file, index=False, engine='pyarrow')
+            _write_part(dfs, batch_num)
             dfs = list()
             num_rows = 0
     if num_rows > 0:
         batch_num += 1
-        df_all = pd.concat(dfs, axis=0)
-        part_file = output_dir / f"{batch_num}.parquet"
-        df_all.to_parquet(part_file, index=False, engine='pyarrow')
+        _write_part(dfs, batch_num)
 
 
 def left_normalized(variant):
@@ -171,19 +280,18 @@ def transform(X, region_only=False):
 
 
 def predict_deltaLogitPsi(X_ref, X_alt):
-    return LINEAR_MODEL.predict(transform(X_alt - X_ref, region_only=False))
+    return LINEAR_HEADS.predict(
+        X_ref, X_alt, ['delta_logit_psi'])['delta_logit_psi']
 
 
 def predict_pathogenicity(X_ref, X_alt):
-    X = transform(X_alt - X_ref, region_only=True)
-    X = np.concatenate([X_ref, X_alt, X[:, -3:]], axis=-1)
-    return LOGISTIC_MODEL.predict_proba(X)[:, 1]
+    return LINEAR_HEADS.predict(
+        X_ref, X_alt, ['pathogenicity'])['pathogenicity']
 
 
 def predict_splicing_efficiency(X_ref, X_alt):
-    X = transform(X_alt - X_ref, region_only=False)
-    X = X[:, [1, 2, 3, 5]]  # no intronic modules
-    return EFFICIENCY_MODEL.predict(X)
+    return LINEAR_HEADS.predict(
+        X_ref, X_alt, ['efficiency'])['efficiency']
 
 
 def read_vep(vep_result_path,
@@ -291,6 +399,38 @@ def region_annotate(variant: Variant, exon: Interval) -> str:
             return 'acceptor'
 
 
+def region_annotate_batch(pos, exon_start, exon_end, strand):
+    '''
+    Vectorized `region_annotate` over arrays of variant positions (1-based)
+      and exons (0-based).
+
+    Returns:
+      np.array of region of each variant.
+    '''
+    pos = np.asarray(pos, dtype='int64')
+    start = np.asarray(exon_start, dtype='int64') + 1
+    end = np.asarray(exon_end, dtype='int64')
+    plus = np.asarray(strand) == '+'
+
+    left_len = np.where(plus, 20, 5)
+    right_len = np.where(plus, 5, 20)
+    left_dinu = np.where(plus, 'acceptor_dinu', 'donor_dinu')
+    left = np.where(plus, 'acceptor', 'donor')
+    right_dinu = np.where(plus, 'donor_dinu', 'acceptor_dinu')
+    right = np.where(plus, 'donor', 'acceptor')
+
+    return np.select([
+        (pos < start - left_len) | (pos > end + right_len),
+        (start - 2 <= pos) & (pos < start),
+        (start - left_len <= pos) & (pos < start + 3),
+        (start + 3 <= pos) & (pos <= end - 3),
+        (end < pos) & (pos <= end + 2),
+        (end - 3 < pos) & (pos <= end + right_len)
+    ], [
+        'intronic', left_dinu, left, 'exonic', right_dinu, right
+    ], default=None).astype(object)
+
+
 bases = ['A', 'C', 'G', 'T']
 
 
@@ -312,6 +452,119 @@ def encodeDNA(seq_vec):
     ])
 
 
+N_INDEX = 4
+
+_ascii_to_index = np.full(256, N_INDEX, dtype='uint8')
+for _i, _base in enumerate(bases):
+    _ascii_to_index[ord(_base)] = _i
+    _ascii_to_index[ord(_base.lower())] = _i
+
+_index_to_onehot = np.vstack([np.eye(len(bases)),
+                              np.zeros((1, len(bases)))]).astype('float32')
+
+
+def encode_index(seq):
+    '''
+    Encode sequence as uint8 base index: A, C, G, T as 0-3,
+      anything else as `N_INDEX`.
+    '''
+    return _ascii_to_index[np.frombuffer(seq.encode('ascii'), dtype='uint8')]
+
+
+def encode_index_batch(seq_vec, out=None):
+    '''
+    Encode sequences as `N_INDEX` padded (batch, max_len) index matrix.
+
+    Args:
+      seq_vec: list of sequences.
+      out: optional uint8 buffer to write into. A new array is allocated
+        if it is smaller than (len(seq_vec), max_len).
+
+    Returns:
+      (index matrix, lengths of sequences)
+    '''
+    lengths = np.fromiter(map(len, seq_vec), dtype='int64',
+                          count=len(seq_vec))
+    max_len = int(lengths.max()) if len(lengths) else 0
+    if out is None or out.shape[0] < len(seq_vec) or out.shape[1] < max_len:
+        out = np.empty((len(seq_vec), max_len), dtype='uint8')
+    else:
+        out = out[:len(seq_vec), :max_len]
+    out.fill(N_INDEX)
+    for i, seq in enumerate(seq_vec):
+        out[i, :lengths[i]] = encode_index(seq)
+    return out, lengths
+
+
+def onehot_index(index, out=None):
+    '''
+    One-hot encode index matrix with `N_INDEX` as zero vector,
+      equivalent to `encodeDNA` of the decoded sequences.
+
+    Args:
+      index: (batch, len) uint8 index matrix.
+      out: optional flat float32 buffer. Result is a contiguous view into
+        it if its size is at least batch * len * 4, otherwise a new array.
+    '''
+    shape = (*index.shape, len(bases))
+    if out is None or out.size < np.prod(shape):
+        return _index_to_onehot[index]
+    out = out[:int(np.prod(shape))].reshape(shape)
+    np.take(_index_to_onehot, index, axis=0, out=out, mode='clip')
+    return out
+
+
+def mutagenesis_batches(index, overhang, batch_size=512, deletions=False):
+    '''
+    Batches of all single base substitutions (and 1 bp deletions)
+      of an index encoded sequence as index matrices, without building
+      strings of mutated sequences.
+
+    Args:
+      index: (len,) uint8 sequence of `encode_index`.
+      overhang: (intron_length acceptor side, intron_length donor side)
+        of the sequence. Deletions in introns shorten the overhang.
+      batch_size: number of mutated sequences in a batch.
+      deletions: include 1 bp deletions at each position.
+
+    Returns:
+      iterator of (index matrix, lengths, overhangs, pos, alt) where
+        `pos` is mutated position and `alt` is base index of the
+        substitution or `N_INDEX` for deletions. Positions with `N`
+        have no substitutions.
+    '''
+    index = np.asarray(index, dtype='uint8')
+    length = len(index)
+
+    pos = np.repeat(np.where(index < N_INDEX)[0], 3)
+    alt = (index[pos] + np.tile(np.arange(1, 4), len(pos) // 3)) % 4
+    if deletions:
+        pos = np.concatenate([pos, np.arange(length)])
+        alt = np.concatenate([alt, np.full(length, N_INDEX)])
+    alt = alt.astype('uint8')
+
+    for i in range(0, len(pos), batch_size):
+        b_pos, b_alt = pos[i:i + batch_size], alt[i:i + batch_size]
+        deletion = b_alt == N_INDEX
+        rows = np.repeat(index[None], len(b_pos), axis=0)
+
+        substitution = np.where(~deletion)[0]
+        rows[substitution, b_pos[substitution]] = b_alt[substitution]
+
+        # deleted base is removed by shifting the rest of sequence left
+        deleted = np.where(deletion)[0]
+        shift = np.arange(length)[None] >= b_pos[deleted, None]
+        cols = np.minimum(np.arange(length)[None] + shift, length - 1)
+        rows[deleted] = index[cols]
+        rows[deleted, -1] = N_INDEX
+
+        lengths = np.where(deletion, length - 1, length)
+        overhangs = np.tile(overhang, (len(b_pos), 1))
+        overhangs[deletion & (b_pos < overhang[0]), 0] -= 1
+        overhangs[deletion & (b_pos >= length - overhang[1]), 1] -= 1
+        yield rows, lengths, overhangs, b_pos, b_alt
+
+
 ascot_to_gtex_tissue_mapping = {
     'Adrenal Gland': 'Adrenal Gland',
     'Amygdala - Brain': 'Brain - Amygdala',
@@ -370,7 +623,7 @@ ascot_to_gtex_tissue_mapping = {
 }
 
 
-def read_ref_psi_annotation(ref_psi_version, chroms=None):
+def _read_ref_psi_table(ref_psi_version):
     if ref_psi_version in ref_psi_annotation:
         df_ref = pd.read_csv(ref_psi_annotation[ref_psi_version])
     else:
@@ -382,6 +635,11 @@ def read_ref_psi_annotation(ref_psi_version, chroms=None):
         for k, v in ascot_to_gtex_tissue_mapping.items()
     })
     df_ref['Start'] -= 1  # 1-based to zero based
+    return df_ref
+
+
+def read_ref_psi_annotation(ref_psi_version, chroms=None):
+    df_ref = _read_ref_psi_table(ref_psi_version)
 
     chr_annotaion = any(chrom.startswith('chr') for chrom in chroms)
     if not chr_annotaion:
@@ -395,6 +653,138 @@ def read_ref_psi_annotation(ref_psi_version, chroms=None):
     return df_ref.set_index('exons')
 
 
+def _strip_chr(chroms):
+    return np.array([c[3:] if c.startswith('chr') else c
+                     for c in np.asarray(chroms).astype(str)])
+
+
+class RefPSIStore:
+    """
+    Reference PSI of exons compiled into numeric arrays for vectorized
+    lookup of batches.
+
+    Exons are grouped by (chromosome id, strand) and sorted within group
+    by `start << 32 | end`, so lookup is a binary search per group.
+    Chromosome names are stored without `chr` prefix and queries are
+    normalized the same way.
+
+    Args:
+      chroms: chromosome names, position is the chromosome id.
+      group_offsets: row range of each (chrom id * 2 + is_minus) group.
+      keys: uint64 `start << 32 | end` sorted within group.
+      psi: (n_exons, n_tissues) reference PSI.
+      tissues: tissue names of psi columns.
+    """
+
+    def __init__(self, chroms, group_offsets, keys, psi, tissues):
+        self.chroms = list(chroms)
+        self.chrom_ids = {c: i for i, c in enumerate(self.chroms)}
+        self.group_offsets = np.asarray(group_offsets, dtype='int64')
+        self.keys = np.asarray(keys, dtype='uint64')
+        self.psi = np.ascontiguousarray(psi, dtype='float32')
+        self.tissues = list(tissues)
+
+    @staticmethod
+    def _keys(start, end):
+        return (np.asarray(start).astype('uint64') << np.uint64(32)) \
+            | np.asarray(end).astype('uint64')
+
+    @classmethod
+    def from_dataframe(cls, df_ref):
+        """
+        Compile reference PSI table with columns of
+          `Chromosome, Start (0-based), End, Strand` and tissue columns
+          starting from the 7th column.
+        """
+        tissues = df_ref.columns[6:]
+        chrom = _strip_chr(df_ref['Chromosome'])
+        chroms, chrom_ids = np.unique(chrom, return_inverse=True)
+        groups = chrom_ids * 2 + (df_ref['Strand'].values == '-')
+        keys = cls._keys(df_ref['Start'].values, df_ref['End'].values)
+
+        order = np.lexsort((keys, groups))
+        groups, keys = groups[order], keys[order]
+        unique = np.ones(len(keys), dtype=bool)
+        unique[1:] = (groups[1:] != groups[:-1]) | (keys[1:] != keys[:-1])
+        order, groups, keys = order[unique], groups[unique], keys[unique]
+
+        group_offsets = np.searchsorted(
+            groups, np.arange(len(chroms) * 2 + 1))
+        psi = df_ref[tissues].values[order]
+        return cls(chroms, group_offsets, keys, psi, tissues)
+
+    @classmethod
+    def load(cls, ref_psi_version, cache_dir=None):
+        """
+        Load compiled reference PSI of `ref_psi_version` from on-disk cache,
+          compiles and caches it at first use.
+        """
+        if ref_psi_version not in ref_psi_annotation:
+            raise ValueError('ref_psi_version should be one of %s'
+                             % str(list(ref_psi_annotation.keys())))
+        try:
+            key = file_cache_key(ref_psi_annotation[ref_psi_version])
+            path = get_cache_dir(cache_dir) / ('ref_psi-%s.npz' % key)
+        except OSError:
+            return cls.from_dataframe(_read_ref_psi_table(ref_psi_version))
+
+        if path.exists():
+            with np.load(str(path)) as arrays:
+                return cls(**arrays)
+
+        store = cls.from_dataframe(_read_ref_psi_table(ref_psi_version))
+        tmp = atomic_path(path)
+        with open(str(tmp), 'wb') as f:
+            np.savez(f, chroms=np.array(store.chroms),
+                     group_offsets=store.group_offsets, keys=store.keys,
+                     psi=store.psi, tissues=np.array(store.tissues))
+        os.replace(str(tmp), str(path))
+        return store
+
+    def lookup(self, chrom, start, end, strand):
+        """
+        Row index of exons in `self.psi`, -1 for exons without reference.
+        """
+        chroms, inverse = np.unique(_strip_chr(chrom), return_inverse=True)
+        chrom_ids = np.array([self.chrom_ids.get(c, -1) for c in chroms],
+                             dtype='int64')[inverse]
+        groups = chrom_ids * 2 + (np.asarray(strand) == '-')
+        groups[chrom_ids < 0] = -1
+        keys = self._keys(start, end)
+
+        index = np.full(len(keys), -1, dtype='int64')
+        for g in np.unique(groups[groups >= 0]):
+            query = groups == g
+            lo, hi = self.group_offsets[g], self.group_offsets[g + 1]
+            pos = lo + np.searchsorted(self.keys[lo:hi], keys[query])
+            pos_in = np.minimum(pos, len(self.keys) - 1)
+            found = (pos < hi) & (self.keys[pos_in] == keys[query])
+            index[query] = np.where(found, pos, -1)
+        return index
+
+    def gather(self, chrom, start, end, strand, tissues=None):
+        """
+        Reference PSI of exons as (n_exons, n_tissues) array,
+          NaN for exons without reference.
+
+        Args:
+          tissues: subset of `self.tissues` to gather, all if None.
+        """
+        index = self.lookup(chrom, start, end, strand)
+        found = index >= 0
+
+        if tissues is None:
+            psi = np.full((len(index), len(self.tissues)), np.nan,
+                          dtype='float32')
+            psi[found] = self.psi[index[found]]
+        else:
+            columns = [self.tissues.index(t) for t in tissues]
+            psi = np.full((len(index), len(columns)), np.nan,
+                          dtype='float32')
+            psi[found] = self.psi[np.ix_(index[found], columns)]
+        return psi
+
+
 def delta_logit_PSI_to_delta_PSI(delta_logit_psi, ref_psi,
                                  genotype=None, clip_threshold=0.001):
     ref_psi = clip(ref_psi, clip_threshold)
@@ -408,6 +798,30 @@ def delta_logit_PSI_to_delta_PSI(delta_logit_psi, ref_psi,
     return pred_psi - ref_psi
 
 
+def genotype_delta_psi(delta_psi, genotype):
+    '''
+    Delta PSI of non-reference carriers of variants.
+
+    Delta PSI of heterozygous carriers is half of delta PSI of homozygous
+    carriers as `delta_logit_PSI_to_delta_PSI` with `genotype=1`.
+
+    Args:
+      delta_psi: (n_variants, n_tissues) delta PSI of homozygous carriers.
+      genotype: (n_variants, n_samples) int8 matrix of alt allele counts,
+        negative for missing genotypes.
+
+    Returns:
+      (variant_index, sample_index, delta_psi) of carriers where
+        `delta_psi` is (n_carriers, n_tissues).
+    '''
+    genotype = np.asarray(genotype)
+    variant_index, sample_index = np.nonzero(genotype > 0)
+    scale = genotype[variant_index, sample_index] / 2
+    delta_psi = np.asarray(delta_psi)[variant_index]
+    return variant_index, sample_index, \
+        delta_psi * scale.astype(delta_psi.dtype)[:, None]
+
+
 def writeVCF(vcf_in, vcf_out, predictions):
     from cyvcf2 import Writer, VCF
     columns = [
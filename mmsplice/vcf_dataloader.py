@@ -1,15 +1,27 @@
+import os
 import logging
+from itertools import islice
 from pkg_resources import resource_filename
+import numpy as np
 import pandas as pd
 import pyranges
 from kipoi.data import SampleIterator
-from kipoiseq.extractors import MultiSampleVCF, SingleVariantMatcher
+from kipoiseq.extractors import MultiSampleVCF
 from mmsplice.utils import pyrange_remove_chr_from_chrom_annotation,\
-    pyrange_add_chr_from_chrom_annotation
+    pyrange_add_chr_from_chrom_annotation, region_annotate_batch
 from mmsplice.exon_dataloader import ExonSplicingMixin
+from mmsplice.vcf_matcher import ExonVariantMatcher, ExonIntervalIndex, \
+    read_regions, merge_intervals
+from mmsplice.cache import get_cache_dir, file_cache_key, atomic_path, \
+    read_feather, write_feather
+from mmsplice.snv_table import SNVScoreTable, BASES
 
 logger = logging.getLogger('mmsplice')
 
+# alt allele count of `gt_types` of cyvcf2
+# (HOM_REF, HET, UNKNOWN, HOM_ALT), -1 for missing genotypes
+GT_TYPE_TO_ALLELE_COUNT = np.array([0, 1, -1, 2], dtype='int8')
+
 prebuild_annotation = {
     'grch37': resource_filename('mmsplice', 'models/grch37_exons.csv.gz'),
     'grch38': resource_filename('mmsplice', 'models/grch38_exons.csv.gz')
@@ -57,25 +69,314 @@ def read_exon_pyranges(gtf_file, overhang=(100, 100), first_last=True):
     return df_exons
 
 
+def _prebuild_overhang(gtf, overhang):
+    '''
+    Overhang of exons of annotation, (100, 100) for prebuild annotation.
+    '''
+    if gtf in prebuild_annotation:
+        if tuple(overhang) != (100, 100):
+            logger.warning('Overhang argument will be ignored'
+                           ' for prebuild annotation.')
+        return (100, 100)
+    return tuple(overhang)
+
+
+def read_exon_table(gtf, overhang=(100, 100)):
+    '''
+    Read exons of prebuild annotation or gtf file as 0-based table.
+
+    Args:
+      gtf: 'grch37', 'grch38' or path of gtf file.
+      overhang: padding of exon to match variants. Ignored for
+        prebuild annotation which is padded with (100, 100).
+    '''
+    overhang = _prebuild_overhang(gtf, overhang)
+    if gtf in prebuild_annotation:
+        df = pd.read_csv(prebuild_annotation[gtf])
+        df['Start'] -= 1  # convert prebuild annotation to 0-based
+        return df
+    else:
+        return read_exon_pyranges(gtf, overhang=overhang).df
+
+
+def exon_index(df_exons):
+    '''
+    Interval index of exon table sorted by chromosome and start.
+
+    Returns:
+      dict of `chroms`, `offsets` and `counts` which are row ranges of
+        each chromosome in the table and `max_len` the longest
+        interval of each chromosome to bound overlap queries.
+    '''
+    chrom = df_exons['Chromosome'].astype(str).values
+    chroms, offsets, counts = np.unique(
+        chrom, return_index=True, return_counts=True)
+    lengths = (df_exons['End'] - df_exons['Start']).values
+    max_len = np.array([lengths[o:o + c].max()
+                        for o, c in zip(offsets, counts)], dtype='int64')
+    return {
+        'chroms': chroms,
+        'offsets': offsets.astype('int64'),
+        'counts': counts.astype('int64'),
+        'max_len': max_len
+    }
+
+
+def read_exons_cached(gtf, overhang=(100, 100), cache_dir=None):
+    '''
+    Read exon table and its interval index through the on-disk cache.
+
+    The table is sorted by chromosome and start, stored as uncompressed
+    feather file so it can be memory-mapped, and the index as npz. Cache
+    entries are keyed by the path and mtime of the annotation file
+    and overhang.
+
+    Args:
+      gtf: 'grch37', 'grch38' or path of gtf file.
+      overhang: padding of exon to match variants.
+      cache_dir: cache directory, see `mmsplice.cache.get_cache_dir`.
+
+    Returns:
+      (pd.DataFrame, dict) exon table and index of `exon_index`.
+    '''
+    # warns about ignored overhang of prebuild annotation on cache hits
+    overhang = _prebuild_overhang(gtf, overhang)
+    key = file_cache_key(prebuild_annotation.get(gtf, gtf), overhang)
+
+    cache_dir = get_cache_dir(cache_dir)
+    table_path = cache_dir / ('exons-%s.feather' % key)
+    index_path = cache_dir / ('exons-%s.npz' % key)
+
+    if table_path.exists() and index_path.exists():
+        with np.load(str(index_path)) as index:
+            return read_feather(table_path), dict(index)
+
+    df = read_exon_table(gtf, overhang)
+    df['Chromosome'] = df['Chromosome'].astype(str)
+    df = df.sort_values(['Chromosome', 'Start', 'End']) \
+        .reset_index(drop=True)
+    index = exon_index(df)
+
+    write_feather(df, table_path)
+    tmp = atomic_path(index_path)
+    with open(str(tmp), 'wb') as f:
+        np.savez(f, **index)
+    os.replace(str(tmp), str(index_path))
+    return df, index
+
+
 class SplicingVCFMixin(ExonSplicingMixin):
+    # modules masked for all pairs of the dataloader
+    _mask_module = None
+    # (table, index) of exons read from annotation cache
+    _cached_exons = None
 
     def __init__(self, pr_exons, annotation, fasta_file, vcf_file,
                  split_seq=True, encode=True,
                  overhang=(100, 100), seq_spliter=None,
                  tissue_specific=False, tissue_overhang=(300, 300),
-                 interval_attrs=tuple()):
+                 interval_attrs=tuple(), regions=None, prefilter=False,
+                 genotypes=False, samples=None):
         super().__init__(fasta_file, split_seq, encode, overhang, seq_spliter,
                          tissue_specific, tissue_overhang)
-        self.pr_exons = pr_exons
+        # pyranges or table of exons, see `pr_exons`
+        self._exons = pr_exons
         self.annotation = annotation
         self.vcf_file = vcf_file
         self.vcf = MultiSampleVCF(vcf_file)
         self._check_chrom_annotation()
-        self.matcher = SingleVariantMatcher(
-            vcf_file, pranges=self.pr_exons,
-            interval_attrs=interval_attrs
-        )
-        self._generator = iter(self.matcher)
+
+        self.genotypes = genotypes
+        self._sample_index = None
+        self.samples = list(self.vcf.samples)
+        if samples is not None:
+            unknown = set(samples).difference(self.samples)
+            if unknown:
+                raise ValueError('Samples are not in vcf file: %s'
+                                 % ', '.join(sorted(unknown)))
+            self._sample_index = np.array(
+                [self.samples.index(i) for i in samples], dtype='int64')
+            self.samples = list(samples)
+        if genotypes and not self.samples:
+            raise ValueError('vcf file does not contain samples')
+
+        vcf_regions = None
+        if regions is not None:
+            self._exons = df = self._filter_regions(self._exons_df(), regions)
+            vcf_regions = merge_intervals(
+                df['Chromosome'], df['Start'], df['End'])
+            # variants are fetched in order of chromosomes of vcf file
+            rank = {c: i for i, c in enumerate(self.vcf.seqnames)}
+            vcf_regions.sort(key=lambda r: rank.get(r[0], len(rank)))
+
+        exons, index = self._exons, None
+        if self._cached_exons is not None and self._exons is pr_exons:
+            # exons are neither renamed nor filtered, so the cached table
+            # is matched with its interval index as is
+            exons, index = self._cached_exons
+        self.matcher = ExonVariantMatcher(
+            vcf_file, exons, interval_attrs=interval_attrs,
+            regions=vcf_regions, index=index)
+        self.prefilter = prefilter
+        self.prefiltered = dict()
+        if prefilter:
+            self._generator = self._iter_prefiltered()
+        else:
+            self._generator = iter(self.matcher)
+
+    @property
+    def pr_exons(self):
+        '''
+        Exons as pyranges, built from the exon table at first use.
+        '''
+        if isinstance(self._exons, pd.DataFrame):
+            self._exons = pyranges.PyRanges(self._exons)
+        return self._exons
+
+    @pr_exons.setter
+    def pr_exons(self, pr_exons):
+        self._exons = pr_exons
+
+    def _exons_df(self):
+        if isinstance(self._exons, pd.DataFrame):
+            return self._exons
+        return self._exons.df
+
+    def set_profiler(self, profiler):
+        super().set_profiler(profiler)
+        self.matcher.profiler = self.profiler
+
+    def skip(self, n):
+        # variant-exon pairs are skipped before sequence extraction
+        self._generator = islice(self._generator, n, None)
+
+    def _variant_to_dict(self, variant, exon):
+        d = super()._variant_to_dict(variant, exon)
+        if self.genotypes:
+            d['genotype'] = self._genotype(variant)
+        return d
+
+    def _genotype(self, variant):
+        '''
+        Alt allele count of samples as int8 array, -1 if missing.
+        '''
+        gt_types = variant.source.gt_types
+        if self._sample_index is not None:
+            gt_types = gt_types[self._sample_index]
+        return GT_TYPE_TO_ALLELE_COUNT[gt_types]
+
+    def _exon_overhangs(self, exon_index):
+        '''
+        Overhang (genomic left, genomic right) of matched exons.
+        '''
+        return np.tile(self.overhang, (len(exon_index), 1))
+
+    def _iter_prefiltered(self):
+        for variants, variant_index, exon_index in self.matcher.iter_pairs():
+            with self.profiler.stage('prefilter', len(variant_index)):
+                visible = self._visible_pairs(
+                    variants, variant_index, exon_index)
+            for v, e in zip(variant_index[visible], exon_index[visible]):
+                yield self.matcher.interval(e), variants[v]
+
+    def _visible_pairs(self, variants, variant_index, exon_index):
+        '''
+        Vectorized check whether the alternative sequence of pairs differs
+          from the reference sequence in any module not masked, based on
+          the geometry of `SeqSpliter`. Indels shift the flanking sequence
+          to the end of the overhang, so they are seen in the whole
+          flank. Number of filtered pairs per region is kept in
+          `self.prefiltered`.
+
+        Returns:
+          bool array of pairs to predict.
+        '''
+        exons = self.matcher.exons
+        win_start = exons['Start'][exon_index].astype('int64')
+        win_end = exons['End'][exon_index].astype('int64')
+        minus = exons['Strand'][exon_index] == '-'
+        overhang = np.asarray(self._exon_overhangs(exon_index), dtype='int64')
+        start = win_start + overhang[:, 0]
+        end = win_end - overhang[:, 1]
+
+        variants = [variants[i] for i in variant_index]
+        var_start = np.array([v.start for v in variants], dtype='int64')
+        var_end = np.array([v.end for v in variants], dtype='int64')
+        indel = np.array([len(v.ref) != len(v.alt) for v in variants],
+                         dtype=bool)
+        same = np.array([v.ref == v.alt for v in variants], dtype=bool)
+
+        left = indel & (var_end <= start)
+        right = indel & (var_start >= end)
+        core = indel & ~left & ~right
+        var_start = np.maximum(
+            np.where(left | core, win_start, var_start), win_start)
+        var_end = np.minimum(
+            np.where(right | core, win_end, var_end), win_end)
+
+        # genomic to sequence coordinates of strand
+        seq_start = np.where(minus, win_end - var_end, var_start - win_start)
+        seq_end = np.where(minus, win_end - var_start, var_end - win_start)
+        seq_overhang = np.where(minus[:, None], overhang[:, ::-1], overhang)
+        lengths = win_end - win_start
+
+        windows = list(self.spliter.module_windows(
+            lengths, seq_overhang, self._mask_module).values())
+        if self.tissue_specific:
+            windows.extend(self._tissue_windows(lengths, seq_overhang))
+
+        visible = np.zeros(len(variants), dtype=bool)
+        for w_start, w_end in windows:
+            visible |= (w_start < seq_end) & (seq_start < w_end)
+        visible &= ~same
+        self.profiler.count('prefiltered', int((~visible).sum()))
+
+        if not np.all(visible):
+            regions = region_annotate_batch(
+                [v.pos for v in variants], start, end,
+                exons['Strand'][exon_index])
+            for region, count in zip(*np.unique(
+                    regions[~visible].astype(str), return_counts=True)):
+                self.prefiltered[region] = \
+                    self.prefiltered.get(region, 0) + int(count)
+        return visible
+
+    def _tissue_windows(self, lengths, overhangs):
+        '''
+        Windows seen by tissue specific model in sequences of
+          mmsplice overhang: the flanks and the exon ends.
+        '''
+        spliter = self.spliter
+        acceptor_end = overhangs[:, 0] + spliter.tissue_acceptor_exon
+        donor_start = lengths - overhangs[:, 1] - spliter.tissue_donor_exon
+        return [
+            (np.zeros_like(lengths), np.minimum(acceptor_end, lengths)),
+            (np.maximum(donor_start, 0), lengths)
+        ]
+
+    def _filter_regions(self, df_exons, regions):
+        '''
+        Table of exons (with overhang) overlapping with target regions.
+        '''
+        df_regions = read_regions(regions)
+
+        chroms = set(df_exons['Chromosome'].astype(str))
+        if not chroms.intersection(df_regions['Chromosome']):
+            if any(c.startswith('chr') for c in chroms):
+                df_regions['Chromosome'] = 'chr' + df_regions['Chromosome']
+            else:
+                df_regions['Chromosome'] = df_regions['Chromosome'] \
+                    .str.replace('^chr', '', regex=True)
+
+        index = ExonIntervalIndex(
+            df_exons['Chromosome'], df_exons['Start'], df_exons['End'])
+        _, exon_index = index.query(
+            df_regions['Chromosome'], df_regions['Start'], df_regions['End'])
+
+        if len(exon_index) == 0:
+            raise ValueError('None of the exons overlap with given regions')
+
+        return df_exons.iloc[np.unique(exon_index)].reset_index(drop=True)
 
     def _check_chrom_annotation(self):
         fasta_chroms = set(self.fasta.fasta.keys())
@@ -85,7 +386,7 @@ class SplicingVCFMixin(ExonSplicingMixin):
             raise ValueError(
                 'Fasta chrom names do not match with vcf chrom names')
 
-        gtf_chroms = set(self.pr_exons.Chromosome)
+        gtf_chroms = set(self._exons_df()['Chromosome'].astype(str))
         if not gtf_chroms.intersection(vcf_chroms):
             chr_annotaion = any(chrom.startswith('chr')
                                 for chrom in vcf_chroms)
@@ -96,7 +397,7 @@ class SplicingVCFMixin(ExonSplicingMixin):
                 self.pr_exons = pyrange_add_chr_from_chrom_annotation(
                     self.pr_exons)
 
-        gtf_chroms = set(self.pr_exons.Chromosome)
+            gtf_chroms = set(self.pr_exons.Chromosome)
         if not gtf_chroms.intersection(vcf_chroms):
             raise ValueError(
                 'GTF chrom names do not match with vcf chrom names')
@@ -122,37 +423,107 @@ class SplicingVCFDataloader(SplicingVCFMixin, SampleIterator):
       tissue_specific: tissue specific predicts
       tissue_overhang: overhang of exon to fetch flanking sequence of
         tissue specific model.
+      annotation_cache: cache parsed exons on disk and reuse them in
+        later runs with the same gtf file and overhang.
+      cache_dir: directory of annotation cache. If None,
+        `MMSPLICE_CACHE_DIR` environment variable or `~/.cache/mmsplice`.
+      regions: target regions as bed file, pyranges, pd.DataFrame or
+        list of Interval. Only exons overlapping with regions are scored
+        and variants are fetched with the tabix index of the vcf file.
+      prefilter: skip variant-exon pairs of which the alternative sequence
+        is identical to the reference in all modules before extracting
+        sequences.
+      genotypes: add genotypes of samples as `genotype` to metadata of
+        variants, so batches contain (batch, samples) int8 matrix of alt
+        allele counts (-1 for missing genotypes).
+      samples: subset of samples of vcf file for genotypes in order,
+        all samples if None. Names are in `self.samples`.
+      lookup: SNV score table of `mmsplice.snv_table.build_snv_table`
+        as path or `SNVScoreTable`. Modular scores of SNVs in the table
+        are looked up in natively encoded batches, so only indels and
+        SNVs of exons missing in the table are predicted by the models.
+        Scores of the table are of the default mmsplice models.
     """
 
     def __init__(self, gtf, fasta_file, vcf_file,
                  split_seq=True, encode=True,
                  overhang=(100, 100), seq_spliter=None,
-                 tissue_specific=False, tissue_overhang=(300, 300)):
+                 tissue_specific=False, tissue_overhang=(300, 300),
+                 annotation_cache=True, cache_dir=None, regions=None,
+                 prefilter=False, genotypes=False, samples=None,
+                 lookup=None):
+        self.annotation_cache = annotation_cache
+        self.cache_dir = cache_dir
+        self.lookup = self._snv_table(lookup, overhang, tissue_specific)
         pr_exons = self._read_exons(gtf, overhang)
         super().__init__(pr_exons, gtf, fasta_file, vcf_file,
                          split_seq, encode, overhang, seq_spliter,
                          tissue_specific, tissue_overhang,
                          interval_attrs=('left_overhang', 'right_overhang',
                                          'exon_id', 'gene_id',
-                                         'gene_name', 'transcript_id'))
+                                         'gene_name', 'transcript_id'),
+                         regions=regions, prefilter=prefilter,
+                         genotypes=genotypes, samples=samples)
+
+    @staticmethod
+    def _snv_table(lookup, overhang, tissue_specific):
+        if lookup is None:
+            return None
+        if tissue_specific:
+            raise ValueError('SNV tables do not contain scores of'
+                             ' tissue specific model')
+        if not isinstance(lookup, SNVScoreTable):
+            lookup = SNVScoreTable(lookup)
+        if lookup.overhang != tuple(overhang):
+            raise ValueError('Overhang of SNV table %s does not match'
+                             ' with overhang of dataloader %s'
+                             % (lookup.overhang, tuple(overhang)))
+        return lookup
+
+    def _lookup_scores(self, exon, variant, overhang):
+        '''
+        Precomputed scores of SNV in exon window, None if not available.
+        '''
+        if len(variant.ref) != 1 or len(variant.alt) != 1 \
+           or variant.ref == variant.alt or variant.alt not in BASES:
+            return None
+        scores = self.lookup.scores(exon.chrom, exon.start, exon.end,
+                                    exon.strand, overhang,
+                                    variant.pos, variant.alt)
+        if scores is not None:
+            self.profiler.count('looked_up', 1)
+        return scores
 
     def _read_exons(self, gtf, overhang=(100, 100)):
+        if getattr(self, 'annotation_cache', False):
+            try:
+                self._cached_exons = read_exons_cached(
+                    gtf, overhang, self.cache_dir)
+                # pyranges is only built if `pr_exons` is used
+                return self._cached_exons[0]
+            except (ImportError, OSError) as e:
+                logger.warning('Annotation cache is not available: %s' % e)
+
         if gtf in prebuild_annotation:
-            if overhang != (100, 100):
-                logger.warning('Overhang argument will be ignored'
-                               ' for prebuild annotation.')
-            df = pd.read_csv(prebuild_annotation[gtf])
-            df['Start'] -= 1  # convert prebuild annotation to 0-based
-            return pyranges.PyRanges(df)
+            return pyranges.PyRanges(read_exon_table(gtf, overhang))
         else:
             return read_exon_pyranges(gtf, overhang=overhang)
 
+    def _exon_overhangs(self, exon_index):
+        return np.stack([
+            self.matcher.exons['left_overhang'][exon_index],
+            self.matcher.exons['right_overhang'][exon_index]
+        ], axis=1)
+
     def __next__(self):
         exon, variant = next(self._generator)
         overhang = (exon.attrs['left_overhang'], exon.attrs['right_overhang'])
+        scores = None
+        if self.lookup is not None and self._native_batch:
+            scores = self._lookup_scores(exon, variant, overhang)
         exon._start += overhang[0]
         exon._end -= overhang[1]
-        return self._next(exon, variant, overhang)
+        return self._next(exon, variant, overhang, scores=scores)
 
     def __iter__(self):
         return self
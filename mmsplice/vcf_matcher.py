@@ -0,0 +1,256 @@
+from itertools import islice
+import numpy as np
+import pandas as pd
+from kipoiseq.dataclasses import Interval
+from kipoiseq.extractors import MultiSampleVCF
+from mmsplice.profiler import NULL_PROFILER
+
+
+def read_regions(regions):
+    '''
+    Read target regions as table of `Chromosome, Start, End` (0-based).
+
+    Args:
+      regions: path of bed file, pyranges object, pd.DataFrame with
+        `Chromosome, Start, End` columns or list of Interval objects.
+    '''
+    if isinstance(regions, str) or hasattr(regions, '__fspath__'):
+        with open(regions) as f:
+            rows = [line.strip().split('\t')[:3] for line in f
+                    if line.strip()
+                    and not line.startswith(('#', 'track', 'browser'))]
+        df = pd.DataFrame(rows, columns=['Chromosome', 'Start', 'End'])
+        return df.astype({'Start': 'int64', 'End': 'int64'})
+    elif isinstance(regions, pd.DataFrame):
+        df = regions
+    elif hasattr(regions, 'df'):
+        df = regions.df
+    else:
+        df = pd.DataFrame([(i.chrom, i.start, i.end) for i in regions],
+                          columns=['Chromosome', 'Start', 'End'])
+    df = df[['Chromosome', 'Start', 'End']].copy()
+    df['Chromosome'] = df['Chromosome'].astype(str)
+    return df
+
+
+def merge_intervals(chrom, start, end):
+    '''
+    Merge overlapping intervals.
+
+    Returns:
+      list of (chrom, start, end) sorted by chrom and start.
+    '''
+    chrom = np.asarray(chrom).astype(str)
+    start = np.asarray(start, dtype='int64')
+    end = np.asarray(end, dtype='int64')
+
+    merged = list()
+    for c in np.unique(chrom):
+        rows = np.where(chrom == c)[0]
+        rows = rows[np.argsort(start[rows], kind='stable')]
+        c_start, c_end = start[rows], np.maximum.accumulate(end[rows])
+        new = np.ones(len(rows), dtype=bool)
+        new[1:] = c_start[1:] >= c_end[:-1]
+        merged.extend(zip(
+            [str(c)] * int(new.sum()),
+            c_start[new].tolist(),
+            np.maximum.reduceat(c_end, np.where(new)[0]).tolist()))
+    return merged
+
+
+class ExonIntervalIndex:
+    """
+    Interval index of exons as sorted NumPy arrays per chromosome.
+
+    Overlaps of a query [start, end) are exons with
+    `start - max_len < exon.start < end` and `exon.end > start`, so a query
+    is two binary searches on the sorted starts followed by a vectorized
+    filter on ends. Queries do not need to be sorted.
+
+    Args:
+      chrom: chromosome of each exon.
+      start: 0-based start of each exon.
+      end: end of each exon.
+      index: optional index of exons sorted by chromosome and start
+        (see `mmsplice.vcf_dataloader.exon_index`) to slice chromosomes
+        instead of sorting them.
+    """
+
+    def __init__(self, chrom, start, end, index=None):
+        start = np.asarray(start, dtype='int64')
+        end = np.asarray(end, dtype='int64')
+
+        self.chroms = dict()
+        if index is not None:
+            for c, offset, count, max_len in zip(
+                    index['chroms'], index['offsets'], index['counts'],
+                    index['max_len']):
+                rows = np.arange(offset, offset + count)
+                self.chroms[str(c)] = (start[rows], end[rows], rows,
+                                       int(max_len))
+            return
+
+        chrom = np.asarray(chrom).astype(str)
+        for c in np.unique(chrom):
+            rows = np.where(chrom == c)[0]
+            rows = rows[np.argsort(start[rows], kind='stable')]
+            self.chroms[c] = (
+                start[rows], end[rows], rows,
+                int((end[rows] - start[rows]).max())
+            )
+
+    def query(self, chrom, start, end):
+        """
+        Overlapping exons of intervals.
+
+        Args:
+          chrom: chromosome of each query.
+          start: 0-based start of each query.
+          end: end of each query.
+
+        Returns:
+          (query_index, exon_index) arrays of overlapping pairs
+            sorted by query and then by exon start.
+        """
+        chrom = np.asarray(chrom).astype(str)
+        start = np.asarray(start, dtype='int64')
+        end = np.asarray(end, dtype='int64')
+
+        query_index, exon_index = list(), list()
+        for c in np.unique(chrom):
+            if c not in self.chroms:
+                continue
+            queries = np.where(chrom == c)[0]
+            q_index, e_index = self._query_chrom(
+                c, start[queries], end[queries])
+            query_index.append(queries[q_index])
+            exon_index.append(e_index)
+
+        if not query_index:
+            return np.array([], dtype='int64'), np.array([], dtype='int64')
+
+        query_index = np.concatenate(query_index)
+        exon_index = np.concatenate(exon_index)
+        order = np.argsort(query_index, kind='stable')
+        return query_index[order], exon_index[order]
+
+    def _query_chrom(self, chrom, start, end):
+        starts, ends, rows, max_len = self.chroms[chrom]
+        lo = np.searchsorted(starts, start - max_len, side='right')
+        hi = np.searchsorted(starts, end, side='left')
+
+        counts = np.maximum(hi - lo, 0)
+        query_index = np.repeat(np.arange(len(start)), counts)
+        candidates = np.arange(counts.sum()) \
+            - np.repeat(np.cumsum(counts) - counts, counts) \
+            + np.repeat(lo, counts)
+
+        overlap = ends[candidates] > start[query_index]
+        return query_index[overlap], rows[candidates[overlap]]
+
+
+class ExonVariantMatcher:
+    """
+    Match variants of vcf file with exons without building pyranges or
+    Interval objects for every exon. Variants are read in batches and
+    matched in bulk with `ExonIntervalIndex`.
+
+    If `regions` is given, only variants in them are fetched
+    from the tabix index of the vcf file instead of reading the whole file.
+
+    Args:
+      vcf_file: path of vcf file.
+      pr_exons: pyranges object or pd.DataFrame of exons.
+      interval_attrs: columns of `pr_exons` added as attrs of intervals.
+      variant_batch_size: number of variants matched at once.
+      regions: list of disjoint (chrom, start, end) sorted regions to fetch
+        variants, see `merge_intervals`.
+      index: index of rows of `pr_exons`, see `ExonIntervalIndex`.
+    """
+    profiler = NULL_PROFILER
+
+    def __init__(self, vcf_file, pr_exons, interval_attrs=tuple(),
+                 variant_batch_size=10000, regions=None, index=None):
+        self.vcf_file = vcf_file
+        self.interval_attrs = interval_attrs
+        self.variant_batch_size = variant_batch_size
+        self.regions = regions
+
+        df = pr_exons if isinstance(pr_exons, pd.DataFrame) else pr_exons.df
+        self.exons = {
+            k: df[k].to_numpy()
+            for k in ['Chromosome', 'Start', 'End', 'Strand', *interval_attrs]
+        }
+        self.exons['Chromosome'] = self.exons['Chromosome'].astype(str)
+        self.index = ExonIntervalIndex(
+            self.exons['Chromosome'], self.exons['Start'], self.exons['End'],
+            index=index)
+
+    def _fetch_regions(self):
+        vcf = MultiSampleVCF(self.vcf_file)
+        prev_chrom, prev_end = None, None
+
+        for chrom, start, end in self.regions:
+            for v in vcf.fetch_variants(Interval(chrom, start, end)):
+                # variants spanning multiple regions are already
+                # fetched by the previous region
+                if chrom == prev_chrom and v.start < prev_end:
+                    continue
+                yield v
+            prev_chrom, prev_end = chrom, end
+
+    def _variant_batches(self):
+        if self.regions is not None:
+            variants = self._fetch_regions()
+        else:
+            variants = iter(MultiSampleVCF(self.vcf_file))
+        while True:
+            batch = list(islice(variants, self.variant_batch_size))
+            if not batch:
+                break
+            yield batch
+
+    def iter_pairs(self):
+        """
+        Iterate batches of matched pairs.
+
+        Returns:
+          (variants, variant_index, exon_index) where `variants` is
+            list of variants of the batch and `exon_index` is row
+            index of `pr_exons.df`.
+        """
+        batches = self._variant_batches()
+        while True:
+            with self.profiler.stage('vcf_io'):
+                variants = next(batches, None)
+            if variants is None:
+                break
+
+            with self.profiler.stage('variant_matching', len(variants)):
+                chrom = np.array([v.chrom for v in variants])
+                start = np.fromiter((v.start for v in variants),
+                                    dtype='int64', count=len(variants))
+                end = np.fromiter((v.end for v in variants), dtype='int64',
+                                  count=len(variants))
+                variant_index, exon_index = self.index.query(
+                    chrom, start, end)
+            self.profiler.count('variants', len(variants))
+            self.profiler.count('pairs', len(exon_index))
+            yield variants, variant_index, exon_index
+
+    def interval(self, i):
+        """
+        Interval object of the i-th exon.
+        """
+        return Interval(
+            self.exons['Chromosome'][i],
+            int(self.exons['Start'][i]),
+            int(self.exons['End'][i]),
+            strand=self.exons['Strand'][i],
+            attrs={k: self.exons[k][i] for k in self.interval_attrs}
+        )
+
+    def __iter__(self):
+        for variants, variant_index, exon_index in self.iter_pairs():
+            for v, e in zip(variant_index, exon_index):
+                yield self.interval(e), variants[v]
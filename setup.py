@@ -13,7 +13,6 @@ with open('HISTORY.rst') as history_file:
 
 requirements = [
     'setuptools',
-    'scikit-learn==0.19.2',
     'kipoiseq>=0.3.0',
     'numpy==1.18.5',
     'tensorflow',
@@ -23,13 +22,19 @@ requirements = [
     'pyfaidx',
     'tqdm',
     'click',
-    'pyranges>=0.0.71'
+    'pyranges>=0.0.71',
+    'pyarrow'
 ]
 
 setup_requirements = ['pytest-runner', ]
 
 test_requirements = ['pytest', 'pytest-benchmark']
 
+extras_requirements = {
+    # only to load sklearn pickles of linear heads
+    'sklearn': ['scikit-learn==0.19.2']
+}
+
 setup(
     author="Jun Cheng, Muhammed Hasan Çelik",
     author_email='chengju@in.tum.de, muhammedhasancelik@gmail.com',
@@ -44,6 +49,7 @@ setup(
     ],
     description="Predict splicing variant effect from VCF",
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     long_description_content_type='text/markdown',
@@ -0,0 +1,22 @@
+import pandas as pd
+from mmsplice.bench import generate
+from mmsplice.vcf_dataloader import SplicingVCFDataloader
+from mmsplice.junction_dataloader import JunctionPSI5VCFDataloader
+
+
+def test_generate(tmp_path):
+    files = generate(tmp_path, num_genes=10, num_variants=100,
+                     num_chroms=2, index=False)
+
+    df_vcf = pd.read_csv(files['vcf'], sep='\t', comment='#', header=None)
+    assert df_vcf.shape[0] == 100
+    assert set(df_vcf[0].astype(str)) <= {'1', '2'}
+
+    dl = SplicingVCFDataloader(files['gtf'], files['fasta'], files['vcf'],
+                               annotation_cache=False)
+    rows = list(dl)
+    assert len(rows) >= 100 * 0.9
+
+    dl = JunctionPSI5VCFDataloader(files['junction'], files['fasta'],
+                                   files['vcf'])
+    assert len(list(dl)) > 0
@@ -0,0 +1,65 @@
+import os
+import numpy as np
+import pytest
+from mmsplice import MMSplice, MTSplice
+from mmsplice import compiled as compiled_module
+from mmsplice.compiled import bucket_length, enable_persistent_cache, \
+    persistent_cache_supported, LENGTH_BUCKETS
+from mmsplice.quantization import read_calibration_exons, \
+    calibration_inputs, calibration_tissue_inputs
+
+
+def test_bucket_length():
+    assert bucket_length(1) == 32
+    assert bucket_length(32) == 32
+    assert bucket_length(33) == 64
+    assert bucket_length(4096) == 4096
+    assert bucket_length(5000) == 8192
+    assert bucket_length(10, buckets=(8, 16)) == 16
+
+
+def test_persistent_cache_supported():
+    assert persistent_cache_supported('2.11.0')
+    assert persistent_cache_supported('2.15.0rc1')
+    assert not persistent_cache_supported('2.4.1')
+    assert not persistent_cache_supported('1.15.0')
+
+
+def test_enable_persistent_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv('TF_XLA_FLAGS', raising=False)
+    monkeypatch.setattr(compiled_module, '_tf_version', lambda: '2.4.1')
+    assert enable_persistent_cache(tmp_path) is None
+    assert 'TF_XLA_FLAGS' not in os.environ
+
+    monkeypatch.setattr(compiled_module, '_tf_version', lambda: '2.12.0')
+    xla_dir = enable_persistent_cache(tmp_path)
+    assert xla_dir == str(tmp_path / 'xla')
+    assert (tmp_path / 'xla').is_dir()
+
+    # cache directory set by user is kept
+    monkeypatch.setenv('TF_XLA_FLAGS', '--tf_xla_persistent_cache_directory'
+                       '=/other --tf_xla_auto_jit=2')
+    assert enable_persistent_cache(tmp_path) == '/other'
+
+
+def test_compiled_models(tmp_path, monkeypatch):
+    monkeypatch.setenv('MMSPLICE_CACHE_DIR', str(tmp_path))
+    monkeypatch.delenv('TF_XLA_FLAGS', raising=False)
+    df = read_calibration_exons().iloc[:40]
+
+    model = MMSplice()
+    compiled = MMSplice(compiled=True)
+    inputs = calibration_inputs(model.spliter, df)
+    assert inputs['exon'].shape[1] not in LENGTH_BUCKETS
+    np.testing.assert_allclose(
+        compiled.predict_modular_scores_on_batch(inputs),
+        model.predict_modular_scores_on_batch(inputs), atol=1e-4)
+
+    mtsplice = MTSplice()
+    compiled = MTSplice(compiled=True)
+    inputs = calibration_tissue_inputs(mtsplice.spliter, df)
+    np.testing.assert_allclose(compiled.predict_on_batch(inputs),
+                               mtsplice.predict_on_batch(inputs), atol=1e-4)
+
+    with pytest.raises(ValueError):
+        MMSplice(compiled=True, quantized=True)
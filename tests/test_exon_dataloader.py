@@ -1,6 +1,7 @@
+import numpy as np
 import pandas as pd
 from conftest import fasta_file, exon_file
-from mmsplice.exon_dataloader import ExonDataset
+from mmsplice.exon_dataloader import ExonDataset, StreamingExonDataset
 
 
 def test_ExonDataset():
@@ -10,6 +11,36 @@ def test_ExonDataset():
     assert all(c in dl.exons.columns for c in required_cols)
 
 
+def test_ExonDataset_skip():
+    dl = ExonDataset(exon_file, fasta_file, encode=False)
+    ids = [i for b in dl.batch_iter(batch_size=4)
+           for i in b['metadata']['variant']['annotation']]
+
+    for encode in [False, True]:
+        dl = ExonDataset(exon_file, fasta_file, encode=encode)
+        dl.skip(5)
+        ids_skipped = [i for b in dl.batch_iter(batch_size=4)
+                       for i in b['metadata']['variant']['annotation']]
+        assert ids_skipped == ids[5:]
+
+
+def test_ExonDataset_batch_iter_kwargs():
+    dl = ExonDataset(exon_file, fasta_file)
+    ids = [i for b in dl.batch_iter(batch_size=4)
+           for i in b['metadata']['variant']['annotation']]
+
+    batches = list(dl.batch_iter(batch_size=4, drop_last=True))
+    assert len(batches) == len(dl) // 4
+    assert all(len(b['metadata']['variant']['annotation']) == 4
+               for b in batches)
+
+    np.random.seed(0)
+    ids_shuffled = [i for b in dl.batch_iter(batch_size=4, shuffle=True)
+                    for i in b['metadata']['variant']['annotation']]
+    assert ids_shuffled != ids
+    assert sorted(ids_shuffled) == sorted(ids)
+
+
 def test_ExonDataset__getitem__():
     dl = ExonDataset(exon_file, fasta_file, encode=False, split_seq=False)
     for i in dl:
@@ -62,3 +93,54 @@ def test_ExonDataset__len__():
     dl = ExonDataset(exon_file, fasta_file)
     df = pd.read_csv(exon_file)
     assert len(dl) == df.shape[0]
+
+
+def test_StreamingExonDataset():
+    dl = ExonDataset(exon_file, fasta_file, encode=False, split_seq=False)
+    dl_stream = StreamingExonDataset(exon_file, fasta_file, encode=False,
+                                     split_seq=False, chunksize=7,
+                                     index_step=3)
+    rows = list(dl_stream)
+    assert len(rows) == len(dl) == len(dl_stream)
+
+    for i in range(len(dl)):
+        assert rows[i]['inputs'] == dl[i]['inputs']
+        assert rows[i]['metadata']['exon']['annotation'] \
+            == dl[i]['metadata']['exon']['annotation']
+        assert dl_stream[i]['inputs'] == dl[i]['inputs']
+
+
+def test_StreamingExonDataset_read_kwargs(tmp_path):
+    dl = ExonDataset(exon_file, fasta_file, encode=False, split_seq=False)
+    usecols = ['seqnames', 'start', 'end', 'strand',
+               'hg19_variant_position', 'reference', 'variant', 'ID']
+    dl_stream = StreamingExonDataset(exon_file, fasta_file, encode=False,
+                                     split_seq=False, index_step=3,
+                                     usecols=usecols)
+    assert len(dl_stream) == len(dl)
+    for i in [0, 4, len(dl) - 1]:
+        assert dl_stream[i]['inputs'] == dl[i]['inputs']
+
+    # csv file without header
+    df = pd.read_csv(exon_file)
+    headerless = str(tmp_path / 'exons.csv')
+    df.to_csv(headerless, index=False, header=False)
+    dl_stream = StreamingExonDataset(headerless, fasta_file, encode=False,
+                                     split_seq=False, index_step=3,
+                                     names=df.columns.tolist())
+    assert len(dl_stream) == len(dl)
+    assert [i['inputs'] for i in dl_stream] == [i['inputs'] for i in dl]
+    for i in [0, 4, len(dl) - 1]:
+        assert dl_stream[i]['inputs'] == dl[i]['inputs']
+
+
+def test_StreamingExonDataset_parquet(tmp_path):
+    parquet_file = str(tmp_path / 'exons.parquet')
+    pd.read_csv(exon_file).to_parquet(parquet_file, index=False,
+                                      row_group_size=5)
+    dl = ExonDataset(exon_file, fasta_file, encode=False, split_seq=False)
+    dl_stream = StreamingExonDataset(parquet_file, fasta_file, encode=False,
+                                     split_seq=False, chunksize=4)
+    assert len(dl_stream) == len(dl)
+    assert [i['inputs'] for i in dl_stream] == [i['inputs'] for i in dl]
+    assert dl_stream[len(dl) - 1]['inputs'] == dl[len(dl) - 1]['inputs']
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from click.testing import CliRunner
+from mmsplice import MMSplice, MTSplice
+from mmsplice.main import cli
+from mmsplice.export import load_artifact, SavedModelArtifact
+from mmsplice.quantization import TFLiteModel, read_calibration_exons, \
+    calibration_inputs, calibration_tissue_inputs
+
+
+@pytest.fixture(scope='module')
+def artifacts(tmp_path_factory):
+    output = tmp_path_factory.mktemp('artifacts')
+    result = CliRunner().invoke(cli, ['export', '--output', str(output)])
+    assert result.exit_code == 0, result.output
+    return output
+
+
+def test_export(artifacts):
+    assert (artifacts / 'artifacts.json').exists()
+    for name in ['mmsplice', 'mtsplice']:
+        assert (artifacts / name / 'saved_model.pb').exists()
+        assert (artifacts / ('%s.tflite' % name)).exists()
+
+    assert isinstance(load_artifact(artifacts, 'mmsplice'), TFLiteModel)
+    assert isinstance(load_artifact(artifacts, 'mmsplice', tflite=False),
+                      SavedModelArtifact)
+
+    with pytest.raises(FileNotFoundError):
+        load_artifact(artifacts / 'mmsplice', 'mmsplice')
+
+
+@pytest.mark.parametrize('tflite', [True, False])
+def test_load_artifacts(artifacts, tflite):
+    df = read_calibration_exons().iloc[:16]
+
+    model = MMSplice()
+    exported = MMSplice(artifacts=artifacts)
+    exported.fused = load_artifact(artifacts, 'mmsplice', tflite=tflite)
+    inputs = calibration_inputs(model.spliter, df)
+    np.testing.assert_allclose(
+        exported.predict_modular_scores_on_batch(inputs),
+        model.predict_modular_scores_on_batch(inputs), atol=1e-4)
+
+    seq = df['seq'][0][200:-200]
+    np.testing.assert_allclose(exported.predict_on_seq(seq),
+                               model.predict_on_seq(seq), atol=1e-4)
+
+    mtsplice = MTSplice()
+    exported = MTSplice(artifacts=artifacts)
+    exported.mtsplice_models = [
+        load_artifact(artifacts, 'mtsplice', tflite=tflite)]
+    inputs = calibration_tissue_inputs(mtsplice.spliter, df)
+    np.testing.assert_allclose(exported.predict_on_batch(inputs),
+                               mtsplice.predict_on_batch(inputs), atol=1e-4)
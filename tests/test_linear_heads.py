@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_almost_equal
+from mmsplice.linear_heads import LinearHeads
+from mmsplice.utils import LINEAR_HEADS, LINEAR_MODEL, LOGISTIC_MODEL, \
+    EFFICIENCY_MODEL, transform
+
+
+@pytest.fixture
+def modular_scores():
+    rng = np.random.RandomState(0)
+    X_ref = rng.normal(scale=3, size=(1000, 5)).astype('float32')
+    X_alt = X_ref + (rng.rand(1000, 5) < 0.5) \
+        * rng.normal(scale=0.5, size=(1000, 5)).astype('float32')
+    return X_ref, X_alt
+
+
+def test_LinearHeads_sklearn(modular_scores):
+    pytest.importorskip('sklearn')
+    X_ref, X_alt = modular_scores
+    pred = LINEAR_HEADS.predict(X_ref, X_alt)
+
+    assert_almost_equal(
+        pred['delta_logit_psi'],
+        LINEAR_MODEL.predict(transform(X_alt - X_ref)))
+
+    X = transform(X_alt - X_ref, region_only=True)
+    X = np.concatenate([X_ref, X_alt, X[:, -3:]], axis=-1)
+    assert_almost_equal(pred['pathogenicity'],
+                        LOGISTIC_MODEL.predict_proba(X)[:, 1])
+
+    X = transform(X_alt - X_ref)[:, [1, 2, 3, 5]]
+    assert_almost_equal(pred['efficiency'], EFFICIENCY_MODEL.predict(X))
+
+    heads = LinearHeads.from_sklearn(
+        LINEAR_MODEL, LOGISTIC_MODEL, EFFICIENCY_MODEL)
+    for k, v in heads.predict(X_ref, X_alt).items():
+        assert_almost_equal(v, pred[k])
+
+
+def test_LinearHeads_predict(modular_scores, tmp_path):
+    X_ref, X_alt = modular_scores
+    pred = LINEAR_HEADS.predict(X_ref, X_alt)
+
+    X = transform(X_alt - X_ref)
+    assert_almost_equal(
+        pred['delta_logit_psi'],
+        X @ LINEAR_HEADS.delta_logit_psi_coef
+        + LINEAR_HEADS.delta_logit_psi_intercept)
+
+    heads = LINEAR_HEADS.predict(X_ref, X_alt, ['efficiency'])
+    assert list(heads) == ['efficiency']
+    assert_almost_equal(heads['efficiency'], pred['efficiency'])
+
+    LINEAR_HEADS.save(tmp_path / 'heads.npz')
+    heads = LinearHeads.load(tmp_path / 'heads.npz')
+    assert_almost_equal(heads.predict(X_ref, X_alt)['pathogenicity'],
+                        pred['pathogenicity'])
+
+    with pytest.raises(ValueError):
+        LINEAR_HEADS.predict(X_ref, X_alt, ['psi'])
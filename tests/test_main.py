@@ -1,5 +1,12 @@
 import json
 from subprocess import Popen, PIPE
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from cyvcf2 import VCF
+from mmsplice.main import cli
+from conftest import gtf_file, fasta_file, exon_file, junction_file, \
+    junction_psi5_file
 
 
 def test_cli():
@@ -27,3 +34,141 @@ def test_cli():
 
     assert len(pred) == 12
     assert pred[10] != 0
+
+
+def _predict(*args):
+    result = CliRunner().invoke(cli, ['predict', '--fasta', fasta_file,
+                                      '--no-progress', *args])
+    return result
+
+
+def test_predict_csv(vcf_path, tmp_path):
+    output = tmp_path / 'pred.csv'
+    profile = tmp_path / 'profile.json'
+    result = _predict('--vcf', vcf_path, '--annotation', gtf_file,
+                      '--output', str(output), '--batch-size', '2',
+                      '--pathogenicity', '--profile', str(profile))
+    assert result.exit_code == 0, result.output
+
+    df = pd.read_csv(output)
+    assert df.shape[0] > 0
+    assert {'ID', 'exons', 'delta_logit_psi', 'pathogenicity'} \
+        <= set(df.columns)
+    assert json.load(open(profile))['batches'] > 0
+
+    result = _predict('--vcf', vcf_path, '--annotation', gtf_file,
+                      '--output', str(output), '--batch-size', '2',
+                      '--pathogenicity', '--resume')
+    assert result.exit_code == 0, result.output
+    pd.testing.assert_frame_equal(pd.read_csv(output), df)
+
+
+def test_predict_parquet_tissue(vcf_path, tmp_path):
+    output = tmp_path / 'pred.parquet'
+    result = _predict('--vcf', vcf_path, '--annotation', gtf_file,
+                      '--output', str(output), '--tissue', 'Lung',
+                      '--tissue', 'Liver', '--column', 'ID',
+                      '--column', 'Lung', '--column', 'Liver')
+    assert result.exit_code == 0, result.output
+
+    df = pd.read_parquet(output)
+    assert df.shape[0] > 0
+    assert list(df.columns) == ['ID', 'Lung', 'Liver']
+
+
+def test_predict_vcf(vcf_path, tmp_path):
+    output = tmp_path / 'pred.vcf'
+    result = _predict('--vcf', vcf_path, '--annotation', gtf_file,
+                      '--output', str(output), '--column', 'exons',
+                      '--column', 'delta_logit_psi')
+    assert result.exit_code == 0, result.output
+
+    vcf = VCF(str(output))
+    assert 'exons|delta_logit_psi' in \
+        vcf.get_header_type('mmsplice')['Description']
+    records = list(vcf)
+    assert len(records) == len(list(VCF(vcf_path)))
+    annotations = [var.INFO.get('mmsplice') for var in records]
+    assert any(annotations)
+    for var, annotation in zip(records, annotations):
+        for entry in filter(None, (annotation or '').split(',')):
+            alt, exon, delta_logit_psi = entry.split('|')
+            assert alt in var.ALT
+            float(delta_logit_psi)
+
+
+def test_predict_vcf_multiallelic(tmp_path):
+    vcf_path = tmp_path / 'multiallelic.vcf'
+    with open(str(vcf_path), 'w') as f:
+        f.write('##fileformat=VCFv4.0\n')
+        f.write('##contig=<ID=17,length=81195210>\n')
+        f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        f.write('17\t41267742\t.\tCTT\tC\t.\t.\t.\n')
+        f.write('17\t41276033\t.\tC\tG,CCAGATG\t.\t.\t.\n')
+        f.write('17\t41276132\t.\tA\tACT\t.\t.\t.\n')
+
+    output = tmp_path / 'pred.vcf'
+    result = _predict('--vcf', str(vcf_path), '--annotation', gtf_file,
+                      '--output', str(output), '--batch-size', '1',
+                      '--column', 'exons', '--column', 'delta_logit_psi')
+    assert result.exit_code == 0, result.output
+
+    result = _predict('--vcf', str(vcf_path), '--annotation', gtf_file,
+                      '--output', str(tmp_path / 'pred.csv'))
+    assert result.exit_code == 0, result.output
+    df = pd.read_csv(tmp_path / 'pred.csv')
+
+    records = list(VCF(str(output)))
+    assert len(records) == 3
+    for var in records:
+        entries = var.INFO.get('mmsplice').split(',')
+        expected = df[df['ID'].str.startswith('17:%d:' % var.POS)]
+        assert len(entries) == len(expected)
+        assert sorted(i.split('|')[0] for i in entries) \
+            == sorted(i.split('>')[1] for i in expected['ID'])
+    assert {i.split('|')[0] for i in
+            records[1].INFO.get('mmsplice').split(',')} == {'G', 'CCAGATG'}
+
+
+@pytest.mark.parametrize('dataloader, args', [
+    ('exon', ['--exons', exon_file]),
+    ('psi5', ['--exons', junction_psi5_file]),
+])
+def test_predict_datasets(dataloader, args, tmp_path):
+    output = tmp_path / 'pred.csv'
+    result = _predict('--dataloader', dataloader, '--output', str(output),
+                      *args)
+    assert result.exit_code == 0, result.output
+    assert pd.read_csv(output).shape[0] > 0
+
+
+def test_predict_junction_vcf(vcf_path, tmp_path):
+    output = tmp_path / 'pred.csv'
+    result = _predict('--dataloader', 'psi3', '--vcf', vcf_path,
+                      '--annotation', junction_file, '--output', str(output),
+                      '--workers', '2')
+    assert result.exit_code == 0, result.output
+    assert pd.read_csv(output).shape[0] > 0
+
+
+def test_predict_usage(vcf_path, tmp_path):
+    result = _predict('--vcf', vcf_path, '--annotation', gtf_file,
+                      '--output', str(tmp_path / 'pred.txt'))
+    assert result.exit_code != 0
+
+    result = _predict('--vcf', vcf_path, '--annotation', gtf_file,
+                      '--output', str(tmp_path / 'pred.csv.gz'))
+    assert 'format cannot be inferred' in result.output
+
+    result = _predict('--exons', exon_file, '--dataloader', 'exon',
+                      '--output', str(tmp_path / 'pred.vcf'))
+    assert 'vcf output requires --vcf' in result.output
+
+    result = _predict('--vcf', vcf_path, '--annotation', gtf_file,
+                      '--output', str(tmp_path / 'pred.vcf'), '--resume')
+    assert result.exit_code != 0
+
+    result = _predict('--dataloader', 'psi5', '--exons', junction_psi5_file,
+                      '--tissue', 'Lung', '--output',
+                      str(tmp_path / 'pred.csv'))
+    assert 'tissue specific' in result.output
@@ -1,12 +1,19 @@
 """Tests for `mmsplice` package."""
+import pytest
+import numpy as np
 import pandas as pd
 from numpy.testing import assert_almost_equal
 from mmsplice import MMSplice
-from mmsplice.utils import encodeDNA, delta_logit_PSI_to_delta_PSI
+from mmsplice.utils import encodeDNA, delta_logit_PSI_to_delta_PSI, \
+    predict_deltaLogitPsi
 from mmsplice.vcf_dataloader import SplicingVCFDataloader
 from mmsplice.exon_dataloader import ExonDataset
-from mmsplice import predict_all_table
-from conftest import gtf_file, fasta_file, variants, exon_file
+from mmsplice import predict_all_table, predict_save
+from mmsplice.mmsplice import progress_manifest
+from mmsplice.utils import read_progress
+from mmsplice.autotune import BatchSizeTuner
+from mmsplice.profiler import StageProfiler
+from conftest import gtf_file, fasta_file, variants, exon_file, multi_vcf
 
 
 def test_mmsplice():
@@ -17,10 +24,109 @@ def test_mmsplice():
     assert len(pred) == 5
 
 
+def test_saturation_mutagenesis():
+    seq = 'ATGCGACGTACCCAGTAAATNCGA'
+    overhang = (4, 4)
+    model = MMSplice()
+    delta = model.saturation_mutagenesis(seq, overhang, deletions=True,
+                                         batch_size=7)
+    assert delta.shape == (len(seq), 5)
+    assert np.all(np.isnan(delta[20, :4]))
+
+    ref = model.predict_on_seq(seq, overhang)
+    for i in [0, 3, 4, 10, 19, 23]:
+        for j, base in enumerate('ACGT'):
+            if base == seq[i]:
+                assert delta[i, j] == 0
+                continue
+            alt = model.predict_on_seq(seq[:i] + base + seq[i + 1:],
+                                       overhang)
+            assert_almost_equal(
+                delta[i, j], predict_deltaLogitPsi([ref], [alt])[0],
+                decimal=5)
+
+    alt = model.predict_on_seq(seq[:10] + seq[11:], overhang)
+    assert_almost_equal(delta[10, 4],
+                        predict_deltaLogitPsi([ref], [alt])[0], decimal=5)
+    alt = model.predict_on_seq(seq[1:], (3, 4))
+    assert_almost_equal(delta[0, 4],
+                        predict_deltaLogitPsi([ref], [alt])[0], decimal=5)
+
+
 def test_predict_save(vcf_path):
     pass
 
 
+def test_predict_save_resume(vcf_path, tmp_path, monkeypatch):
+    model = MMSplice()
+    output = tmp_path / 'pred.csv'
+    _predict_on_dataloader = MMSplice._predict_on_dataloader
+
+    def _interrupted(self, *args, **kwargs):
+        df_iter = _predict_on_dataloader(self, *args, **kwargs)
+        yield next(df_iter)
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(MMSplice, '_predict_on_dataloader', _interrupted)
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    try:
+        predict_save(model, dl, output, batch_size=2, progress=False)
+    except KeyboardInterrupt:
+        pass
+    assert read_progress(progress_manifest(output))['rows'] == 2
+
+    monkeypatch.setattr(MMSplice, '_predict_on_dataloader',
+                        _predict_on_dataloader)
+    # batches of resumed run may differ from the interrupted run
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    predict_save(model, dl, output, batch_size=3, progress=False,
+                 resume=True)
+    assert read_progress(progress_manifest(output))['complete']
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    df = predict_all_table(model, dl, batch_size=2, progress=False)
+    df_resumed = pd.read_csv(output)
+    assert df_resumed.shape[0] == df.shape[0]
+    assert df_resumed['ID'].tolist() == df['ID'].tolist()
+
+
+def test_predict_save_resume_per_sample(tmp_path, monkeypatch):
+    model = MMSplice()
+    output = tmp_path / 'pred.parquet'
+    _predict_on_dataloader = MMSplice._predict_on_dataloader
+
+    def _interrupted(self, *args, **kwargs):
+        df_iter = _predict_on_dataloader(self, *args, **kwargs)
+        yield next(df_iter)
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(MMSplice, '_predict_on_dataloader', _interrupted)
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, multi_vcf,
+                               genotypes=True)
+    try:
+        predict_save(model, dl, output, batch_size=2, batch_size_parquet=1,
+                     progress=False, per_sample=True)
+    except KeyboardInterrupt:
+        pass
+    assert read_progress(progress_manifest(output))['samples'] == 2
+
+    monkeypatch.setattr(MMSplice, '_predict_on_dataloader',
+                        _predict_on_dataloader)
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, multi_vcf,
+                               genotypes=True)
+    predict_save(model, dl, output, batch_size=2, batch_size_parquet=1,
+                 progress=False, per_sample=True, resume=True)
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, multi_vcf,
+                               genotypes=True)
+    df = predict_all_table(model, dl, batch_size=2, progress=False,
+                           per_sample=True)
+    df_resumed = pd.read_parquet(output)
+    # parts of the parquet directory are not read in order
+    assert sorted(df_resumed[['ID', 'exons', 'sample']].values.tolist()) \
+        == sorted(df[['ID', 'exons', 'sample']].values.tolist())
+
+
 def test_predict_all_table(vcf_path):
     model = MMSplice()
 
@@ -32,6 +138,93 @@ def test_predict_all_table(vcf_path):
     assert df.shape[1] == 8 + 10 + 2
 
 
+def test_predict_all_table_autotune(vcf_path):
+    model = MMSplice()
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    df = predict_all_table(model, dl, progress=False)
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    df_tuned = predict_all_table(model, dl, progress=False, autotune=True)
+
+    assert_almost_equal(df_tuned['delta_logit_psi'].values,
+                        df['delta_logit_psi'].values, decimal=5)
+
+
+def test_predict_all_table_bounded_memory(vcf_path, tmp_path):
+    model = MMSplice()
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    df = predict_all_table(model, dl, batch_size=2, progress=False)
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    df_bounded = predict_all_table(model, dl, batch_size=2, progress=False,
+                                   bounded_memory=True, max_rows=len(df))
+    assert df_bounded['delta_logit_psi'].dtype == 'float32'
+    assert_almost_equal(df_bounded['delta_logit_psi'].values,
+                        df['delta_logit_psi'].values, decimal=5)
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    with pytest.raises(ValueError):
+        predict_all_table(model, dl, batch_size=2, progress=False,
+                          max_rows=2)
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    output = predict_all_table(model, dl, batch_size=2, progress=False,
+                               max_rows=2, spill_path=tmp_path / 'pred.csv')
+    assert output == tmp_path / 'pred.csv'
+    assert pd.read_csv(output)['ID'].tolist() == df['ID'].tolist()
+
+
+def test_predict_save_profiler(vcf_path, tmp_path):
+    model = MMSplice()
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    profiler = StageProfiler(memory=True)
+    predict_save(model, dl, tmp_path / 'pred.csv', batch_size=2,
+                 progress=False, pathogenicity=True, profiler=profiler)
+
+    summary = profiler.summary()
+    assert summary['batches'] == summary['stages']['writing']['calls']
+    assert summary['counters']['samples'] == len(variants) - 1
+    assert {'vcf_io', 'variant_matching', 'fasta', 'encoding', 'splitting',
+            'inference/exon', 'linear_heads', 'dataframe'} \
+        <= set(summary['stages'])
+    assert summary['counters']['output_bytes'] > 0
+    assert len(summary['rss']) == summary['batches']
+
+
+def test_BatchSizeTuner(vcf_path):
+    model = MMSplice()
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    batch = next(dl.batch_iter(batch_size=8))
+
+    tuner = BatchSizeTuner(candidates=(2, 4, 16))
+    batch_size = tuner.batch_size(model, batch['inputs']['seq'])
+    assert batch_size in {2, 4, 8}
+    assert list(tuner.batch_sizes.values()) == [batch_size]
+    assert set(tuner.throughput[tuner.length_bucket(
+        batch['inputs']['seq'])]) == {2, 4, 8}
+
+
+def test_BatchSizeTuner_small_first_batch(vcf_path):
+    model = MMSplice()
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    inputs = next(dl.batch_iter(batch_size=8))['inputs']['seq']
+    inputs = {k: np.concatenate([v] * 4) for k, v in inputs.items()}
+    bucket = BatchSizeTuner.length_bucket(inputs)
+
+    tuner = BatchSizeTuner(candidates=(2, 4, 16), repeats=2)
+    assert tuner.batch_size(model, {k: v[:3] for k, v in inputs.items()}) \
+        in {2, 3}
+    assert set(tuner.throughput[bucket]) == {2, 3}
+
+    # calibrated again on a batch fitting all candidates
+    assert tuner.batch_size(model, inputs) in {2, 4, 16}
+    assert set(tuner.throughput[bucket]) == {2, 4, 16}
+
+    throughput = tuner.throughput[bucket]
+    tuner.batch_size(model, {k: v[:5] for k, v in inputs.items()})
+    assert tuner.throughput[bucket] is throughput
+
+
 def test_predict_all_table_tissue_specific(vcf_path):
     model = MMSplice()
     dl = SplicingVCFDataloader(
@@ -49,6 +242,65 @@ def test_predict_all_table_tissue_specific(vcf_path):
     assert_almost_equal(df['Whole Blood_delta_psi'].values, expected)
 
 
+def test_predict_all_table_columns(vcf_path):
+    model = MMSplice()
+    dl = SplicingVCFDataloader(
+        gtf_file, fasta_file, vcf_path, tissue_specific=True)
+    df = predict_all_table(model, dl, natural_scale=True,
+                           ref_psi_version='grch37')
+
+    dl = SplicingVCFDataloader(
+        gtf_file, fasta_file, vcf_path, tissue_specific=True)
+    df_selected = predict_all_table(
+        model, dl, natural_scale=True, ref_psi_version='grch37',
+        columns=['ID', 'delta_logit_psi', 'Whole Blood_delta_psi'],
+        dtype='float32')
+    assert df_selected.columns.tolist() == [
+        'ID', 'delta_logit_psi', 'Whole Blood_delta_psi']
+    assert df_selected['delta_logit_psi'].dtype == 'float32'
+    assert_almost_equal(df_selected['Whole Blood_delta_psi'].values,
+                        df['Whole Blood_delta_psi'].values, decimal=5)
+
+    dl = SplicingVCFDataloader(
+        gtf_file, fasta_file, vcf_path, tissue_specific=True)
+    df_tissues = predict_all_table(model, dl, tissues=['Liver', 'Lung'])
+    assert df_tissues.shape[1] == 8 + 10 + 2
+    assert_almost_equal(df_tissues['Liver'].values, df['Liver'].values)
+
+    with pytest.raises(ValueError):
+        predict_all_table(model, dl, tissues=['Brain'])
+
+
+def test_predict_all_table_per_sample():
+    model = MMSplice()
+    dl = SplicingVCFDataloader(
+        gtf_file, fasta_file, multi_vcf, tissue_specific=True)
+    df = predict_all_table(model, dl, natural_scale=True,
+                           ref_psi_version='grch37')
+
+    dl = SplicingVCFDataloader(
+        gtf_file, fasta_file, multi_vcf, tissue_specific=True,
+        genotypes=True)
+    df_samples = predict_all_table(model, dl, natural_scale=True,
+                                   ref_psi_version='grch37', per_sample=True)
+    assert df_samples.columns.tolist()[:4] == [
+        'ID', 'exons', 'sample', 'genotype']
+    assert (df_samples['genotype'] > 0).all()
+    assert set(df_samples['sample']) <= set(dl.samples)
+
+    df_merged = df_samples.merge(df, on=['ID', 'exons'],
+                                 suffixes=('', '_variant'))
+    assert len(df_merged) == len(df_samples)
+    assert_almost_equal(
+        df_merged['Whole Blood_delta_psi'].values,
+        df_merged['Whole Blood_delta_psi_variant'].values
+        * df_merged['genotype'].values / 2)
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, multi_vcf)
+    with pytest.raises(ValueError):
+        predict_all_table(model, dl, per_sample=True)
+
+
 def test_predict_all_table_exon_dataloader(vcf_path):
     model = MMSplice()
     df_exons = pd.read_csv(exon_file)
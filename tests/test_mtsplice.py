@@ -1,4 +1,6 @@
-from mmsplice import MTSplice
+import numpy as np
+from mmsplice import MMSplice, MTSplice
+from mmsplice.utils import predict_deltaLogitPsi
 
 
 def test_mtsplice():
@@ -7,3 +9,26 @@ def test_mtsplice():
     model = MTSplice()
     pred = model.predict(seq, overhang)[0]
     assert pred.shape == (56,)
+
+
+def test_mtsplice_saturation_mutagenesis():
+    seq = 'ATGCGACGTACCCAGTAAAT'
+    overhang = (4, 4)
+    model = MTSplice()
+    pred = model.saturation_mutagenesis(seq, overhang, batch_size=16)
+    assert pred.shape == (len(seq), 4, 56)
+
+    ref = model.predict(seq, overhang)[0]
+    alt = model.predict(seq[:5] + 'T' + seq[6:], overhang)[0]
+    np.testing.assert_almost_equal(pred[5, 3], alt, decimal=5)
+    np.testing.assert_almost_equal(
+        pred[5, 'ACGT'.index(seq[5])], ref, decimal=5)
+
+    # tissue columns of `predict_all_table`
+    mmsplice = MMSplice()
+    delta_logit_psi = mmsplice.saturation_mutagenesis(seq, overhang)
+    X_ref = mmsplice.predict_on_seq(seq, overhang)
+    X_alt = mmsplice.predict_on_seq(seq[:5] + 'T' + seq[6:], overhang)
+    np.testing.assert_almost_equal(
+        pred[5, 3] + delta_logit_psi[5, 3],
+        alt + predict_deltaLogitPsi([X_ref], [X_alt])[0], decimal=5)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from tensorflow.keras.models import load_model
+from mmsplice import MMSplice
+from mmsplice.mtsplice import MTSPLICE, MTSPLICE_DEEP
+from mmsplice.exon_dataloader import SeqSpliter
+from mmsplice.layers import PositionalWeight1D, SplineWeight1D
+from mmsplice.optimize import optimize_model
+from mmsplice.quantization import read_calibration_exons, \
+    calibration_inputs, calibration_tissue_inputs
+
+
+def _layer_types(model):
+    return [layer.__class__.__name__ for layer in model.layers]
+
+
+def test_optimize_mmsplice():
+    model = MMSplice()
+    optimized = MMSplice(optimize=True)
+
+    for module in ['acceptorM', 'exonM', 'donorM']:
+        assert 'BatchNormalization' not in \
+            _layer_types(getattr(optimized, module))
+        assert 'Dropout' not in _layer_types(getattr(optimized, module))
+
+    df = read_calibration_exons().iloc[:32]
+    inputs = calibration_inputs(model.spliter, df)
+    np.testing.assert_allclose(
+        optimized.predict_modular_scores_on_batch(inputs),
+        model.predict_modular_scores_on_batch(inputs), atol=1e-4)
+
+
+@pytest.mark.parametrize('model_file', [MTSPLICE[0], MTSPLICE_DEEP[0]])
+def test_optimize_mtsplice_model(model_file):
+    model = load_model(model_file,
+                       custom_objects={'SplineWeight1D': SplineWeight1D})
+    optimized = optimize_model(model)
+
+    assert 'SplineWeight1D' not in _layer_types(optimized)
+    assert _layer_types(optimized).count('PositionalWeight1D') == 2
+    assert len(optimized.layers) < len(model.layers)
+
+    positional = optimized.get_layer('splinel')
+    assert isinstance(positional, PositionalWeight1D)
+    np.testing.assert_allclose(
+        positional.get_weights()[0],
+        model.get_layer('splinel').positional_effect()['positional_effect']
+        + 1, rtol=1e-5)
+
+    df = read_calibration_exons().iloc[:32]
+    inputs = calibration_tissue_inputs(SeqSpliter(), df)
+    inputs = [inputs['acceptor'], inputs['donor']]
+    np.testing.assert_allclose(optimized.predict(inputs),
+                               model.predict(inputs), atol=1e-4)
@@ -0,0 +1,54 @@
+import pickle
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_almost_equal
+from mmsplice import MMSplice, predict_all_table, predict_save
+from mmsplice.vcf_dataloader import SplicingVCFDataloader
+from mmsplice.parallel import model_spec, build_model
+from mmsplice.quantization import read_calibration_exons, calibration_inputs
+from conftest import gtf_file, fasta_file
+
+
+def test_model_spec():
+    model = MMSplice()
+    spec = pickle.loads(pickle.dumps(model_spec(model.exonM)))
+    exon_model = build_model(spec)
+
+    df = read_calibration_exons().iloc[:8]
+    inputs = calibration_inputs(model.spliter, df)['exon']
+    np.testing.assert_allclose(exon_model.predict(inputs),
+                               model.exonM.predict(inputs), atol=1e-6)
+
+
+def test_predict_parallel(vcf_path):
+    model = MMSplice()
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               tissue_specific=True)
+    df = predict_all_table(model, dl, batch_size=2, progress=False,
+                           pathogenicity=True)
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               tissue_specific=True)
+    dfs = list(model.predict_parallel(dl, workers=2, batch_size=2,
+                                      progress=False, pathogenicity=True))
+    assert len(dfs) > 1
+    df_parallel = pd.concat(dfs)
+
+    assert df_parallel['ID'].tolist() == df['ID'].tolist()
+    assert df_parallel.columns.tolist() == df.columns.tolist()
+    assert_almost_equal(df_parallel.select_dtypes('number').values,
+                        df.select_dtypes('number').values, decimal=5)
+
+
+def test_predict_save_workers(vcf_path, tmp_path):
+    model = MMSplice()
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    df = predict_all_table(model, dl, progress=False)
+
+    output = tmp_path / 'pred.csv'
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    predict_save(model, dl, output, batch_size=2, progress=False, workers=2)
+    df_saved = pd.read_csv(output)
+    assert_almost_equal(df_saved['delta_logit_psi'].values,
+                        df['delta_logit_psi'].values, decimal=5)
@@ -0,0 +1,64 @@
+import json
+import numpy as np
+from mmsplice.profiler import StageProfiler, NULL_PROFILER
+
+
+def test_StageProfiler(tmp_path):
+    profiler = StageProfiler(trace=tmp_path / 'trace.jsonl')
+
+    for batch in range(2):
+        for _ in range(3):
+            with profiler.stage('fasta'):
+                pass
+        with profiler.stage('inference/exon', 10):
+            pass
+        profiler.count('samples', 10)
+        profiler.end_batch()
+    profiler.close()
+
+    summary = profiler.summary()
+    assert summary['batches'] == 2
+    assert summary['stages']['fasta']['calls'] == 6
+    assert summary['stages']['fasta']['count'] == 6
+    assert summary['stages']['inference/exon']['count'] == 20
+    assert summary['counters'] == {'samples': 20}
+
+    with open(str(tmp_path / 'trace.jsonl')) as f:
+        events = [json.loads(line) for line in f]
+    assert [(e['batch'], e['stage']) for e in events] == [
+        (0, 'fasta'), (0, 'inference/exon'),
+        (1, 'fasta'), (1, 'inference/exon')]
+
+    profiler.write_chrome_trace(tmp_path / 'trace.json')
+    with open(str(tmp_path / 'trace.json')) as f:
+        trace = json.load(f)
+    assert len(trace['traceEvents']) == 4
+    assert trace['traceEvents'][0]['ph'] == 'X'
+
+
+def test_NullProfiler():
+    with NULL_PROFILER.stage('fasta'):
+        NULL_PROFILER.count('samples')
+    NULL_PROFILER.end_batch()
+
+
+def test_StageProfiler_memory():
+    profiler = StageProfiler(memory=True)
+
+    for batch in range(2):
+        with profiler.stage('dataframe'):
+            arr = np.ones((1000, 1000))
+        profiler.end_batch()
+    del arr
+
+    summary = profiler.summary()
+    assert summary['peak_rss'] > 0
+    assert len(summary['rss']) == 2
+    assert summary['stages']['dataframe']['bytes'] > 0
+
+    profiler = StageProfiler()
+    with profiler.stage('dataframe'):
+        pass
+    profiler.end_batch()
+    assert profiler.summary()['stages']['dataframe']['bytes'] == 0
+    assert profiler.summary()['rss'] == []
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from mmsplice import MMSplice, MTSplice
+from mmsplice.exon_dataloader import SeqSpliter, modules
+from mmsplice.utils import mmsplice_module_names
+from mmsplice.quantization import read_calibration_exons, \
+    calibration_inputs, calibration_tissue_inputs, quantization_report, \
+    calibration_exon_windows
+from conftest import gtf_file, fasta_file
+
+
+@pytest.fixture(scope='module')
+def quantized(tmp_path_factory):
+    cache_dir = tmp_path_factory.mktemp('cache')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('MMSPLICE_CACHE_DIR', str(cache_dir))
+        yield {
+            'cache_dir': cache_dir,
+            'mmsplice': MMSplice(quantized=True),
+            'mtsplice': MTSplice(quantized=True)
+        }
+
+
+def test_calibration_inputs():
+    df = read_calibration_exons().iloc[:4]
+    spliter = SeqSpliter()
+
+    inputs = calibration_inputs(spliter, df)
+    assert set(inputs) == set(modules)
+    assert all(len(v) == 4 for v in inputs.values())
+    # canonical AG acceptor of exons
+    np.testing.assert_array_equal(
+        inputs['acceptor'][:, 48:50].argmax(axis=2), [[0, 2]] * 4)
+
+    inputs = calibration_tissue_inputs(spliter, df)
+    assert inputs['acceptor'].shape == (4, 400, 4)
+    assert inputs['donor'].shape == (4, 400, 4)
+
+
+def test_calibration_exon_windows():
+    df = calibration_exon_windows(gtf_file, fasta_file, num_exons=16)
+    assert len(df) == 16
+    assert (df['left_overhang'] == 300).all()
+    assert (df['right_overhang'] == 300).all()
+
+    # most internal exons have canonical AG acceptor and GT donor
+    acceptor = df['seq'].str[298:300]
+    donor = df.apply(lambda row: row['seq'][-300:-298], axis=1)
+    assert (acceptor == 'AG').mean() > 0.8
+    assert (donor == 'GT').mean() > 0.8
+
+
+def test_quantized_models(quantized):
+    assert len(list((quantized['cache_dir'] / 'quantized')
+                    .glob('*.tflite'))) == 5 + 4
+
+    df = read_calibration_exons().iloc[:32]
+    model = MMSplice()
+    inputs = calibration_inputs(model.spliter, df)
+    np.testing.assert_allclose(
+        quantized['mmsplice'].predict_modular_scores_on_batch(inputs),
+        model.predict_modular_scores_on_batch(inputs), atol=0.5)
+
+    mtsplice = MTSplice()
+    inputs = calibration_tissue_inputs(mtsplice.spliter, df)
+    np.testing.assert_allclose(
+        quantized['mtsplice'].predict_on_batch(inputs),
+        mtsplice.predict_on_batch(inputs), atol=0.5)
+
+
+def test_quantization_report(quantized):
+    exons = calibration_exon_windows(gtf_file, fasta_file, num_exons=32)
+    df = quantization_report(mmsplice_int8=quantized['mmsplice'],
+                             mtsplice_int8=quantized['mtsplice'],
+                             num_variants=128, exons=exons)
+    assert {'delta_logit_psi', 'tissues', *mmsplice_module_names} \
+        <= set(df.index)
+    assert (df['pearson_r'] > 0.9).all()
+    assert (df['float32_seqs_per_sec'] > 0).all()
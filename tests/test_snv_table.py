@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_almost_equal
+from kipoiseq.dataclasses import Interval
+from mmsplice import MMSplice, predict_all_table
+from mmsplice.vcf_dataloader import SplicingVCFDataloader
+from mmsplice.snv_table import build_snv_table, read_snv_windows, \
+    iter_snv_batches, snv_keys, BASES
+from mmsplice.utils import mmsplice_alt_modules
+from conftest import gtf_file, fasta_file
+
+regions = [Interval('17', 41276032, 41276033)]
+
+
+def test_snv_keys():
+    keys = snv_keys([100, 100, 100, 101], [0, 3, 0, 0], [5, 5, 6, 0])
+    assert keys.dtype == np.uint64
+    assert np.all(np.diff(keys.astype('float64')) > 0)
+    assert int(keys[0]) == (100 << 34) | 5
+
+
+def test_iter_snv_batches():
+    df = read_snv_windows(gtf_file, regions=regions)
+    exons = {k: df[k].values for k in df.columns}
+    exons['row'] = np.arange(len(df))
+    lengths = (df['End'] - df['Start']).values
+
+    batches = list(iter_snv_batches(exons, fasta_file, batch_size=100))
+    assert all(len(b['metadata']['row']) == 100 for b in batches[:-1])
+
+    alt = np.concatenate([b['metadata']['alt'] for b in batches])
+    assert (alt < 0).sum() == len(df)
+    assert (alt >= 0).sum() <= 3 * lengths.sum()
+
+
+def test_build_snv_table_lookup(vcf_path, tmp_path):
+    table = build_snv_table(gtf_file, fasta_file, tmp_path, regions=regions,
+                            batch_size=256)
+    assert table.overhang == (100, 100)
+    assert sum(table.metadata['chroms'].values()) > 0
+
+    model = MMSplice()
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               regions=regions)
+    df = predict_all_table(model, dl, pathogenicity=True)
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               regions=regions, lookup=tmp_path)
+    df_lookup = predict_all_table(model, dl, pathogenicity=True)
+
+    assert df_lookup['ID'].tolist() == df['ID'].tolist()
+    assert_almost_equal(df_lookup['delta_logit_psi'].values,
+                        df['delta_logit_psi'].values, decimal=5)
+    assert_almost_equal(df_lookup[mmsplice_alt_modules].values,
+                        df[mmsplice_alt_modules].values, decimal=5)
+
+    with pytest.raises(ValueError):
+        SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                              lookup=tmp_path, tissue_specific=True)
+    with pytest.raises(ValueError):
+        SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                              lookup=tmp_path, overhang=(50, 50))
+
+    df_exons = read_snv_windows(gtf_file, regions=regions)
+    exon = df_exons.iloc[0]
+    overhang = (exon['left_overhang'], exon['right_overhang'])
+    pos = int(exon['Start']) + 150
+    ref = dl.fasta.extract(Interval('17', pos - 1, pos)).upper()
+    alt = next(b for b in BASES if b != ref)
+    assert table.scores('17', exon['Start'], exon['End'], exon['Strand'],
+                        overhang, pos, alt).shape == (2, 5)
+    assert table.scores('17', exon['Start'], exon['End'], exon['Strand'],
+                        overhang, pos, ref) is None
@@ -1,8 +1,12 @@
 import numpy as np
+import pandas as pd
 import pyranges
 from kipoiseq.dataclasses import Interval, Variant
 from mmsplice.utils import pyrange_remove_chr_from_chrom_annotation, \
-    left_normalized, get_var_side, encodeDNA
+    left_normalized, get_var_side, encodeDNA, RefPSIStore, \
+    read_ref_psi_annotation, encode_index_batch, onehot_index, \
+    region_annotate, region_annotate_batch, delta_logit_PSI_to_delta_PSI, \
+    genotype_delta_psi, mutagenesis_batches, encode_index, N_INDEX
 
 
 def test_pyrange_remove_chr_to_chrom_annotation():
@@ -21,6 +25,17 @@ def test_Variant_left_normalized():
     assert v.start == 11
 
 
+def test_region_annotate_batch():
+    pos = np.arange(60, 160)
+    for strand in ['+', '-']:
+        exon = Interval('chr1', 100, 120, strand=strand)
+        expected = [region_annotate(Variant('chr1', int(p), 'A', 'G'), exon)
+                    for p in pos]
+        regions = region_annotate_batch(
+            pos, [100] * len(pos), [120] * len(pos), [strand] * len(pos))
+        assert regions.tolist() == expected
+
+
 def test_get_var_side():
     exon = Interval('chr1', 11, 20, strand='+')
     variant = Variant('chr1', 10, 'A', 'AGG')
@@ -81,3 +96,95 @@ def test_encodeDNA():
                    [0., 0., 1., 0.],
                    [0., 0., 1., 0.]]])
     )
+
+
+def test_onehot_index():
+    seq_vec = ['AA', 'ATT', 'ATTCGGN', '']
+    index, lengths = encode_index_batch(seq_vec)
+    np.testing.assert_array_equal(lengths, [2, 3, 7, 0])
+    np.testing.assert_array_equal(onehot_index(index), encodeDNA(seq_vec))
+
+    buffer = np.empty(1000, dtype='float32')
+    arr = onehot_index(index, out=buffer)
+    assert arr.flags['C_CONTIGUOUS']
+    assert np.shares_memory(arr, buffer)
+    np.testing.assert_array_equal(arr, encodeDNA(seq_vec))
+
+
+def test_mutagenesis_batches():
+    seq = 'ACGNT'
+    batches = list(mutagenesis_batches(
+        encode_index(seq), (1, 1), batch_size=4, deletions=True))
+    rows, lengths, overhangs, pos, alt = (
+        np.concatenate(i) for i in zip(*batches))
+    assert len(pos) == 3 * 4 + 5
+
+    decoded = [''.join('ACGTN'[j] for j in r[:n])
+               for r, n in zip(rows, lengths)]
+    assert decoded[0] == 'CCGNT'
+    deletion = alt == N_INDEX
+    assert decoded[np.where(deletion)[0][0]] == 'CGNT'
+    np.testing.assert_array_equal(overhangs[deletion],
+                                  [[0, 1], [1, 1], [1, 1], [1, 1], [1, 0]])
+    assert 3 not in pos[~deletion]
+
+
+def test_RefPSIStore_gather():
+    df_ref = pd.DataFrame({
+        'Chromosome': ['chr1', 'chr1', 'chr2', 'chr1'],
+        'Start': [10, 10, 5, 10],
+        'End': [20, 30, 8, 20],
+        'Strand': ['+', '+', '-', '-'],
+        'gene_id': 'gene',
+        'gene_name': 'gene',
+        'Liver': [0.1, 0.2, 0.3, 0.4],
+        'Lung': [0.5, 0.6, 0.7, 0.8]
+    })
+    store = RefPSIStore.from_dataframe(df_ref)
+    assert store.tissues == ['Liver', 'Lung']
+    assert store.psi.dtype == np.float32
+
+    psi = store.gather(
+        np.array(['1', 'chr1', '2', '1', 'X', '2']),
+        np.array([10, 10, 5, 10, 10, 5]),
+        np.array([20, 30, 8, 20, 20, 8]),
+        np.array(['+', '+', '-', '-', '+', '+']))
+    np.testing.assert_almost_equal(psi[:4], [[0.1, 0.5], [0.2, 0.6],
+                                             [0.3, 0.7], [0.4, 0.8]])
+    assert np.isnan(psi[4:]).all()
+
+    psi = store.gather(['1', 'X'], [10, 10], [30, 20], ['+', '+'],
+                       tissues=['Lung'])
+    np.testing.assert_almost_equal(psi[:1], [[0.6]])
+    assert psi.shape == (2, 1) and np.isnan(psi[1]).all()
+
+
+def test_RefPSIStore_load(tmp_path):
+    store = RefPSIStore.load('grch37', cache_dir=tmp_path)
+    store_cached = RefPSIStore.load('grch37', cache_dir=tmp_path)
+    np.testing.assert_array_equal(store.psi, store_cached.psi)
+
+    df_ref = read_ref_psi_annotation('grch37', ['chr17'])
+    row = df_ref.iloc[0]
+    psi = store.gather([row['Chromosome']], [row['Start']],
+                       [row['End']], [row['Strand']])
+    np.testing.assert_almost_equal(
+        psi[0], row[store.tissues].values.astype('float32'))
+
+
+def test_genotype_delta_psi():
+    ref_psi = np.array([[0.2, 0.9], [0.5, 0.5]])
+    delta_logit_psi = np.array([[1., -2.], [0.5, 3.]])
+    delta_psi = delta_logit_PSI_to_delta_PSI(delta_logit_psi, ref_psi)
+    genotype = np.array([[0, 1, 2, -1], [1, 0, 0, 0]], dtype='int8')
+
+    variant_index, sample_index, carrier_delta_psi = genotype_delta_psi(
+        delta_psi, genotype)
+    np.testing.assert_array_equal(variant_index, [0, 0, 1])
+    np.testing.assert_array_equal(sample_index, [1, 2, 0])
+
+    gt = genotype[variant_index, sample_index]
+    expected = delta_logit_PSI_to_delta_PSI(
+        delta_logit_psi[variant_index], ref_psi[variant_index],
+        genotype=gt[:, None])
+    np.testing.assert_almost_equal(carrier_delta_psi, expected)
@@ -1,8 +1,13 @@
 import numpy as np
+import pandas as pd
+import pytest
 from kipoiseq.dataclasses import Interval, Variant
-from mmsplice.vcf_dataloader import SplicingVCFDataloader
-from mmsplice.exon_dataloader import SeqSpliter
-from conftest import gtf_file, fasta_file, variants, vcf_file
+from mmsplice import vcf_dataloader
+from mmsplice.vcf_dataloader import SplicingVCFDataloader, \
+    read_exons_cached, exon_index, read_exon_table
+from mmsplice.exon_dataloader import SeqSpliter, modules
+from mmsplice.utils import encode_index_batch, encodeDNA
+from conftest import gtf_file, fasta_file, variants, vcf_file, multi_vcf
 
 
 def test_SplicingVCFDataloader__check_chrom_annotation():
@@ -42,6 +47,152 @@ def test_SplicingVCFDataloader__read_exons(vcf_path):
     assert row['right_overhang'] == 20
 
 
+def test_exon_index():
+    df = pd.DataFrame({
+        'Chromosome': ['1', '1', '2'],
+        'Start': [10, 20, 5],
+        'End': [15, 40, 8]
+    })
+    index = exon_index(df)
+    np.testing.assert_array_equal(index['chroms'], ['1', '2'])
+    np.testing.assert_array_equal(index['offsets'], [0, 2])
+    np.testing.assert_array_equal(index['counts'], [2, 1])
+    np.testing.assert_array_equal(index['max_len'], [20, 3])
+
+
+def test_read_exons_cached(tmp_path):
+    df, index = read_exons_cached(gtf_file, (10, 20), cache_dir=tmp_path)
+    assert len(list(tmp_path.glob('exons-*.feather'))) == 1
+    assert len(list(tmp_path.glob('exons-*.npz'))) == 1
+
+    df_cached, index_cached = read_exons_cached(
+        gtf_file, (10, 20), cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(df, df_cached, check_categorical=False)
+    np.testing.assert_array_equal(index['offsets'], index_cached['offsets'])
+
+    read_exons_cached(gtf_file, (100, 100), cache_dir=tmp_path)
+    assert len(list(tmp_path.glob('exons-*.feather'))) == 2
+
+
+def test_SplicingVCFDataloader_annotation_cache(vcf_path, tmp_path):
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               cache_dir=tmp_path)
+    dl_cached = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                                      cache_dir=tmp_path)
+    assert dl_cached._cached_exons is not None
+    # pyranges of cached exons is only built on use
+    assert isinstance(dl_cached._exons, pd.DataFrame)
+
+    def _pairs(dl):
+        return sorted((r['metadata']['variant']['annotation'],
+                       r['metadata']['exon']['annotation']) for r in dl)
+
+    assert _pairs(dl) == _pairs(dl_cached)
+    assert len(dl_cached.pr_exons) == len(dl_cached._cached_exons[0])
+
+
+def test_read_exons_cached_prebuild_overhang(tmp_path, monkeypatch,
+                                             caplog):
+    df = read_exon_table(gtf_file)
+    df['Start'] += 1
+    df.to_csv(tmp_path / 'grch37_exons.csv', index=False)
+    monkeypatch.setitem(vcf_dataloader.prebuild_annotation, 'grch37',
+                        str(tmp_path / 'grch37_exons.csv'))
+
+    for _ in range(2):
+        caplog.clear()
+        read_exons_cached('grch37', (10, 10), cache_dir=tmp_path)
+        assert 'Overhang argument will be ignored' in caplog.text
+    assert len(list(tmp_path.glob('exons-*.feather'))) == 1
+
+
+def test_SplicingVCFDataloader_regions(vcf_path):
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    rows = list(dl)
+
+    exon = rows[0]['metadata']['exon']
+    regions = [Interval(exon['chrom'], exon['start'], exon['end'])]
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               regions=regions)
+    rows_regions = list(dl)
+
+    assert 0 < len(rows_regions) <= len(rows)
+    ids = {r['metadata']['variant']['annotation'] for r in rows}
+    assert all(r['metadata']['variant']['annotation'] in ids
+               for r in rows_regions)
+
+
+def test_SplicingVCFDataloader_prefilter(vcf_path):
+    spliter = SeqSpliter(exon_cut_l=30, exon_cut_r=30)
+    rows = list(SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                                      seq_spliter=spliter))
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               seq_spliter=spliter, prefilter=True)
+    rows_filtered = list(dl)
+    assert len(rows_filtered) == len(rows) - sum(dl.prefiltered.values())
+
+    pairs = {(r['metadata']['variant']['annotation'],
+              r['metadata']['exon']['annotation']) for r in rows_filtered}
+    for r in rows:
+        key = (r['metadata']['variant']['annotation'],
+               r['metadata']['exon']['annotation'])
+        if key not in pairs:
+            for module in modules:
+                np.testing.assert_array_equal(
+                    r['inputs']['seq'][module], r['inputs']['mut_seq'][module])
+
+
+def test_SplicingVCFDataloader_genotypes():
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, multi_vcf,
+                               genotypes=True)
+    assert dl.samples == ['NA00001', 'NA00002', 'NA00003']
+    batch = next(dl.batch_iter(batch_size=100))
+    genotype = batch['metadata']['variant']['genotype']
+    assert genotype.dtype == np.int8
+    assert genotype.shape == (len(batch['metadata']['variant']['annotation']),
+                              3)
+    assert set(np.unique(genotype)) <= {-1, 0, 1, 2}
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, multi_vcf,
+                               genotypes=True, samples=['NA00003', 'NA00001'])
+    batch = next(dl.batch_iter(batch_size=100))
+    np.testing.assert_array_equal(batch['metadata']['variant']['genotype'],
+                                  genotype[:, [2, 0]])
+
+    with pytest.raises(ValueError):
+        SplicingVCFDataloader(gtf_file, fasta_file, multi_vcf,
+                              genotypes=True, samples=['NA00004'])
+
+
+def test_SplicingVCFDataloader_batch_iter_encoded(vcf_path):
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               tissue_specific=True)
+    batches = list(dl.batch_iter(batch_size=4))
+
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
+                               tissue_specific=True)
+    rows = list(dl)
+    assert sum(len(b['metadata']['variant']['annotation'])
+               for b in batches) == len(rows)
+
+    for key in ['seq', 'mut_seq', 'tissue_seq']:
+        for module, arr in batches[0]['inputs'][key].items():
+            for i, row in enumerate(rows[:4]):
+                expected = row['inputs'][key][module][0]
+                np.testing.assert_array_equal(
+                    arr[i, :len(expected)], expected)
+                assert arr[i, len(expected):].sum() == 0
+
+
+def test_SplicingVCFDataloader_batch_iter_reuse_buffers(vcf_path):
+    dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path)
+    batches = dl.batch_iter(batch_size=2, reuse_buffers=True)
+    first = next(batches)['inputs']['seq']['acceptor']
+    second = next(batches)['inputs']['seq']['acceptor']
+    assert np.shares_memory(first, second)
+
+
 def test_benchmark_SplicingVCFDataloader(benchmark, vcf_path):
     benchmark(SplicingVCFDataloader, gtf_file, fasta_file, vcf_path)
 
@@ -90,6 +241,64 @@ def test_SepSpliter_split_tissue_seq():
     assert d['donor'] == 'AAA' + 'NNNNNNNNN'
 
 
+def test_SeqSpliter_split_batch():
+    spliter = SeqSpliter()
+    seqs = ['ATCATCATC' * 7 + 'GGGAAA' + 'CGTGCTCGT' * 3,
+            'CATCATC' + 'GGGAAA' + 'CGTGCTC',
+            'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAG' + 'GT']
+    overhangs = np.array([(63, 27), (7, 7), (50, 2)])
+    index, lengths = encode_index_batch(seqs)
+
+    batch = spliter.split_batch(index, lengths, overhangs)
+    for module, arr in batch.items():
+        expected = encodeDNA([spliter.split(seq, overhang)[module]
+                              for seq, overhang in zip(seqs, overhangs)])
+        np.testing.assert_array_equal(arr, expected)
+
+    batch = spliter.split_batch(index, lengths, overhangs,
+                                mask_module=['donor', 'donor_intron'])
+    assert batch['donor'].sum() == 0
+    assert batch['donor_intron'].sum() == 0
+    assert batch['donor'].shape[1] == 18
+
+
+def test_SeqSpliter_module_windows():
+    spliter = SeqSpliter(exon_cut_l=10)
+    seq = 'ATCATCATC' * 7 + 'GGGAAACGTA' * 3 + 'CGTGCTCGT' * 3
+    overhang = (63, 27)
+    windows = spliter.module_windows([len(seq)], [overhang])
+    ref = spliter.split(seq, overhang)
+
+    for i in range(len(seq)):
+        mut_seq = seq[:i] + ('A' if seq[i] != 'A' else 'C') + seq[i + 1:]
+        alt = spliter.split(mut_seq, overhang)
+        seen = {k for k in modules if ref[k] != alt[k]}
+        assert seen == {k for k, (start, end) in windows.items()
+                        if start[0] <= i < end[0]}
+
+    windows = spliter.module_windows([len(seq)], [overhang],
+                                     mask_module=['donor', 'donor_intron'])
+    assert set(windows) == {'acceptor_intron', 'acceptor', 'exon'}
+
+
+def test_SeqSpliter_split_tissue_batch():
+    spliter = SeqSpliter(tissue_acceptor_intron=9, tissue_acceptor_exon=3,
+                         tissue_donor_intron=9, tissue_donor_exon=3)
+    seqs = ['ATCATCATC' + 'GGGAAA' + 'CGTGCTCGT',
+            'CATCATC' + 'GGGAAA' + 'CGTGCTC',
+            'ggATCATCATC' + 'GGGAAA' + 'CGTGCTCGTtt',
+            'GGGAAA']
+    overhangs = np.array([(9, 9), (7, 7), (11, 11), (0, 0)])
+    index, lengths = encode_index_batch(seqs)
+
+    batch = spliter.split_tissue_batch(index, lengths, overhangs)
+    for module, arr in batch.items():
+        expected = encodeDNA([
+            spliter.split_tissue_seq(seq, overhang)[module]
+            for seq, overhang in zip(seqs, overhangs)])
+        np.testing.assert_array_equal(arr, expected)
+
+
 def test_SplicingVCFDataloader__next__(vcf_path):
     dl = SplicingVCFDataloader(gtf_file, fasta_file, vcf_path,
                                split_seq=False, encode=False,
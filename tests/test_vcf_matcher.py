@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from kipoiseq.extractors import SingleVariantMatcher
+from mmsplice.vcf_matcher import ExonIntervalIndex, ExonVariantMatcher, \
+    merge_intervals, read_regions
+from mmsplice.vcf_dataloader import read_exon_pyranges, exon_index
+from conftest import gtf_file
+
+
+def test_ExonIntervalIndex_query():
+    index = ExonIntervalIndex(
+        chrom=['1', '1', '1', '2'],
+        start=[100, 10, 50, 10],
+        end=[200, 60, 55, 20])
+
+    query_index, exon_index = index.query(
+        chrom=['1', '1', '2', '3', '1'],
+        start=[55, 0, 19, 10, 199],
+        end=[56, 10, 20, 11, 250])
+
+    np.testing.assert_array_equal(query_index, [0, 2, 4])
+    np.testing.assert_array_equal(exon_index, [1, 3, 0])
+
+
+def test_ExonIntervalIndex_sorted_index():
+    df = pd.DataFrame({
+        'Chromosome': ['1', '1', '1', '2'],
+        'Start': [10, 50, 100, 10],
+        'End': [60, 55, 200, 20]
+    })
+    index = ExonIntervalIndex(df['Chromosome'], df['Start'], df['End'],
+                              index=exon_index(df))
+    expected = ExonIntervalIndex(df['Chromosome'], df['Start'], df['End'])
+
+    query = dict(chrom=['1', '1', '2', '3', '1'],
+                 start=[55, 0, 19, 10, 199],
+                 end=[56, 10, 20, 11, 250])
+    for actual, desired in zip(index.query(**query),
+                               expected.query(**query)):
+        np.testing.assert_array_equal(actual, desired)
+
+
+def test_ExonVariantMatcher(vcf_path):
+    pr_exons = read_exon_pyranges(gtf_file)
+    attrs = ('exon_id', 'left_overhang', 'right_overhang')
+
+    matcher = ExonVariantMatcher(vcf_path, pr_exons, interval_attrs=attrs)
+    pairs = {(str(exon), exon.attrs['exon_id'], str(variant))
+             for exon, variant in matcher}
+
+    expected = {
+        (str(exon), exon.attrs['exon_id'], str(variant))
+        for exon, variant in SingleVariantMatcher(
+            vcf_path, pranges=pr_exons, interval_attrs=attrs)
+    }
+    assert pairs == expected
+
+
+def test_merge_intervals():
+    merged = merge_intervals(
+        chrom=['1', '2', '1', '1', '1'],
+        start=[100, 5, 10, 50, 300],
+        end=[200, 10, 60, 55, 400])
+    assert merged == [('1', 10, 60), ('1', 100, 200),
+                      ('1', 300, 400), ('2', 5, 10)]
+
+
+def test_read_regions(tmp_path):
+    bed = tmp_path / 'regions.bed'
+    bed.write_text('track name=test\n17\t100\t200\tname\n17\t300\t400\n')
+    df = read_regions(str(bed))
+    assert df.values.tolist() == [['17', 100, 200], ['17', 300, 400]]
+
+
+def test_ExonVariantMatcher_regions(vcf_path):
+    pr_exons = read_exon_pyranges(gtf_file)
+    df = pr_exons.df
+    regions = merge_intervals(df['Chromosome'], df['Start'], df['End'])
+
+    pairs = {(str(exon), str(variant))
+             for exon, variant in ExonVariantMatcher(vcf_path, pr_exons)}
+    pairs_regions = {
+        (str(exon), str(variant))
+        for exon, variant in ExonVariantMatcher(
+            vcf_path, pr_exons, regions=regions)
+    }
+    assert pairs == pairs_regions